@@ -41,6 +41,10 @@ app.conf.update(
             'task': 'crawler.tasks.cleanup_failed_sessions',
             'schedule': 3600.0,  # cada hora
         },
+        'cleanup-superseded-exports': {
+            'task': 'crawler.tasks.cleanup_superseded_exports',
+            'schedule': 3600.0,  # cada hora
+        },
         'update-session-stats': {
             'task': 'crawler.tasks.update_session_statistics',
             'schedule': 300.0,   # cada 5 minutos
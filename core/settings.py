@@ -212,6 +212,20 @@ CHANNEL_LAYERS = {
 
 
 
+# Caché compartida entre procesos web y workers de Celery (snapshots de progreso de sesiones)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'crawler': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CRAWLER_CACHE_URL', default='redis://localhost:6379/1'),
+        'OPTIONS': {
+            'socket_connect_timeout': 1,
+            'socket_timeout': 1,
+        },
+    },
+}
 
 # Celery Configuration
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
@@ -222,6 +236,14 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_ENABLE_UTC = True
 
+# Las extracciones de metadatos (CPU) van a una cola propia para no frenar las descargas (I/O).
+# Requiere un worker que consuma esa cola (ver Procfile), o -Q celery,extraction en un solo worker.
+# CRAWLER_EXTRACTION_QUEUE= (vacío) las deja en la cola por defecto
+CRAWLER_EXTRACTION_QUEUE = config('CRAWLER_EXTRACTION_QUEUE', default='extraction')
+CELERY_TASK_ROUTES = {
+    'crawler.tasks.extract_file_metadata': {'queue': CRAWLER_EXTRACTION_QUEUE},
+} if CRAWLER_EXTRACTION_QUEUE else {}
+
 
 # Crawler Configuration
 CRAWLER_SETTINGS = {
@@ -238,17 +260,74 @@ CRAWLER_SETTINGS = {
         'tiff', 'mp3', 'mp4', 'xml', 'json'
     ],
     'RESPECT_ROBOTS_TXT': True,
+    'ROBOTS_CACHE_TTL': 86400,  # Segundos antes de revalidar un robots.txt (ETag / Last-Modified)
+    'ROBOTS_ERROR_TTL': 600,  # Reintento tras un error 5xx o de red (mientras tanto se bloquea el host si no hay reglas previas)
+    'ROBOTS_FETCH_TIMEOUT': 10,
+    'ROBOTS_LOCAL_TTL': 60,  # Segundos que cada worker reutiliza el matcher compilado sin consultar la base de datos
+
+    # Ritmo adaptativo por host (AIMD, compartido vía Redis): rate_limit de la sesión es el máximo por host
+    'POLITENESS_BURST': 1,  # Requests seguidos sin espera por host (1 = espaciado estricto)
+    'POLITENESS_MIN_RATE': 0.05,  # requests per second mínimos tras reducir el ritmo
+    'POLITENESS_INCREASE': 0.05,  # requests per second que se suman con cada respuesta sana
+    'POLITENESS_DECREASE': 0.5,  # Factor aplicado ante 429/503, timeouts o picos de latencia
+    'POLITENESS_LATENCY_FACTOR': 3.0,  # Latencia sobre N veces el promedio del host = pico
+    'POLITENESS_MAX_RETRY_AFTER': 3600,  # Segundos máximos que se respeta un Retry-After
+    'POLITENESS_MAX_DISPATCH_DELAY': 60,  # ETA máximo de una tarea process_single_url; más espera vuelve a la frontera
+    'POLITENESS_UNLIMITED_RATE': 100.0,  # Máximo por host cuando la sesión no tiene rate limit
+
+    # Siembra desde sitemaps (robots.txt o /sitemap.xml, incluye índices y .gz)
+    'SITEMAP_SEEDING': True,
+    'SITEMAP_SEEDING_TIMEOUT': 600,  # Segundos máximos que la siembra posterga el fin de la sesión (task_time_limit)
+    'SITEMAP_MAX_URLS': 100000,  # URLs máximas tomadas de los sitemaps por sesión
+    'SITEMAP_MAX_FILES': 100,  # Sitemaps máximos leídos (incluye los de cada índice)
+    'SITEMAP_FRESH_DAYS': 30,  # lastmod más reciente: prioridad adelantada un nivel
+    'SITEMAP_STALE_DAYS': 365,  # lastmod más antiguo: prioridad postergada un nivel
     'FOLLOW_REDIRECTS': True,
     'EXTRACT_METADATA': True,
+
+    # Motor de descarga: 'async' (aiohttp, un event loop por worker) o 'celery' (una tarea por URL)
+    'FETCH_ENGINE': config('CRAWLER_FETCH_ENGINE', default='async'),
+    'ASYNC_CONCURRENCY': 200,  # Requests simultáneos por sesión en el motor asíncrono
+    'ASYNC_SLICE_SECONDS': 240,  # Duración de cada ciclo del motor (menor que task_soft_time_limit)
+    'CLAIM_STALE_SECONDS': 900,  # URLs en 'processing' desde hace más tiempo se dan por abandonadas (> task_time_limit)
+
+    # Pool de conexiones persistentes (keep-alive) por sesión de crawling
+    'HTTP_POOL_SIZE': 20,  # Conexiones por host en cada requests.Session
+    'HTTP_POOL_MAX_SESSIONS': 8,  # Sesiones de crawling con pool abierto por proceso worker
+    'HTTP_KEEPALIVE_TIMEOUT': 30,  # Segundos que una conexión ociosa se mantiene abierta
+
+    # Frontera de URLs: 'redis' (sorted set por sesión en el Redis de Celery) o 'db' (URLQueue)
+    'FRONTIER_BACKEND': config('CRAWLER_FRONTIER_BACKEND', default='redis'),
+    'FRONTIER_WAIT_SECONDS': 5,  # Espera bloqueante por URLs nuevas cuando la frontera está vacía
+    'DISPATCH_BATCH_SIZE': 50,  # URLs despachadas por ejecución de process_url_queue
+
+    'SNAPSHOT_TTL': 2,  # Segundos que se cachea el progreso de una sesión (dashboards, API)
+    'PROGRESS_UPDATES_PER_SECOND': 2,  # Máximo de notificaciones de progreso por sesión (WebSocket)
+
+    # Exportaciones en segundo plano
+    'EXPORT_COMPRESSION': config('CRAWLER_EXPORT_COMPRESSION', default='gzip'),  # 'gzip', 'zstd' (requiere zstandard) o '' (sin comprimir)
+    'EXPORT_SOFT_TIME_LIMIT': 3300,  # Segundos máximos por exportación (sesiones grandes)
+    'EXPORT_TIME_LIMIT': 3600,
+    'EXPORT_QUEUE_TIMEOUT': 6 * 3600,  # Una exportación pendiente más tiempo se da por perdida (sin worker)
+    'EXPORT_DOWNLOAD_GRACE': 3600,  # Segundos que se conserva una exportación reemplazada desde su última descarga
+
+    # Búsqueda de texto completo (FTS5 en SQLite, tsvector + GIN en PostgreSQL)
+    'SEARCH_INDEX_ENABLED': True,
+    'SEARCH_TEXT_CONFIG': 'spanish',  # Configuración de texto de PostgreSQL (stemming)
+    'SEARCH_INDEX_MAX_CHARS': 1000000,  # Caracteres del contenido que se indexan por resultado
 }
 
 # Configuración para extracción de contenido completo
 CONTENT_EXTRACTION_SETTINGS = {
     'MAX_FILE_SIZE_MB': 50,  # Máximo 50MB para extracción
     'MAX_CONTENT_CHARS': 1000000,  # Máximo 1M caracteres almacenados
+    'CONTENT_COMPRESSION': 'zlib',  # Compresión del contenido almacenado: 'zlib' o 'zstd' (requiere zstandard)
     'MAX_PDF_PAGES': 500,  # Máximo 500 páginas PDF
     'ENABLE_DOC_EXTRACTION': True,  # Habilitar DOC legacy
     'EXTRACTION_TIMEOUT': 60,  # Timeout en segundos por archivo
+    # Memoria adicional máxima por archivo (0 = sin límite). RLIMIT_AS y la alarma del timeout son
+    # del proceso: el worker de extracción debe usar --pool=prefork con una extracción por proceso
+    'EXTRACTION_MAX_MEMORY_MB': 1024,
     'SUPPORTED_FORMATS': ['pdf', 'docx', 'doc', 'odt', 'xlsx', 'xls'],  # Formatos soportados para contenido completo
     
     # Configuración específica para Excel
@@ -257,6 +336,16 @@ CONTENT_EXTRACTION_SETTINGS = {
     'EXCEL_MAX_ROWS': 100,              # Máximo 100 filas por hoja
     'EXCEL_MAX_COLS': 50,               # Máximo 50 columnas por hoja
     'DETECT_SENSITIVE_DATA': True,      # Activar detección de datos sensibles
+    'MAX_SENSITIVE_FINDINGS': 100,      # Hallazgos guardados por archivo en metadata['sensitive_data']
+
+    # Caché de extracción por hash: archivos idénticos se procesan una sola vez
+    'CACHE_ENABLED': True,
+    'CACHE_MAX_ENTRIES': 5000,          # Se eliminan las entradas usadas hace más tiempo (LRU)
+    'CACHE_EVICT_EVERY': 100,           # Revisar CACHE_MAX_ENTRIES cada N entradas nuevas
+
+    # Límites de la tarea de extracción (se ejecuta en CRAWLER_EXTRACTION_QUEUE); superarlos registra el error en el resultado
+    'TASK_SOFT_TIME_LIMIT': 180,
+    'TASK_TIME_LIMIT': 240,
 }
 
 # Logging configuration
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import CrawlSession, URLQueue, CrawlResult, CrawlLog
+from .models import CrawlSession, URLQueue, CrawlResult, CrawlLog, ExtractionCache, ExportJob, RobotsTxt
+from .snapshot import get_session_snapshot
 
 
 @admin.register(CrawlSession)
@@ -85,7 +86,8 @@ class CrawlSessionAdmin(admin.ModelAdmin):
     # progress_display.short_description = 'Progreso'
 
     def progress_display(self, obj):
-        percentage = obj.progress_percentage
+        # Sesiones activas: mismo snapshot cacheado que usan los dashboards
+        percentage = get_session_snapshot(obj)['progress_percentage'] if obj.is_active else obj.progress_percentage
         if percentage > 0:
             if percentage < 30:
                 color = 'danger'
@@ -254,6 +256,37 @@ class CrawlLogAdmin(admin.ModelAdmin):
     ordering = ['-created_at']
 
 
+@admin.register(ExtractionCache)
+class ExtractionCacheAdmin(admin.ModelAdmin):
+    list_display = ['file_hash', 'file_extension', 'content_length', 'hits', 'last_used_at']
+    list_filter = ['file_extension']
+    search_fields = ['file_hash']
+    readonly_fields = ['created_at', 'last_used_at']
+    ordering = ['-last_used_at']
+
+
+@admin.register(RobotsTxt)
+class RobotsTxtAdmin(admin.ModelAdmin):
+    list_display = ['origin', 'status', 'http_status', 'fetched_at', 'expires_at']
+    list_filter = ['status']
+    search_fields = ['origin']
+    readonly_fields = ['fetched_at']
+    ordering = ['origin']
+
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['session', 'export_format', 'status', 'progress', 'file_size', 'compression', 'created_at']
+    list_filter = ['export_format', 'status', 'compression']
+    search_fields = ['session__name', 'file_name']
+    readonly_fields = ['fingerprint', 'created_at', 'started_at', 'completed_at']
+    raw_id_fields = ['session', 'user']
+    ordering = ['-created_at']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('session')
+
 # Personalización del admin site
 admin.site.site_header = "FISGÓN - Administración del Sistema Crawler"
 admin.site.site_title = "FISGÓN Admin"
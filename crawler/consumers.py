@@ -28,4 +28,53 @@ class CrawlerConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'type': 'update',
             'message': event['message']
-        }))
\ No newline at end of file
+        }))
+
+class SessionProgressConsumer(AsyncWebsocketConsumer):
+    '''
+    Progreso en vivo de una sesión: al conectarse envía el estado actual y
+    luego reenvía las notificaciones que publican las tareas del crawler
+    '''
+
+    async def connect(self):
+        self.session_id = int(self.scope['url_route']['kwargs']['session_id'])
+        user = self.scope.get('user')
+
+        if not user or not user.is_authenticated or not await self.can_view_session(user):
+            await self.close()
+            return
+
+        from .progress import session_group_name
+        self.group_name = session_group_name(self.session_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        snapshot = await self.get_snapshot()
+        if snapshot:
+            await self.send_snapshot(snapshot)
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def session_progress(self, event):
+        await self.send_snapshot(event['snapshot'])
+
+    async def send_snapshot(self, snapshot):
+        await self.send(text_data=json.dumps({
+            'type': 'progress',
+            'data': snapshot
+        }))
+
+    @database_sync_to_async
+    def can_view_session(self, user):
+        # Mismos permisos que las vistas de la sesión
+        if user.groups.filter(name='admin').exists():
+            return CrawlSession.objects.filter(id=self.session_id).exists()
+        return CrawlSession.objects.filter(id=self.session_id, user=user).exists()
+
+    @database_sync_to_async
+    def get_snapshot(self):
+        from .snapshot import get_session_snapshot
+        session = CrawlSession.objects.filter(id=self.session_id).first()
+        return get_session_snapshot(session) if session else None
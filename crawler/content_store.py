@@ -0,0 +1,89 @@
+# crawler/content_store.py
+import logging
+import zlib
+from typing import Dict, Iterable, Tuple
+
+from django.conf import settings
+
+from .models import CrawlResultContent
+
+logger = logging.getLogger('crawler')
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def get_content_compression() -> str:
+    '''Compresión configurada para el contenido: 'zstd' (si está instalado) o 'zlib' '''
+    compression = settings.CONTENT_EXTRACTION_SETTINGS.get('CONTENT_COMPRESSION', 'zlib')
+    if compression == 'zstd' and not ZSTD_AVAILABLE:
+        logger.warning('zstandard no disponible, comprimiendo contenido con zlib')
+        return 'zlib'
+    return 'zstd' if compression == 'zstd' else 'zlib'
+
+
+def compress_content(text: str, compression: str = None) -> Tuple[str, bytes]:
+    '''Texto en UTF-8 comprimido; retorna (compresión usada, datos)'''
+    compression = compression or get_content_compression()
+    raw = text.encode('utf-8')
+    if compression == 'zstd':
+        return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return 'zlib', zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress_content(compression: str, data) -> str:
+    '''Inverso de compress_content. Retorna '' si no se puede descomprimir.'''
+    if not data:
+        return ''
+    try:
+        if compression == 'zstd':
+            if not ZSTD_AVAILABLE:
+                logger.warning('Contenido comprimido con zstd pero zstandard no está instalado')
+                return ''
+            raw = zstandard.ZstdDecompressor().decompress(bytes(data))
+        else:
+            raw = zlib.decompress(bytes(data))
+        return raw.decode('utf-8')
+    except Exception as e:
+        logger.error(f'Error descomprimiendo contenido: {str(e)}')
+        return ''
+
+
+def save_content(result, text: str):
+    '''Guarda (o elimina si está vacío) el contenido completo de un CrawlResult'''
+    if not text:
+        CrawlResultContent.objects.filter(result_id=result.id).delete()
+        return
+
+    compression, data = compress_content(text)
+    CrawlResultContent.objects.update_or_create(
+        result_id=result.id,
+        defaults={'compression': compression, 'data': data},
+    )
+
+
+def load_content(result) -> str:
+    '''
+    Contenido completo de un CrawlResult. Se consulta al acceder, salvo que
+    venga con select_related('content').
+    '''
+    try:
+        stored = result.content
+    except CrawlResultContent.DoesNotExist:
+        return ''
+    return decompress_content(stored.compression, stored.data)
+
+
+def load_contents(result_ids: Iterable[int]) -> Dict[int, str]:
+    '''Contenido de varios resultados con una sola consulta'''
+    stored = CrawlResultContent.objects.filter(result_id__in=list(result_ids))
+    return {
+        content.result_id: decompress_content(content.compression, content.data)
+        for content in stored
+    }
@@ -0,0 +1,596 @@
+# crawler/exporters.py
+import csv
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import timedelta
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import CrawlResult, ExportJob, URLQueue
+from .storage import CHUNK_SIZE, get_session_storage_dir
+
+logger = logging.getLogger('crawler')
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    from xhtml2pdf import pisa
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+# Filas leídas por consulta al recorrer la sesión
+EXPORT_CHUNK_SIZE = 2000
+
+# Filas agrupadas en cada bloque enviado al cliente
+ROWS_PER_BLOCK = 500
+
+# Extensión y content type de cada formato de exportación
+EXPORT_TYPES = {
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+    'json': ('json', 'application/json; charset=utf-8'),
+    'ndjson': ('ndjson', 'application/x-ndjson; charset=utf-8'),
+    'pdf': ('pdf', 'application/pdf'),
+}
+
+# Sufijo y content type de los archivos comprimidos
+COMPRESSION_TYPES = {
+    'gzip': ('.gz', 'application/gzip'),
+    'zstd': ('.zst', 'application/zstd'),
+}
+
+CSV_HEADERS = [
+    'URL', 'Referrer', 'Tipo_Archivo', 'Tamaño_Bytes', 'Estado_HTTP',
+    'Tiempo_Respuesta', 'Descubierto_En', 'Procesado_En', 'Profundidad'
+]
+
+CSV_METADATA_HEADERS = [
+    'Tiene_Metadatos', 'Autor', 'Creador', 'Fecha_Creacion',
+    'Fecha_Modificacion', 'Software_Usado', 'Titulo', 'Coordenadas_GPS',
+    'Hash_Archivo', 'Metadatos_JSON'
+]
+
+CSV_BASIC_HEADERS = [
+    'URL', 'Tipo de Archivo', 'Nombre de Archivo', 'Tamaño (bytes)',
+    'Código HTTP', 'Tiempo de Respuesta (s)', 'Profundidad',
+    'URL Padre', 'Fecha Descubierta', 'Fecha Procesada', 'Estado'
+]
+
+
+class _Echo:
+    '''Pseudo-archivo para csv.writer: retorna la línea en lugar de guardarla'''
+
+    def write(self, value):
+        return value
+
+
+def export_filename(session, prefix: str, extension: str) -> str:
+    return f'{prefix}_{session.id}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+
+
+def iter_url_items(session, with_results: bool = False) -> Iterator[URLQueue]:
+    '''
+    Recorre las URLs de la sesión por bloques de EXPORT_CHUNK_SIZE sin
+    cargarlas todas en memoria. with_results trae los CrawlResult de cada
+    bloque en una sola consulta adicional.
+    '''
+    url_items = URLQueue.objects.filter(session=session).order_by('discovered_at', 'id')
+    if with_results:
+        url_items = url_items.prefetch_related('results')
+    return url_items.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def first_result(url_item: URLQueue) -> Optional[CrawlResult]:
+    '''Resultado más reciente de una URL (usa los resultados precargados)'''
+    results = url_item.results.all()
+    return results[0] if results else None
+
+
+def session_info(session) -> Dict[str, Any]:
+    return {
+        'id': session.id,
+        'name': session.name,
+        'target_domain': session.target_domain,
+        'target_url': session.target_url,
+        'status': session.status,
+        'created_at': session.created_at.isoformat(),
+        'started_at': session.started_at.isoformat() if session.started_at else None,
+        'completed_at': session.completed_at.isoformat() if session.completed_at else None,
+        'total_urls_processed': session.total_urls_processed,
+        'total_files_found': session.total_files_found,
+    }
+
+
+def metadata_columns(result: Optional[CrawlResult]) -> List[str]:
+    '''Columnas de metadatos del CSV (autor, fechas, software, GPS...)'''
+    if result is None:
+        return ['No', '', '', '', '', '', '', '', '', '']
+
+    metadata = result.metadata or {}
+
+    author = ''
+    creator = ''
+    creation_date = ''
+    modification_date = ''
+    software = ''
+    title = result.title or ''
+    gps_coords = ''
+    file_hash = result.file_hash or ''
+
+    # Buscar en diferentes categorías de metadatos
+    for category in ['pdf_metadata', 'office_metadata', 'exif_metadata']:
+        if category in metadata:
+            cat_data = metadata[category]
+
+            if not author and 'author' in cat_data:
+                author = str(cat_data['author'])
+            if not creator and 'creator' in cat_data:
+                creator = str(cat_data['creator'])
+            if not creation_date and 'creation_date' in cat_data:
+                creation_date = str(cat_data['creation_date'])
+            elif not creation_date and 'created' in cat_data:
+                creation_date = str(cat_data['created'])
+            if not modification_date and 'modification_date' in cat_data:
+                modification_date = str(cat_data['modification_date'])
+            elif not modification_date and 'modified' in cat_data:
+                modification_date = str(cat_data['modified'])
+            if not software and 'producer' in cat_data:
+                software = str(cat_data['producer'])
+            elif not software and 'software' in cat_data:
+                software = str(cat_data['software'])
+
+            # GPS específico para EXIF
+            if category == 'exif_metadata' and 'gps_coordinates' in cat_data:
+                gps_data = cat_data['gps_coordinates']
+                if isinstance(gps_data, dict) and 'coordinates_string' in gps_data:
+                    gps_coords = gps_data['coordinates_string']
+
+    return [
+        'Sí' if metadata else 'No',
+        author,
+        creator,
+        creation_date,
+        modification_date,
+        software,
+        title,
+        gps_coords,
+        file_hash,
+        json.dumps(metadata, ensure_ascii=False) if metadata else ''
+    ]
+
+
+def iter_csv_export(session, include_metadata: bool = False) -> Iterator[str]:
+    '''Líneas del CSV de resultados (con columnas de metadatos opcionales)'''
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADERS + (CSV_METADATA_HEADERS if include_metadata else []))
+
+    for url_item in iter_url_items(session, with_results=include_metadata):
+        row = [
+            url_item.url,
+            url_item.referrer or '',
+            url_item.url_type or '',
+            url_item.file_size or 0,
+            url_item.http_status_code or '',
+            url_item.response_time or 0,
+            url_item.discovered_at.isoformat() if url_item.discovered_at else '',
+            url_item.processed_at.isoformat() if url_item.processed_at else '',
+            url_item.depth
+        ]
+        if include_metadata:
+            row.extend(metadata_columns(first_result(url_item)))
+        yield writer.writerow(row)
+
+
+def iter_csv_basic_export(session) -> Iterator[str]:
+    '''Líneas del CSV simple de URLs (formato de la exportación original)'''
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_BASIC_HEADERS)
+
+    for url_item in iter_url_items(session, with_results=True):
+        result = first_result(url_item)
+        yield writer.writerow([
+            url_item.url,
+            url_item.url_type,
+            result.file_name if result else '',
+            url_item.file_size or '',
+            url_item.http_status_code or '',
+            url_item.response_time or '',
+            url_item.depth,
+            url_item.parent_url,
+            url_item.discovered_at.strftime('%Y-%m-%d %H:%M:%S'),
+            url_item.processed_at.strftime('%Y-%m-%d %H:%M:%S') if url_item.processed_at else '',
+            url_item.get_status_display()
+        ])
+
+
+def url_item_data(url_item: URLQueue, include_metadata: bool = False) -> Dict[str, Any]:
+    url_data = {
+        'url': url_item.url,
+        'referrer': url_item.referrer,
+        'parent_url': url_item.parent_url,
+        'depth': url_item.depth,
+        'url_type': url_item.url_type,
+        'file_size': url_item.file_size,
+        'content_type': url_item.content_type,
+        'status': url_item.status,
+        'http_status_code': url_item.http_status_code,
+        'response_time': url_item.response_time,
+        'discovered_at': url_item.discovered_at.isoformat() if url_item.discovered_at else None,
+        'processed_at': url_item.processed_at.isoformat() if url_item.processed_at else None,
+        'has_metadata': url_item.has_metadata,
+    }
+
+    if include_metadata:
+        result = first_result(url_item)
+        if result is not None:
+            url_data['metadata'] = result.metadata
+            url_data['file_hash'] = result.file_hash
+            url_data['file_path'] = result.file_path
+            url_data['title'] = result.title
+            url_data['description'] = result.description
+            url_data['keywords'] = result.keywords
+        else:
+            url_data['metadata'] = None
+
+    return url_data
+
+
+def iter_json_export(session, include_metadata: bool = False, include_analysis: bool = False) -> Iterator[str]:
+    '''
+    Documento JSON {session_info, urls_discovered[, advanced_analysis]} emitido
+    por partes: una URL por línea dentro del arreglo
+    '''
+    yield '{\n"session_info": ' + json.dumps(session_info(session), ensure_ascii=False) + ',\n"urls_discovered": ['
+
+    separator = '\n'
+    for url_item in iter_url_items(session, with_results=include_metadata):
+        yield separator + json.dumps(url_item_data(url_item, include_metadata), ensure_ascii=False)
+        separator = ',\n'
+
+    yield '\n]'
+
+    # Incluir análisis avanzado si se solicita
+    if include_analysis:
+        try:
+            from .metadata_utils import analyze_session_metadata
+            analysis = analyze_session_metadata(session)
+            yield ',\n"advanced_analysis": ' + json.dumps(analysis, ensure_ascii=False, default=str)
+        except Exception as e:
+            yield ',\n"analysis_error": ' + json.dumps(str(e), ensure_ascii=False)
+
+    yield '\n}\n'
+
+
+def iter_ndjson_export(session, include_metadata: bool = False) -> Iterator[str]:
+    '''JSON por líneas: la primera con los datos de la sesión, luego una por URL'''
+    yield json.dumps({'session_info': session_info(session)}, ensure_ascii=False) + '\n'
+
+    for url_item in iter_url_items(session, with_results=include_metadata):
+        yield json.dumps(url_item_data(url_item, include_metadata), ensure_ascii=False) + '\n'
+
+
+def _blocks(parts: Iterable[str], size: int = ROWS_PER_BLOCK) -> Iterator[str]:
+    '''Agrupa las partes en bloques para no escribir al socket fila por fila'''
+    block = []
+    for part in parts:
+        block.append(part)
+        if len(block) >= size:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+
+def _next_block(blocks: Iterator):
+    return next(blocks, None)
+
+
+async def _async_blocks(blocks: Iterator):
+    '''
+    Bajo ASGI Django convierte un iterador síncrono en lista (todo en memoria).
+    Se consume bloque a bloque en el hilo de la base de datos.
+    '''
+    while True:
+        block = await sync_to_async(_next_block, thread_sensitive=True)(blocks)
+        if block is None:
+            break
+        yield block
+
+
+def _response_iterator(request, blocks: Iterator):
+    return _async_blocks(blocks) if isinstance(request, ASGIRequest) else blocks
+
+
+def streaming_export_response(request, parts: Iterable[str], content_type: str, filename: str) -> StreamingHttpResponse:
+    '''Respuesta de descarga que envía la exportación a medida que se genera'''
+    response = StreamingHttpResponse(_response_iterator(request, _blocks(parts)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# =====================================================================
+# Exportaciones en segundo plano (ExportJob)
+# =====================================================================
+
+class ExportError(Exception):
+    '''La exportación no se pudo generar'''
+
+
+def get_export_dir(session_id: int) -> str:
+    '''Directorio de exportaciones (se elimina junto con la sesión)'''
+    return os.path.join(get_session_storage_dir(session_id), 'exports')
+
+
+def get_export_compression() -> str:
+    '''Compresión configurada: 'zstd' (si está instalado), 'gzip' o '' (sin comprimir)'''
+    compression = settings.CRAWLER_SETTINGS.get('EXPORT_COMPRESSION', 'gzip')
+    if compression == 'zstd' and not ZSTD_AVAILABLE:
+        logger.warning('zstandard no disponible, exportando con gzip')
+        return 'gzip'
+    return compression if compression in COMPRESSION_TYPES else ''
+
+
+def session_version(session) -> str:
+    '''
+    Identifica el estado de los datos exportables de la sesión. Cambia con cada
+    URL procesada (updated_at de la sesión) y con cada metadato extraído.
+    '''
+    results = session.results.order_by().aggregate(total=Count('id'), last_update=Max('updated_at'))
+    last_update = results['last_update'].isoformat() if results['last_update'] else ''
+    return f"{session.status}:{session.updated_at.isoformat()}:{results['total']}:{last_update}"
+
+
+def export_fingerprint(session, export_format: str, options: Dict[str, Any]) -> str:
+    payload = json.dumps({
+        'session': session.id,
+        'format': export_format,
+        'options': options,
+        'version': session_version(session),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_stale_export_job(job: ExportJob) -> bool:
+    '''
+    True si la exportación no va a terminar: en curso desde hace más que
+    EXPORT_TIME_LIMIT, o sin que un worker la tome en EXPORT_QUEUE_TIMEOUT
+    (una cola ocupada demora, pero no la pierde)
+    '''
+    now = timezone.now()
+    if job.status == 'running' and job.started_at:
+        time_limit = settings.CRAWLER_SETTINGS.get('EXPORT_TIME_LIMIT', 3600)
+        return job.started_at < now - timedelta(seconds=time_limit)
+    if job.status == 'pending':
+        queue_timeout = settings.CRAWLER_SETTINGS.get('EXPORT_QUEUE_TIMEOUT', 6 * 3600)
+        return job.created_at < now - timedelta(seconds=queue_timeout)
+    return False
+
+
+def get_or_create_export_job(session, user, export_format: str, options: Dict[str, Any]) -> Tuple[ExportJob, bool]:
+    '''
+    Retorna la exportación existente para los mismos datos (en curso o
+    terminada con su archivo disponible) o crea una nueva
+    '''
+    fingerprint = export_fingerprint(session, export_format, options)
+    job = session.export_jobs.filter(fingerprint=fingerprint).exclude(status='failed').first()
+    if job is not None and job.status in ('pending', 'running') and is_stale_export_job(job):
+        # Worker caído o cortado por time_limit (SIGKILL no pasa por el except de run_export_job)
+        ExportJob.objects.filter(id=job.id, status=job.status).update(
+            status='failed', error_message='La exportación no terminó dentro del tiempo límite'
+        )
+        job = None
+    if job is not None and (job.status != 'completed' or os.path.exists(job.file_path)):
+        return job, False
+
+    job = ExportJob.objects.create(
+        session=session,
+        user=user,
+        export_format=export_format,
+        options=options,
+        fingerprint=fingerprint,
+    )
+    return job, True
+
+
+def delete_superseded_exports(job: ExportJob) -> int:
+    '''
+    Elimina las exportaciones anteriores a job con las mismas opciones. Las
+    terminadas o descargadas hace menos de EXPORT_DOWNLOAD_GRACE se conservan
+    (una descarga por rangos puede seguir leyendo su archivo) y se eliminan en
+    una ejecución posterior de cleanup_superseded_exports.
+    '''
+    grace = settings.CRAWLER_SETTINGS.get('EXPORT_DOWNLOAD_GRACE', 3600)
+    cutoff = timezone.now() - timedelta(seconds=grace)
+
+    deleted = 0
+    for old_job in job.session.export_jobs.filter(
+        export_format=job.export_format,
+        status__in=['completed', 'failed'],
+    ).exclude(id=job.id):
+        last_used = max(filter(None, [old_job.completed_at, old_job.last_accessed_at]), default=None)
+        if old_job.options != job.options or (last_used and last_used > cutoff):
+            continue
+        old_job.delete()
+        deleted += 1
+    return deleted
+
+
+def iter_export_parts(session, export_format: str, options: Dict[str, Any]) -> Iterator[str]:
+    include_metadata = options.get('include_metadata', False)
+    if export_format == 'csv':
+        return iter_csv_export(session, include_metadata)
+    if export_format == 'json':
+        return iter_json_export(session, include_metadata, options.get('include_analysis', False))
+    if export_format == 'ndjson':
+        return iter_ndjson_export(session, include_metadata)
+    raise ExportError(f'Formato de exportación no soportado: {export_format}')
+
+
+def open_artifact(path: str, compression: str) -> BinaryIO:
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+    return open(path, 'wb')
+
+
+def render_pdf_report(session, report_type: str, include_metadata: bool, dest: BinaryIO):
+    '''Genera el reporte PDF (estándar o de seguridad) en dest'''
+    if not PDF_AVAILABLE:
+        raise ExportError('Librería PDF no disponible. Instalar con: pip install xhtml2pdf')
+
+    # Preparar datos según tipo de reporte
+    context = {
+        'session': session,
+        'generated_at': timezone.now(),
+        'include_metadata': include_metadata,
+    }
+
+    if report_type == 'security':
+        # Reporte de seguridad con análisis de riesgos
+        try:
+            from .metadata_utils import analyze_session_metadata
+            context['analysis'] = analyze_session_metadata(session)
+            template_name = 'crawler/reports/security_report.html'
+        except Exception as e:
+            context['analysis_error'] = str(e)
+            template_name = 'crawler/reports/basic_report.html'
+    else:
+        # Reporte estándar
+        context['results'] = CrawlResult.objects.filter(session=session).select_related('url_queue_item')
+        template_name = 'crawler/reports/standard_report.html'
+
+    html = get_template(template_name).render(context)
+    pisa_status = pisa.CreatePDF(html, dest=dest)
+    if pisa_status.err:
+        raise ExportError('Error generando PDF')
+
+
+def build_export_artifact(job: ExportJob, on_progress: Callable[[int], None] = None) -> Tuple[str, str]:
+    '''
+    Escribe el archivo de una exportación (comprimido salvo PDF) y retorna
+    (ruta, compresión). Se escribe en un .part y se renombra al terminar para
+    no servir nunca un archivo incompleto.
+    '''
+    session = job.session
+    extension, _ = EXPORT_TYPES[job.export_format]
+    compression = '' if job.export_format == 'pdf' else get_export_compression()
+    suffix = COMPRESSION_TYPES[compression][0] if compression else ''
+
+    directory = get_export_dir(session.id)
+    os.makedirs(directory, exist_ok=True)
+    final_path = os.path.join(directory, f'{job.id}-{job.fingerprint[:12]}.{extension}{suffix}')
+    temp_path = f'{final_path}.part'
+
+    try:
+        if job.export_format == 'pdf':
+            with open(temp_path, 'wb') as output:
+                render_pdf_report(
+                    session,
+                    job.options.get('report_type', 'standard'),
+                    job.options.get('include_metadata', False),
+                    output
+                )
+        else:
+            rows = 0
+            with open_artifact(temp_path, compression) as output:
+                for block in _blocks(iter_export_parts(session, job.export_format, job.options)):
+                    output.write(block.encode('utf-8'))
+                    rows += ROWS_PER_BLOCK
+                    if on_progress:
+                        on_progress(rows)
+        os.replace(temp_path, final_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return final_path, compression
+
+
+def export_download_info(job: ExportJob) -> Tuple[str, str]:
+    '''Nombre de descarga y content type del archivo de una exportación'''
+    extension, content_type = EXPORT_TYPES[job.export_format]
+    prefix = 'crawl_report' if job.export_format == 'pdf' else 'crawl_export'
+    file_name = export_filename(job.session, prefix, extension)
+    if job.compression:
+        suffix, content_type = COMPRESSION_TYPES[job.compression]
+        file_name += suffix
+    return file_name, content_type
+
+
+# =====================================================================
+# Descargas con soporte de Range
+# =====================================================================
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(request, path: str, content_type: str, filename: str, etag: str = '') -> HttpResponse:
+    '''
+    Descarga un archivo respetando la cabecera Range (un solo rango), lo que
+    permite reanudar descargas interrumpidas. If-Range con un ETag distinto
+    entrega el archivo completo.
+    '''
+    size = os.path.getsize(path)
+    start, end = 0, size - 1
+    status = 200
+
+    match = RANGE_RE.match(request.headers.get('Range', '').strip())
+    if_range = request.headers.get('If-Range')
+    if match and any(match.groups()) and (not if_range or if_range == etag):
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Sufijo: los últimos N bytes
+            start = max(size - int(last), 0)
+
+        if start >= size or start > end:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        status = 206
+
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        _response_iterator(request, _iter_file(path, start, length)),
+        status=status,
+        content_type=content_type
+    )
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if etag:
+        response['ETag'] = etag
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,99 @@
+# crawler/extraction_cache.py
+import logging
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .content_store import compress_content, decompress_content
+from .models import ExtractionCache
+from .snapshot import get_shared_cache
+
+logger = logging.getLogger('crawler')
+
+# Campos de los metadatos que dependen de la URL y no del contenido del archivo
+URL_SPECIFIC_FIELDS = ('file_path', 'file_url', 'referrer', 'extracted_at')
+
+# Inserciones en la caché desde el arranque del contador (compartido entre workers)
+INSERT_COUNTER_KEY = 'fisgon:extraction_cache:inserts'
+
+
+def _cache_settings() -> Dict[str, Any]:
+    return getattr(settings, 'CONTENT_EXTRACTION_SETTINGS', {})
+
+
+def get_cached_extraction(file_hash: str, file_extension: str) -> Optional[ExtractionCache]:
+    '''Retorna la extracción almacenada para un contenido y registra el uso (LRU)'''
+    if not file_hash or not _cache_settings().get('CACHE_ENABLED', True):
+        return None
+
+    entry = ExtractionCache.objects.filter(file_hash=file_hash, file_extension=file_extension).first()
+    if entry is not None:
+        ExtractionCache.objects.filter(id=entry.id).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    return entry
+
+
+def store_extraction(file_hash: str, file_extension: str, metadata: Dict[str, Any], full_content: str):
+    '''Guarda en caché la parte de una extracción que depende solo del contenido'''
+    if not file_hash or not _cache_settings().get('CACHE_ENABLED', True):
+        return
+
+    # Los errores pueden ser transitorios (timeout, dependencia ausente): no se cachean
+    if 'extraction_error' in metadata:
+        return
+
+    content_metadata = {key: value for key, value in metadata.items() if key not in URL_SPECIFIC_FIELDS}
+    compression, data = compress_content(full_content) if full_content else ('zlib', b'')
+
+    try:
+        entry = ExtractionCache.objects.create(
+            file_hash=file_hash,
+            file_extension=file_extension,
+            metadata=content_metadata,
+            compression=compression,
+            content_data=data,
+            content_length=len(full_content or ''),
+        )
+    except IntegrityError:
+        # Otro worker extrajo el mismo archivo al mismo tiempo
+        return
+
+    # Contar las entradas solo cada CACHE_EVICT_EVERY inserciones
+    inserts = _count_insert()
+    if inserts is None or inserts % max(1, _cache_settings().get('CACHE_EVICT_EVERY', 100)) == 0:
+        evict_extraction_cache()
+
+
+def _count_insert() -> Optional[int]:
+    '''
+    Incrementa el contador de inserciones en la caché compartida. None si no
+    está disponible (entonces se revisa el límite en cada inserción)
+    '''
+    cache = get_shared_cache()
+    try:
+        cache.add(INSERT_COUNTER_KEY, 0, timeout=None)
+        return cache.incr(INSERT_COUNTER_KEY)
+    except Exception as e:
+        logger.debug(f'Contador de la caché de extracción no disponible: {str(e)}')
+        return None
+
+
+def load_cached_content(entry: ExtractionCache) -> str:
+    '''Contenido completo de una entrada de caché'''
+    return decompress_content(entry.compression, entry.content_data)
+
+
+def evict_extraction_cache():
+    '''Elimina las entradas usadas hace más tiempo si se supera CACHE_MAX_ENTRIES'''
+    max_entries = _cache_settings().get('CACHE_MAX_ENTRIES', 5000)
+    excess = ExtractionCache.objects.count() - max_entries
+    if excess <= 0:
+        return
+
+    stale_ids = list(
+        ExtractionCache.objects.order_by('last_used_at').values_list('id', flat=True)[:excess]
+    )
+    ExtractionCache.objects.filter(id__in=stale_ids).delete()
+    logger.info(f'Caché de extracción: {len(stale_ids)} entradas eliminadas')
@@ -0,0 +1,192 @@
+# crawler/extraction_guard.py
+import logging
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger('crawler')
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+# Límites que dependen solo del archivo: un resultado parcial por estos motivos se puede cachear
+DETERMINISTIC_LIMITS = ('pages', 'sheets', 'cells', 'chars', 'file_size')
+
+
+class ExtractionBudgetExceeded(BaseException):
+    '''
+    Se agotó el presupuesto de tiempo o memoria de una extracción. Hereda de
+    BaseException porque SIGALRM la lanza en cualquier punto del parser: así
+    los `except Exception` de los extractores no la atrapan y cada extractor
+    decide dónde cortar conservando el contenido parcial.
+    '''
+
+    def __init__(self, reason: str):
+        super().__init__(f'Presupuesto de extracción agotado: {reason}')
+        self.reason = reason
+
+
+class ExtractionBudget:
+    '''
+    Límites de una extracción (tiempo, memoria, páginas, celdas y caracteres).
+    Los extractores consultan el presupuesto mientras recorren el documento y
+    se detienen devolviendo lo ya extraído; los límites alcanzados quedan
+    registrados para marcar el resultado como parcial.
+    '''
+
+    def __init__(self, timeout: float = 60, max_memory_mb: int = 0, max_file_size_mb: int = 0,
+                 max_pages: int = 500, max_sheets: int = 10, max_cells_per_sheet: int = 1000,
+                 max_rows: int = 100, max_cols: int = 50, max_chars: int = 1000000):
+        self.timeout = timeout
+        self.max_memory_mb = max_memory_mb
+        self.max_file_size_mb = max_file_size_mb
+        self.max_pages = max_pages
+        self.max_sheets = max_sheets
+        self.max_cells_per_sheet = max_cells_per_sheet
+        self.max_rows = max_rows
+        self.max_cols = max_cols
+        self.max_chars = max_chars
+
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + timeout if timeout else None
+        self.limits_reached: List[str] = []
+
+    @classmethod
+    def from_settings(cls) -> 'ExtractionBudget':
+        config = getattr(settings, 'CONTENT_EXTRACTION_SETTINGS', {})
+        return cls(
+            timeout=config.get('EXTRACTION_TIMEOUT', 60),
+            max_memory_mb=config.get('EXTRACTION_MAX_MEMORY_MB', 0),
+            max_file_size_mb=config.get('MAX_FILE_SIZE_MB', 50),
+            max_pages=config.get('MAX_PDF_PAGES', 500),
+            max_sheets=config.get('MAX_EXCEL_SHEETS', 10),
+            max_cells_per_sheet=config.get('MAX_EXCEL_CELLS_PER_SHEET', 1000),
+            max_rows=config.get('EXCEL_MAX_ROWS', 100),
+            max_cols=config.get('EXCEL_MAX_COLS', 50),
+            max_chars=config.get('MAX_CONTENT_CHARS', 1000000),
+        )
+
+    def note(self, reason: str):
+        '''Registra que se alcanzó un límite'''
+        if reason not in self.limits_reached:
+            self.limits_reached.append(reason)
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def expired(self) -> bool:
+        '''True (y registra el timeout) si se agotó el tiempo'''
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self.note('timeout')
+            return True
+        return False
+
+    def check_time(self):
+        '''Lanza ExtractionBudgetExceeded si se agotó el tiempo'''
+        if self.expired():
+            raise ExtractionBudgetExceeded('timeout')
+
+    def file_too_large(self, file_path: str) -> bool:
+        if not self.max_file_size_mb:
+            return False
+        try:
+            too_large = os.path.getsize(file_path) > self.max_file_size_mb * 1024 * 1024
+        except OSError:
+            return False
+        if too_large:
+            self.note('file_size')
+        return too_large
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.limits_reached)
+
+    @property
+    def cacheable(self) -> bool:
+        '''False si el resultado depende del momento (timeout o memoria)'''
+        return all(reason in DETERMINISTIC_LIMITS for reason in self.limits_reached)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'partial': self.partial,
+            'limits_reached': list(self.limits_reached),
+            'elapsed_seconds': round(time.monotonic() - self.started_at, 3),
+        }
+
+
+def _current_address_space() -> int:
+    '''Memoria virtual actual del proceso en bytes (Linux)'''
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+
+
+@contextmanager
+def enforce_budget(budget: ExtractionBudget):
+    '''
+    Aplica de forma estricta el tiempo y la memoria de un presupuesto:
+
+    - SIGALRM interrumpe una llamada bloqueada (p. ej. una página que no termina
+      de parsearse) lanzando ExtractionBudgetExceeded. Solo en el hilo principal,
+      que es donde los workers prefork de Celery ejecutan las tareas.
+    - RLIMIT_AS limita el crecimiento de memoria a max_memory_mb sobre el uso
+      actual; superarlo produce MemoryError en el extractor.
+
+    Ambos límites son del proceso completo, por lo que el worker de extracción
+    debe usar --pool=prefork con una sola extracción por proceso (sin hilos ni
+    gevent/eventlet, y con --prefetch-multiplier=1).
+
+    Las excepciones de presupuesto que lleguen hasta aquí se registran en el
+    presupuesto en lugar de propagarse.
+    '''
+    use_alarm = (
+        budget.deadline is not None
+        and hasattr(signal, 'setitimer')
+        and threading.current_thread() is threading.main_thread()
+    )
+    previous_handler = None
+    previous_limit = None
+
+    if use_alarm:
+        def on_alarm(signum, frame):
+            budget.note('timeout')
+            raise ExtractionBudgetExceeded('timeout')
+
+        previous_handler = signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, max(budget.remaining(), 0.001))
+
+    if budget.max_memory_mb and RESOURCE_AVAILABLE:
+        try:
+            previous_limit = resource.getrlimit(resource.RLIMIT_AS)
+            cap = _current_address_space() + budget.max_memory_mb * 1024 * 1024
+            hard = previous_limit[1]
+            if hard != resource.RLIM_INFINITY:
+                cap = min(cap, hard)
+            resource.setrlimit(resource.RLIMIT_AS, (cap, hard))
+        except (OSError, ValueError) as e:
+            logger.warning(f'No se pudo limitar la memoria de la extracción: {str(e)}')
+            previous_limit = None
+
+    try:
+        yield budget
+    except ExtractionBudgetExceeded as e:
+        budget.note(e.reason)
+    except MemoryError:
+        budget.note('memory')
+        logger.warning('Extracción interrumpida por límite de memoria')
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler or signal.SIG_DFL)
+        if previous_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, previous_limit)
@@ -1,10 +1,13 @@
 # crawler/extractors.py
 import os
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 import hashlib
 
+from .extraction_guard import ExtractionBudget, ExtractionBudgetExceeded
+from .scanner import contains_sensitive_data
+
 logger = logging.getLogger('crawler')
 
 # Librerías para extracción de metadatos
@@ -67,21 +70,72 @@ except ImportError:
 class MetadataExtractor:
     '''Clase base para extractores de metadatos'''
     
-    def __init__(self, file_path: str, file_url: str = None, referrer: str = None):
+    def __init__(self, file_path: str, file_url: str = None, referrer: str = None,
+                 budget: ExtractionBudget = None, file_hash: str = None):
         self.file_path = file_path
         self.file_url = file_url
         self.referrer = referrer
+        self.budget = budget or ExtractionBudget.from_settings()
+        self.file_hash = file_hash  # Hash ya calculado durante la descarga
         self.metadata = {}
     
     def extract(self) -> Dict[str, Any]:
         '''Método principal que debe ser implementado por cada extractor'''
         raise NotImplementedError
     
+    def extract_full_content(self) -> str:
+        '''Texto completo del documento (vacío si el formato no lo soporta)'''
+        return ""
+    
+    def close(self):
+        '''Libera el documento parseado (archivos abiertos, memoria)'''
+        pass
+    
+    def _note_partial(self, error: BaseException, label: str):
+        '''Registra el límite que cortó la extracción; el llamador conserva lo ya extraído'''
+        self.budget.note('memory' if isinstance(error, MemoryError) else error.reason)
+        logger.warning(f"Presupuesto agotado extrayendo {label}, contenido parcial")
+    
+    def extract_all(self) -> Dict[str, Any]:
+        '''
+        Metadatos, vista previa y contenido completo en una sola pasada: los
+        extractores guardan el documento parseado y lo reutilizan entre ambos
+        '''
+        try:
+            try:
+                metadata = self.extract()
+            except ExtractionBudgetExceeded as e:
+                # Sin metadatos específicos del formato quedan al menos los comunes
+                self.budget.note(e.reason)
+                metadata = self.get_common_metadata()
+            
+            full_content = ""
+            if not self.budget.file_too_large(self.file_path):
+                try:
+                    full_content = self.extract_full_content()
+                except ExtractionBudgetExceeded as e:
+                    # Los metadatos ya extraídos se conservan
+                    self.budget.note(e.reason)
+        finally:
+            self.close()
+        
+        preview = (
+            metadata.get('first_page_preview')
+            or metadata.get('content_preview')
+            or (full_content or '')[:500]
+        )
+        
+        return {
+            'metadata': metadata,
+            'preview': preview,
+            'full_content': full_content,
+        }
+    
     def get_common_metadata(self) -> Dict[str, Any]:
         '''Obtiene metadatos comunes a todos los archivos'''
         try:
             stat_info = os.stat(self.file_path)
-            file_hash = self._calculate_file_hash()
+            file_hash = self.file_hash or self._calculate_file_hash()
             
             return {
                 'file_path': self.file_path,
@@ -100,8 +154,11 @@ class MetadataExtractor:
     def _calculate_file_hash(self) -> str:
         '''Calcula el hash SHA-256 del archivo'''
         try:
+            sha256 = hashlib.sha256()
             with open(self.file_path, 'rb') as f:
-                return hashlib.sha256(f.read()).hexdigest()
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    sha256.update(chunk)
+            return sha256.hexdigest()
         except Exception:
             return ""
 
@@ -109,6 +166,21 @@ class MetadataExtractor:
 class PDFExtractor(MetadataExtractor):
     '''Extractor especializado para archivos PDF'''
     
+    def _get_pdf_reader(self):
+        '''Parsea el PDF una sola vez por extractor'''
+        if getattr(self, '_pdf_reader', None) is None:
+            self._pdf_reader = PdfReader(self.file_path)
+            self._first_page_text = None
+        return self._pdf_reader
+    
+    def _get_page_text(self, pdf_reader, index: int) -> str:
+        # La primera página se usa para la vista previa y para el contenido completo
+        if index == 0:
+            if self._first_page_text is None:
+                self._first_page_text = pdf_reader.pages[0].extract_text() or ''
+            return self._first_page_text
+        return pdf_reader.pages[index].extract_text()
+    
     def extract(self) -> Dict[str, Any]:
         metadata = self.get_common_metadata()
         
@@ -117,38 +189,37 @@ class PDFExtractor(MetadataExtractor):
             return metadata
         
         try:
-            with open(self.file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                
-                # Metadatos del documento
-                if pdf_reader.metadata:
-                    pdf_metadata = {
-                        'author': self._clean_text(pdf_reader.metadata.get('/Author', '')),
-                        'creator': self._clean_text(pdf_reader.metadata.get('/Creator', '')),
-                        'producer': self._clean_text(pdf_reader.metadata.get('/Producer', '')),
-                        'title': self._clean_text(pdf_reader.metadata.get('/Title', '')),
-                        'subject': self._clean_text(pdf_reader.metadata.get('/Subject', '')),
-                        'keywords': self._clean_text(pdf_reader.metadata.get('/Keywords', '')),
-                        'creation_date': self._parse_pdf_date(pdf_reader.metadata.get('/CreationDate')),
-                        'modification_date': self._parse_pdf_date(pdf_reader.metadata.get('/ModDate')),
-                    }
-                    
-                    # Filtrar valores vacíos
-                    pdf_metadata = {k: v for k, v in pdf_metadata.items() if v}
-                    metadata['pdf_metadata'] = pdf_metadata
-                
-                # Información del PDF
-                metadata['pdf_info'] = {
-                    'num_pages': len(pdf_reader.pages),
-                    'encrypted': pdf_reader.is_encrypted,
-                    'pdf_version': getattr(pdf_reader, 'pdf_header', '').replace('%PDF-', '') if hasattr(pdf_reader, 'pdf_header') else '',
+            pdf_reader = self._get_pdf_reader()
+            
+            # Metadatos del documento
+            if pdf_reader.metadata:
+                pdf_metadata = {
+                    'author': self._clean_text(pdf_reader.metadata.get('/Author', '')),
+                    'creator': self._clean_text(pdf_reader.metadata.get('/Creator', '')),
+                    'producer': self._clean_text(pdf_reader.metadata.get('/Producer', '')),
+                    'title': self._clean_text(pdf_reader.metadata.get('/Title', '')),
+                    'subject': self._clean_text(pdf_reader.metadata.get('/Subject', '')),
+                    'keywords': self._clean_text(pdf_reader.metadata.get('/Keywords', '')),
+                    'creation_date': self._parse_pdf_date(pdf_reader.metadata.get('/CreationDate')),
+                    'modification_date': self._parse_pdf_date(pdf_reader.metadata.get('/ModDate')),
                 }
                 
-                # Extraer texto de la primera página para análisis
-                if len(pdf_reader.pages) > 0:
-                    first_page_text = pdf_reader.pages[0].extract_text()[:500]
-                    metadata['first_page_preview'] = first_page_text
-                
+                # Filtrar valores vacíos
+                pdf_metadata = {k: v for k, v in pdf_metadata.items() if v}
+                metadata['pdf_metadata'] = pdf_metadata
+            
+            # Información del PDF
+            metadata['pdf_info'] = {
+                'num_pages': len(pdf_reader.pages),
+                'encrypted': pdf_reader.is_encrypted,
+                'pdf_version': getattr(pdf_reader, 'pdf_header', '').replace('%PDF-', '') if hasattr(pdf_reader, 'pdf_header') else '',
+            }
+            
+            # Extraer texto de la primera página para análisis
+            if len(pdf_reader.pages) > 0:
+                first_page_text = self._get_page_text(pdf_reader, 0)[:500]
+                metadata['first_page_preview'] = first_page_text
+            
         except Exception as e:
             logger.error(f"Error extrayendo metadatos de PDF {self.file_path}: {str(e)}")
             metadata['extraction_error'] = str(e)
@@ -162,27 +233,37 @@ class PDFExtractor(MetadataExtractor):
             return ""
         
         try:
-            with open(self.file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                full_text = []
-                
-                # Limitar a máximo 500 páginas por performance
-                max_pages = min(len(pdf_reader.pages), 500)
-                logger.info(f"Extrayendo contenido de {max_pages} páginas de PDF")
-                
-                for i, page in enumerate(pdf_reader.pages[:max_pages]):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text and page_text.strip():
-                            full_text.append(f"=== Página {i+1} ===\n{page_text.strip()}")
-                    except Exception as e:
-                        logger.warning(f"Error extrayendo página {i+1}: {str(e)}")
-                        continue
-                
-                result = '\n\n'.join(full_text)
-                logger.info(f"PDF contenido extraído: {len(result)} caracteres")
-                return result
-                
+            pdf_reader = self._get_pdf_reader()
+            full_text = []
+            
+            # Limitar páginas según MAX_PDF_PAGES
+            total_pages = len(pdf_reader.pages)
+            max_pages = min(total_pages, self.budget.max_pages)
+            if total_pages > max_pages:
+                self.budget.note('pages')
+            logger.info(f"Extrayendo contenido de {max_pages} páginas de PDF")
+            
+            for i in range(max_pages):
+                try:
+                    self.budget.check_time()
+                    page_text = self._get_page_text(pdf_reader, i)
+                    if page_text and page_text.strip():
+                        full_text.append(f"=== Página {i+1} ===\n{page_text.strip()}")
+                except ExtractionBudgetExceeded:
+                    logger.warning(f"Tiempo de extracción agotado en la página {i+1}, contenido parcial")
+                    break
+                except MemoryError:
+                    self.budget.note('memory')
+                    logger.warning(f"Memoria agotada en la página {i+1}, contenido parcial")
+                    break
+                except Exception as e:
+                    logger.warning(f"Error extrayendo página {i+1}: {str(e)}")
+                    continue
+            
+            result = '\n\n'.join(full_text)
+            logger.info(f"PDF contenido extraído: {len(result)} caracteres")
+            return result
+            
         except Exception as e:
             logger.error(f"Error extrayendo contenido completo PDF: {str(e)}")
             return ""
@@ -316,6 +397,42 @@ class ImageExtractor(MetadataExtractor):
 class OfficeExtractor(MetadataExtractor):
     '''Extractor para documentos de Microsoft Office (Word, Excel, PowerPoint)'''
     
+    def _get_docx(self):
+        if getattr(self, '_docx', None) is None:
+            self._docx = Document(self.file_path)
+        return self._docx
+    
+    def _get_xlsx_workbook(self):
+        # read_only: las hojas se leen en streaming en lugar de cargarse completas
+        if getattr(self, '_xlsx_workbook', None) is None:
+            self._xlsx_workbook = load_workbook(self.file_path, data_only=True, read_only=True)
+        return self._xlsx_workbook
+    
+    def close(self):
+        workbook = getattr(self, '_xlsx_workbook', None)
+        if workbook is not None:
+            workbook.close()
+            self._xlsx_workbook = None
+    
+    def _get_xls_workbook(self):
+        import xlrd
+        if getattr(self, '_xls_workbook', None) is None:
+            self._xls_workbook = xlrd.open_workbook(self.file_path)
+        return self._xls_workbook
+    
+    def extract_full_content(self) -> str:
+        file_extension = os.path.splitext(self.file_path)[1].lower()
+        
+        if file_extension == '.docx':
+            return self.extract_full_docx_content()
+        elif file_extension == '.doc':
+            return self.extract_full_doc_content()
+        elif file_extension == '.xlsx':
+            return self.extract_full_xlsx_content()
+        elif file_extension == '.xls':
+            return self.extract_full_xls_content()
+        return ""
+    
     def extract(self) -> Dict[str, Any]:
         metadata = self.get_common_metadata()
         
@@ -341,7 +458,7 @@ class OfficeExtractor(MetadataExtractor):
             return metadata
         
         try:
-            doc = Document(self.file_path)
+            doc = self._get_docx()
             core_props = doc.core_properties
             
             office_metadata = {}
@@ -397,17 +514,21 @@ class OfficeExtractor(MetadataExtractor):
             logger.warning("python-docx no disponible para extracción de contenido")
             return ""
         
+        full_text = []
         try:
-            doc = Document(self.file_path)
-            full_text = []
+            doc = self._get_docx()
             
             # Todos los párrafos
             for paragraph in doc.paragraphs:
+                if self.budget.expired():
+                    break
                 if paragraph.text.strip():
                     full_text.append(paragraph.text.strip())
             
             # Contenido de tablas
             for table in doc.tables:
+                if self.budget.expired():
+                    break
                 table_text = []
                 for row in table.rows:
                     row_text = []
@@ -437,13 +558,15 @@ class OfficeExtractor(MetadataExtractor):
             except Exception as e:
                 logger.warning(f"Error extrayendo headers/footers: {str(e)}")
             
-            result = '\n'.join(full_text)
-            logger.info(f"DOCX contenido extraído: {len(result)} caracteres")
-            return result
-            
+        except (ExtractionBudgetExceeded, MemoryError) as e:
+            self._note_partial(e, 'DOCX')
         except Exception as e:
             logger.error(f"Error extrayendo contenido completo DOCX: {str(e)}")
             return ""
+        
+        result = '\n'.join(full_text)
+        logger.info(f"DOCX contenido extraído: {len(result)} caracteres")
+        return result
     
     def extract_full_doc_content(self) -> str:
         '''Extrae contenido de archivos DOC legacy'''
@@ -486,22 +609,23 @@ class OfficeExtractor(MetadataExtractor):
             logger.warning("openpyxl no disponible para extracción de contenido XLSX")
             return ""
         
+        sheets_content = []
         try:
-            from django.conf import settings
-            
             # Configuración de límites
-            config = getattr(settings, 'CONTENT_EXTRACTION_SETTINGS', {})
-            max_cells_per_sheet = config.get('MAX_EXCEL_CELLS_PER_SHEET', 1000)
-            max_sheets = config.get('MAX_EXCEL_SHEETS', 10)
+            max_cells_per_sheet = self.budget.max_cells_per_sheet
+            max_sheets = self.budget.max_sheets
             
-            workbook = load_workbook(self.file_path, data_only=True, read_only=True)
-            sheets_content = []
+            workbook = self._get_xlsx_workbook()
             
             # Procesar hojas limitadas
             sheet_names = workbook.sheetnames[:max_sheets]
+            if len(workbook.sheetnames) > max_sheets:
+                self.budget.note('sheets')
             logger.info(f"Procesando {len(sheet_names)} hojas de XLSX: {sheet_names}")
             
             for i, sheet_name in enumerate(sheet_names):
+                if self.budget.expired() or 'memory' in self.budget.limits_reached:
+                    break
                 sheet = workbook[sheet_name]
                 sheet_content = self._extract_xlsx_sheet_content(
                     sheet, sheet_name, max_cells_per_sheet
@@ -509,23 +633,26 @@ class OfficeExtractor(MetadataExtractor):
                 if sheet_content:
                     sheets_content.append(sheet_content)
             
-            # Convertir a texto plano para almacenamiento
-            full_content = "\n\n".join(sheets_content)
-            
             # Cerrar workbook para liberar memoria
             workbook.close()
+            self._xlsx_workbook = None
             
-            logger.info(f"XLSX contenido extraído: {len(full_content)} caracteres de {len(sheets_content)} hojas")
-            return full_content
-            
+        except (ExtractionBudgetExceeded, MemoryError) as e:
+            # El workbook se cierra en close()
+            self._note_partial(e, 'XLSX')
         except Exception as e:
             logger.error(f"Error extrayendo contenido completo XLSX: {str(e)}")
             return ""
+        
+        # Convertir a texto plano para almacenamiento
+        full_content = "\n\n".join(sheets_content)
+        logger.info(f"XLSX contenido extraído: {len(full_content)} caracteres de {len(sheets_content)} hojas")
+        return full_content
     
     def _extract_xlsx_sheet_content(self, sheet, sheet_name: str, max_cells: int) -> str:
         '''Extrae contenido de una hoja XLSX específica'''
+        content_lines = [f"=== HOJA: {sheet_name} ==="]
         try:
-            content_lines = [f"=== HOJA: {sheet_name} ==="]
             cells_processed = 0
             
             # Verificar si la hoja tiene datos
@@ -536,19 +663,31 @@ class OfficeExtractor(MetadataExtractor):
                     return "\n".join(content_lines)
             
             # Procesar filas con datos (limitadas)
-            max_rows = min(sheet.max_row, 100)
-            max_cols = min(sheet.max_column, 50)
+            if sheet.max_row is None or sheet.max_column is None:
+                # Hoja sin <dimension> (read_only): se lee hasta el límite sin recorrerla
+                # entera; las columnas se recortan por fila para no rellenar celdas vacías
+                max_rows, max_cols, col_limit = self.budget.max_rows, self.budget.max_cols, None
+            else:
+                max_rows = min(sheet.max_row, self.budget.max_rows)
+                max_cols = min(sheet.max_column, self.budget.max_cols)
+                col_limit = max_cols
+                if sheet.max_row > max_rows or sheet.max_column > max_cols:
+                    self.budget.note('cells')
             
             for row in sheet.iter_rows(min_row=1, max_row=max_rows, 
-                                      min_col=1, max_col=max_cols):
+                                      min_col=1, max_col=col_limit):
                 if cells_processed >= max_cells:
+                    self.budget.note('cells')
                     content_lines.append(f"... (limitado a {max_cells} celdas)")
                     break
+                if self.budget.expired():
+                    content_lines.append("... (tiempo de extracción agotado)")
+                    break
                     
                 row_data = []
                 has_data = False
                 
-                for cell in row:
+                for cell in row[:max_cols]:
                     if cell.value is not None:
                         has_data = True
                         cell_content = self._format_xlsx_cell_value(cell)
@@ -576,6 +715,11 @@ class OfficeExtractor(MetadataExtractor):
             
             return "\n".join(content_lines)
             
+        except (ExtractionBudgetExceeded, MemoryError) as e:
+            # Las filas ya leídas se conservan; extract_full_xlsx_content no sigue con otras hojas
+            self._note_partial(e, f'hoja XLSX {sheet_name}')
+            content_lines.append("... (presupuesto de extracción agotado)")
+            return "\n".join(content_lines)
         except Exception as e:
             logger.warning(f"Error extrayendo hoja XLSX {sheet_name}: {str(e)}")
             return f"=== HOJA: {sheet_name} === (Error en extracción)"
@@ -614,23 +758,7 @@ class OfficeExtractor(MetadataExtractor):
     
     def _contains_sensitive_pattern(self, text: str) -> bool:
         '''Detecta patrones sensibles en texto de celda'''
-        if not text or len(text.strip()) == 0:
-            return False
-            
-        import re
-        
-        sensitive_patterns = [
-            r'\b\d{1,2}\.\d{3}\.\d{3}-[\dkK]\b',  # RUT chileno
-            r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',  # Email
-            r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b',  # Tarjeta/cuenta
-            r'\b(password|passwd|clave|token|key)',  # Palabras clave sensibles
-            r'\b(\+56|56)?\s?[9]\s?\d{4}\s?\d{4}\b',  # Teléfonos chilenos
-        ]
-        
-        for pattern in sensitive_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                return True
-        return False
+        return contains_sensitive_data(text)
     
     def extract_full_xls_content(self) -> str:
         '''Extrae contenido completo de archivo XLS legacy'''
@@ -659,22 +787,24 @@ class OfficeExtractor(MetadataExtractor):
     def _extract_xls_with_xlrd(self) -> str:
         '''Extrae contenido XLS usando xlrd'''
         import xlrd
-        from django.conf import settings
         
         # Configuración de límites
-        config = getattr(settings, 'CONTENT_EXTRACTION_SETTINGS', {})
-        max_cells_per_sheet = config.get('MAX_EXCEL_CELLS_PER_SHEET', 1000)
-        max_sheets = config.get('MAX_EXCEL_SHEETS', 10)
+        max_cells_per_sheet = self.budget.max_cells_per_sheet
+        max_sheets = self.budget.max_sheets
         
         try:
-            workbook = xlrd.open_workbook(self.file_path)
+            workbook = self._get_xls_workbook()
             sheets_content = []
             
             # Procesar hojas limitadas
             sheet_names = workbook.sheet_names()[:max_sheets]
+            if workbook.nsheets > max_sheets:
+                self.budget.note('sheets')
             logger.info(f"Procesando {len(sheet_names)} hojas de XLS: {sheet_names}")
             
             for sheet_name in sheet_names:
+                if self.budget.expired():
+                    break
                 sheet = workbook.sheet_by_name(sheet_name)
                 sheet_content = self._extract_xls_sheet_content(sheet, sheet_name, max_cells_per_sheet)
                 if sheet_content:
@@ -700,13 +830,19 @@ class OfficeExtractor(MetadataExtractor):
                 return "\n".join(content_lines)
             
             # Procesar filas limitadas
-            max_rows = min(sheet.nrows, 100)
-            max_cols = min(sheet.ncols, 50)
+            max_rows = min(sheet.nrows, self.budget.max_rows)
+            max_cols = min(sheet.ncols, self.budget.max_cols)
+            if sheet.nrows > max_rows or sheet.ncols > max_cols:
+                self.budget.note('cells')
             
             for row_idx in range(max_rows):
                 if cells_processed >= max_cells:
+                    self.budget.note('cells')
                     content_lines.append(f"... (limitado a {max_cells} celdas)")
                     break
+                if self.budget.expired():
+                    content_lines.append("... (tiempo de extracción agotado)")
+                    break
                     
                 row_data = []
                 has_data = False
@@ -753,6 +889,21 @@ class OfficeExtractor(MetadataExtractor):
         except Exception as e:
             return f"[ERROR:{str(e)}]"
     
+    @staticmethod
+    def _xlsx_dimensions(sheet) -> Tuple[int, int]:
+        '''
+        Filas y columnas de una hoja. En modo read_only salen del elemento
+        <dimension> del archivo, que algunos generadores omiten (max_row None):
+        entonces se cuentan recorriendo las filas
+        '''
+        if sheet.max_row is not None and sheet.max_column is not None:
+            return sheet.max_row, sheet.max_column
+
+        max_row = max_column = 0
+        for max_row, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+            max_column = max(max_column, len(values))
+        return max_row, max_column
+
     def _extract_xlsx_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
         '''Extrae metadatos de hojas de cálculo Excel (.xlsx)'''
         if not OPENPYXL_AVAILABLE:
@@ -760,7 +911,7 @@ class OfficeExtractor(MetadataExtractor):
             return metadata
         
         try:
-            workbook = load_workbook(self.file_path, data_only=True)
+            workbook = self._get_xlsx_workbook()
             
             office_metadata = {}
             
@@ -796,11 +947,11 @@ class OfficeExtractor(MetadataExtractor):
             # Información de las hojas
             sheets_info = []
             for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
+                max_row, max_column = self._xlsx_dimensions(workbook[sheet_name])
                 sheets_info.append({
                     'name': sheet_name,
-                    'max_row': sheet.max_row,
-                    'max_column': sheet.max_column
+                    'max_row': max_row,
+                    'max_column': max_column
                 })
             
             metadata['sheets_info'] = sheets_info
@@ -822,7 +973,7 @@ class OfficeExtractor(MetadataExtractor):
             try:
                 import xlrd
                 
-                workbook = xlrd.open_workbook(self.file_path)
+                workbook = self._get_xls_workbook()
                 
                 office_metadata = {
                     'document_type': 'Excel Workbook Legacy (.xls)',
@@ -863,6 +1014,16 @@ class OfficeExtractor(MetadataExtractor):
 class OpenOfficeExtractor(MetadataExtractor):
     '''Extractor especializado para archivos OpenDocument Format (.odt, .ods, .odp)'''
     
+    def _get_odf_document(self):
+        if getattr(self, '_odf_document', None) is None:
+            self._odf_document = load(self.file_path)
+        return self._odf_document
+    
+    def extract_full_content(self) -> str:
+        if os.path.splitext(self.file_path)[1].lower() == '.odt':
+            return self.extract_full_odt_content()
+        return ""
+    
     def extract(self) -> Dict[str, Any]:
         metadata = self.get_common_metadata()
         file_extension = os.path.splitext(self.file_path)[1].lower()
@@ -886,6 +1047,7 @@ class OpenOfficeExtractor(MetadataExtractor):
     
     def extract_full_odt_content(self) -> str:
         '''Extrae texto completo del documento ODT'''
+        full_text = []
         try:
             if not ODFPY_AVAILABLE:
                 logger.warning("odfpy no disponible para extracción de contenido ODT")
@@ -894,8 +1056,7 @@ class OpenOfficeExtractor(MetadataExtractor):
             from odf.opendocument import load
             from odf import text, table
             
-            doc = load(self.file_path)
-            full_text = []
+            doc = self._get_odf_document()
             
             # Obtener todos los elementos de texto
             all_text_elements = []
@@ -903,6 +1064,8 @@ class OpenOfficeExtractor(MetadataExtractor):
             all_text_elements.extend(doc.getElementsByType(text.P))  # Paragraphs
             
             for element in all_text_elements:
+                if self.budget.expired():
+                    break
                 element_text = self._extract_element_text(element)
                 if element_text.strip():
                     full_text.append(element_text.strip())
@@ -910,19 +1073,23 @@ class OpenOfficeExtractor(MetadataExtractor):
             # Texto de tablas
             tables = doc.getElementsByType(table.Table)
             for table_elem in tables:
+                if self.budget.expired():
+                    break
                 table_text = self._extract_full_table_text(table_elem)
                 if table_text:
                     full_text.append("=== TABLA ===")
                     full_text.append(table_text)
                     full_text.append("=== FIN TABLA ===")
             
-            result = '\n'.join(full_text)
-            logger.info(f"ODT contenido extraído: {len(result)} caracteres")
-            return result
-            
+        except (ExtractionBudgetExceeded, MemoryError) as e:
+            self._note_partial(e, 'ODT')
         except Exception as e:
             logger.error(f"Error extrayendo contenido completo ODT: {str(e)}")
             return ""
+        
+        result = '\n'.join(full_text)
+        logger.info(f"ODT contenido extraído: {len(result)} caracteres")
+        return result
     
     def _extract_full_table_text(self, table_elem) -> str:
         '''Extrae todo el texto de una tabla ODT'''
@@ -953,7 +1120,7 @@ class OpenOfficeExtractor(MetadataExtractor):
         
         try:
             # Cargar documento ODF
-            doc = load(self.file_path)
+            doc = self._get_odf_document()
             
             # Extraer metadatos comunes
             doc_meta = self._extract_document_metadata(doc)
@@ -1487,7 +1654,8 @@ class HTMLExtractor(MetadataExtractor):
 
 
 # Factory function para obtener el extractor apropiado
-def get_metadata_extractor(file_path: str, file_url: str = None, referrer: str = None) -> MetadataExtractor:
+def get_metadata_extractor(file_path: str, file_url: str = None, referrer: str = None,
+                           budget: ExtractionBudget = None, file_hash: str = None) -> MetadataExtractor:
     '''
     Factory function que retorna el extractor apropiado según el tipo de archivo
     '''
@@ -1495,29 +1663,58 @@ def get_metadata_extractor(file_path: str, file_url: str = None, referrer: str =
     
     # Mapeo de extensiones a extractores
     if file_extension == '.pdf':
-        return PDFExtractor(file_path, file_url, referrer)
+        return PDFExtractor(file_path, file_url, referrer, budget, file_hash)
     elif file_extension in ['.jpg', '.jpeg', '.png', '.tiff', '.gif']:
-        return ImageExtractor(file_path, file_url, referrer)
+        return ImageExtractor(file_path, file_url, referrer, budget, file_hash)
     elif file_extension in ['.docx', '.xlsx', '.pptx', '.xls', '.doc', '.ppt']:
-        return OfficeExtractor(file_path, file_url, referrer)
+        return OfficeExtractor(file_path, file_url, referrer, budget, file_hash)
     elif file_extension in ['.odt', '.ods', '.odp']:
-        return OpenOfficeExtractor(file_path, file_url, referrer)
+        return OpenOfficeExtractor(file_path, file_url, referrer, budget, file_hash)
     elif file_extension in ['.mp3', '.mp4']:
-        return MultimediaExtractor(file_path, file_url, referrer)
+        return MultimediaExtractor(file_path, file_url, referrer, budget, file_hash)
     elif file_extension in ['.html', '.htm']:
-        return HTMLExtractor(file_path, file_url, referrer)
+        return HTMLExtractor(file_path, file_url, referrer, budget, file_hash)
     else:
         # Extractor genérico para otros tipos
-        return MetadataExtractor(file_path, file_url, referrer)
+        return MetadataExtractor(file_path, file_url, referrer, budget, file_hash)
+
+
+def extract_document(file_path: str, file_url: str = None, referrer: str = None,
+                     file_hash: str = None, budget: ExtractionBudget = None) -> Dict[str, Any]:
+    '''
+    Extrae metadatos, vista previa y contenido completo de un archivo
+    parseándolo una sola vez. file_hash evita volver a leer el archivo para
+    calcular el SHA-256 si ya se conoce (CrawlResult.file_hash).
+    '''
+    try:
+        extractor = get_metadata_extractor(file_path, file_url, referrer, budget, file_hash)
+        return extractor.extract_all()
+    except Exception as e:
+        logger.error(f"Error en extracción de {file_path}: {str(e)}")
+        return {
+            'metadata': {
+                'file_path': file_path,
+                'file_url': file_url,
+                'referrer': referrer,
+                'extraction_error': str(e),
+                'extracted_at': datetime.now().isoformat(),
+            },
+            'preview': '',
+            'full_content': '',
+        }
 
 
-def extract_metadata_from_file(file_path: str, file_url: str = None, referrer: str = None) -> Dict[str, Any]:
+def extract_metadata_from_file(file_path: str, file_url: str = None, referrer: str = None,
+                               budget: ExtractionBudget = None) -> Dict[str, Any]:
     '''
     Función principal para extraer metadatos de cualquier archivo
     '''
     try:
-        extractor = get_metadata_extractor(file_path, file_url, referrer)
-        return extractor.extract()
+        extractor = get_metadata_extractor(file_path, file_url, referrer, budget)
+        try:
+            return extractor.extract()
+        finally:
+            extractor.close()
     except Exception as e:
         logger.error(f"Error en extracción de metadatos para {file_path}: {str(e)}")
         return {
@@ -1529,33 +1726,19 @@ def extract_metadata_from_file(file_path: str, file_url: str = None, referrer: s
         }
 
 
-def extract_full_content_from_file(file_path: str) -> str:
+def extract_full_content_from_file(file_path: str, budget: ExtractionBudget = None) -> str:
     '''Extrae contenido completo de un archivo según su tipo'''
     try:
-        file_extension = os.path.splitext(file_path)[1].lower()
+        extractor = get_metadata_extractor(file_path, budget=budget)
+        try:
+            content = extractor.extract_full_content()
+        finally:
+            extractor.close()
         
-        if file_extension == '.pdf':
-            extractor = PDFExtractor(file_path)
-            return extractor.extract_full_content()
-        elif file_extension == '.docx':
-            extractor = OfficeExtractor(file_path)
-            return extractor.extract_full_docx_content()
-        elif file_extension == '.doc':
-            extractor = OfficeExtractor(file_path)
-            return extractor.extract_full_doc_content()
-        elif file_extension == '.odt':
-            extractor = OpenOfficeExtractor(file_path)
-            return extractor.extract_full_odt_content()
-        # NUEVOS: Soporte para Excel
-        elif file_extension == '.xlsx':
-            extractor = OfficeExtractor(file_path)
-            return extractor.extract_full_xlsx_content()
-        elif file_extension == '.xls':
-            extractor = OfficeExtractor(file_path)
-            return extractor.extract_full_xls_content()
-        else:
+        file_extension = os.path.splitext(file_path)[1].lower()
+        if file_extension not in ('.pdf', '.docx', '.doc', '.odt', '.xlsx', '.xls'):
             logger.info(f"Tipo de archivo no soportado para extracción completa: {file_extension}")
-            return ""
+        return content
             
     except Exception as e:
         logger.error(f"Error extrayendo contenido completo de {file_path}: {str(e)}")
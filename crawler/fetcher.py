@@ -0,0 +1,320 @@
+# crawler/fetcher.py
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+from .storage import CHUNK_SIZE, FileTooLarge, ResponseBody
+
+logger = logging.getLogger('crawler')
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+    logger.warning("aiohttp no disponible. Instalar con: pip install aiohttp")
+
+
+class AsyncRateLimiter:
+    '''
+    Rate limiting para el motor asíncrono: espacia el inicio de cada request
+    según el rate limit de la sesión sin bloquear el event loop
+    '''
+    def __init__(self, rate_limit: float):
+        self.rate_limit = rate_limit  # requests per second
+        self._next_slot = 0.0
+
+    async def wait(self):
+        if self.rate_limit <= 0:
+            return
+
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1.0 / self.rate_limit
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncFetchEngine:
+    '''
+    Motor de descarga asíncrono para una sesión de crawling.
+
+    Mantiene hasta `concurrency` requests en vuelo sobre un único event loop y
+    delega el acceso a la base de datos en callbacks síncronos:
+
+    - claim(limit): reserva hasta `limit` URLs pendientes y las retorna
+    - release(items): devuelve a la cola URLs reservadas que no se procesaron
+    - open_body(item, headers): ResponseBody donde leer una respuesta 200, o
+      None si ya se sabe que supera el tamaño máximo (sin acceso a la base de datos)
+    - on_response(item, status_code, headers, body, response_time)
+    - on_error(item, exception)
+    - should_continue(): False si la sesión dejó de estar en ejecución
+
+    host_limiter (opcional) es un politeness.HostRateLimiter: cada request
+    reserva su turno en el host antes de enviarse y su respuesta ajusta el
+    ritmo. Si el turno de un host cae fuera del tiempo asignado, sus URLs se
+    apartan hasta el final del ciclo y se siguen procesando los demás hosts.
+    '''
+
+    def __init__(self, claim: Callable, release: Callable, on_response: Callable,
+                 on_error: Callable, should_continue: Callable,
+                 open_body: Callable = None, host_limiter=None,
+                 concurrency: int = 100, rate_limit: float = 1.0,
+                 headers: Dict[str, str] = None, timeout: float = 30,
+                 follow_redirects: bool = True,
+                 time_budget: float = 240, idle_timeout: float = 10,
+                 poll_interval: float = 0.5, keepalive_timeout: float = 30):
+        self.concurrency = max(1, concurrency)
+        self.limiter = AsyncRateLimiter(rate_limit)
+        self.host_limiter = host_limiter
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.follow_redirects = follow_redirects
+        self.time_budget = time_budget
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.keepalive_timeout = keepalive_timeout
+
+        self._claim = sync_to_async(claim)
+        self._release = sync_to_async(release)
+        self._on_response = sync_to_async(on_response)
+        self._on_error = sync_to_async(on_error)
+        self._should_continue = sync_to_async(should_continue)
+        self._open_body = open_body or (lambda item, headers: ResponseBody(keep_in_memory=True))
+        if host_limiter is not None:
+            self._reserve = sync_to_async(host_limiter.reserve)
+            self._record = sync_to_async(host_limiter.record)
+            self._blocked_for = sync_to_async(host_limiter.blocked_for)
+
+        self._deadline = 0.0
+        # URLs apartadas por host en espera (Retry-After) y hasta cuándo espera cada host
+        self._parked: Dict[str, List] = {}
+        self._parked_until: Dict[str, float] = {}
+        self.max_parked = self.concurrency * 10
+
+        self.in_flight = 0
+        self.stats = {
+            'fetched': 0,
+            'errors': 0,
+            'released': 0,
+            'stopped': False,     # la sesión dejó de estar en ejecución
+            'exhausted': False,   # no quedan URLs por procesar
+            'deferred': 0.0,      # segundos hasta que el primer host apartado vuelva a aceptar requests
+        }
+
+    async def run(self) -> Dict[str, Any]:
+        '''Ejecuta el motor hasta agotar la cola, detener la sesión o consumir el tiempo asignado'''
+        if not AIOHTTP_AVAILABLE:
+            raise RuntimeError('aiohttp no disponible para el motor asíncrono')
+
+        loop = asyncio.get_running_loop()
+        deadline = self._deadline = loop.time() + self.time_budget
+        queue: asyncio.Queue = asyncio.Queue()
+
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.concurrency,
+            keepalive_timeout=self.keepalive_timeout,
+            ssl=False,  # Igual que verify=False en requests
+        )
+        client_timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=client_timeout,
+                                             headers=self.headers) as http:
+                workers = [
+                    asyncio.create_task(self._worker(http, queue))
+                    for _ in range(self.concurrency)
+                ]
+                try:
+                    await self._feed(queue, deadline)
+                finally:
+                    await self._shutdown(queue, workers)
+        finally:
+            await sync_to_async(connections.close_all)()
+
+        return self.stats
+
+    async def _feed(self, queue: asyncio.Queue, deadline: float):
+        '''Mantiene la cola interna abastecida con URLs reservadas'''
+        loop = asyncio.get_running_loop()
+        idle_since = None
+        next_status_check = 0.0
+
+        while loop.time() < deadline:
+            now = loop.time()
+            if now >= next_status_check:
+                if not await self._should_continue():
+                    self.stats['stopped'] = True
+                    return
+                next_status_check = now + 2.0
+
+            # Reservar solo lo que el rate limit permite procesar pronto
+            rate = self.limiter.rate_limit
+            horizon = self.concurrency if rate <= 0 else max(1, int(rate * self.poll_interval * 4))
+            wanted = min(self.concurrency, horizon) - queue.qsize()
+            if sum(len(items) for items in self._parked.values()) >= self.max_parked:
+                wanted = 0
+
+            items = await self._claim(wanted) if wanted > 0 else []
+            for item in items:
+                queue.put_nowait(item)
+
+            if items or self.in_flight or not queue.empty():
+                idle_since = None
+            elif idle_since is None:
+                idle_since = now
+            elif now - idle_since >= self.idle_timeout:
+                # Con URLs apartadas quedan pendientes para el próximo ciclo
+                self.stats['exhausted'] = not self._parked
+                return
+
+            await asyncio.sleep(self.poll_interval)
+
+    async def _shutdown(self, queue: asyncio.Queue, workers: List[asyncio.Task]):
+        '''Devuelve a la cola lo no procesado y espera a los requests en vuelo'''
+        pending = []
+        while not queue.empty():
+            pending.append(queue.get_nowait())
+            queue.task_done()
+
+        for _ in workers:
+            queue.put_nowait(None)
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        if self._parked_until:
+            loop = asyncio.get_running_loop()
+            self.stats['deferred'] = max(min(self._parked_until.values()) - loop.time(), 0.0)
+        for items in self._parked.values():
+            pending.extend(items)
+        self._parked.clear()
+
+        if pending:
+            await self._release(pending)
+            self.stats['released'] += len(pending)
+
+    async def _worker(self, http, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                self.in_flight += 1
+                try:
+                    await self.limiter.wait()
+                    if not await self._wait_for_host(item):
+                        continue
+                    await self._fetch(http, item)
+                finally:
+                    self.in_flight -= 1
+            except Exception as e:
+                logger.error(f'Error en worker asíncrono: {str(e)}')
+            finally:
+                queue.task_done()
+
+    async def _wait_for_host(self, item) -> bool:
+        '''
+        Espera el turno del host de item. Si no alcanza dentro del tiempo
+        asignado, aparta item (se devuelve a la cola al terminar el ciclo) y
+        retorna False.
+        '''
+        if self.host_limiter is None:
+            return True
+
+        loop = asyncio.get_running_loop()
+        host = urlsplit(item.url).netloc.lower()
+        while True:
+            if host in self._parked:
+                self._parked[host].append(item)
+                return False
+
+            remaining = self._deadline - loop.time()
+            delay = await self._reserve(item.url, max(remaining, 0))
+            if delay > remaining:
+                # El host pidió esperar más allá de este ciclo: solo sus URLs quedan apartadas
+                self._parked.setdefault(host, []).append(item)
+                self._parked_until[host] = loop.time() + delay
+                return False
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            # Un 429/503 recibido durante la espera invalida el turno: se reserva otro
+            if await self._blocked_for(item.url) <= 0:
+                return True
+
+    async def _fetch(self, http, item):
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+
+        try:
+            async with http.get(item.url, allow_redirects=self.follow_redirects) as response:
+                if self.host_limiter is not None:
+                    # Latencia hasta los headers: no depende del tamaño del archivo
+                    await self._record(item.url, response.status, loop.time() - start_time, response.headers)
+
+                body = None
+                if response.status == 200:
+                    body = await self._read_body(item, response)
+                response_time = loop.time() - start_time
+
+                try:
+                    await self._on_response(item, response.status, response.headers, body, response_time)
+                except Exception:
+                    if body is not None:
+                        body.discard()
+                    raise
+                self.stats['fetched'] += 1
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if self.host_limiter is not None and isinstance(e, asyncio.TimeoutError):
+                await self._record(item.url, None, None)
+            await self._fail(item, e)
+        except Exception as e:
+            # URL de redirección inválida, errores de decodificación o de los callbacks:
+            # la URL no puede quedar en 'processing'
+            logger.error(f'Error inesperado procesando {item.url}: {str(e)}')
+            await self._fail(item, e)
+
+    async def _fail(self, item, error: Exception):
+        '''Registra el error de item; si on_error también falla, item vuelve a la cola'''
+        self.stats['errors'] += 1
+        try:
+            await self._on_error(item, error)
+        except Exception as e:
+            logger.error(f'Error registrando el fallo de {item.url}: {str(e)}')
+            await self._release([item])
+            self.stats['released'] += 1
+
+    async def _read_body(self, item, response) -> Optional[ResponseBody]:
+        '''
+        Lee el cuerpo por bloques respetando el tamaño máximo. Retorna None si lo
+        supera. La escritura a disco corre en el executor del loop para que una
+        descarga grande no frene a los demás requests en vuelo.
+        '''
+        loop = asyncio.get_running_loop()
+        body = await loop.run_in_executor(None, self._open_body, item, response.headers)
+        if body is None:
+            return None
+
+        async def run_io(func, *args):
+            if body.on_disk:
+                return await loop.run_in_executor(None, func, *args)
+            return func(*args)
+
+        try:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                await run_io(body.feed, chunk)
+        except FileTooLarge:
+            await run_io(body.discard)
+            return None
+        except BaseException:
+            body.discard()
+            raise
+
+        return await run_io(body.finish)
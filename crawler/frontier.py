@@ -0,0 +1,164 @@
+# crawler/frontier.py
+import logging
+import time
+from typing import Iterable, List, Optional
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger('crawler')
+
+# Separación entre niveles de prioridad en el score (los milisegundos de
+# discovered_at caben de sobra sin perder precisión en un double)
+PRIORITY_WEIGHT = 10 ** 13
+
+# Segundos durante los que se recuerda el resultado del último ping a Redis
+AVAILABILITY_TTL = 30
+
+_redis_client = None
+_available = None
+_checked_at = 0.0
+
+
+def get_redis_client() -> redis.Redis:
+    '''Cliente Redis compartido (el mismo servidor que usa Celery como broker)'''
+    global _redis_client
+    if _redis_client is None:
+        redis_url = settings.CRAWLER_SETTINGS.get('REDIS_URL') or settings.CELERY_BROKER_URL
+        _redis_client = redis.Redis.from_url(redis_url, socket_timeout=10, socket_connect_timeout=5)
+    return _redis_client
+
+
+class URLFrontier:
+    '''
+    Frontera de URLs pendientes de una sesión, almacenada en un sorted set de
+    Redis con score (prioridad, fecha de descubrimiento). Los miembros son IDs
+    de URLQueue: la tabla sigue siendo el registro durable y la frontera solo
+    decide qué se procesa a continuación.
+    '''
+
+    def __init__(self, session_id: int, client: redis.Redis = None):
+        self.session_id = session_id
+        self.client = client or get_redis_client()
+        self.key = f'fisgon:frontier:{session_id}'
+
+    @staticmethod
+    def score(priority: int, discovered_at) -> float:
+        return priority * PRIORITY_WEIGHT + int(discovered_at.timestamp() * 1000)
+
+    def push(self, url_items: Iterable) -> int:
+        '''Agrega URLQueue (o tuplas id, priority, discovered_at) a la frontera'''
+        mapping = {}
+        for item in url_items:
+            if isinstance(item, tuple):
+                item_id, priority, discovered_at = item
+            else:
+                item_id, priority, discovered_at = item.id, item.priority, item.discovered_at
+            mapping[item_id] = self.score(priority, discovered_at)
+
+        if not mapping:
+            return 0
+        return self.client.zadd(self.key, mapping, nx=True)
+
+    def pop(self, count: int) -> List[int]:
+        '''Extrae de forma atómica las `count` URLs de mayor prioridad'''
+        if count <= 0:
+            return []
+        return [int(member) for member, _ in self.client.zpopmin(self.key, count)]
+
+    def wait_pop(self, timeout: float) -> Optional[int]:
+        '''Bloquea hasta `timeout` segundos esperando una URL nueva'''
+        popped = self.client.bzpopmin(self.key, timeout=timeout)
+        if not popped:
+            return None
+        _, member, _ = popped
+        return int(member)
+
+    def size(self) -> int:
+        return self.client.zcard(self.key)
+
+    def clear(self):
+        self.client.delete(self.key)
+
+    def rebuild(self, batch_size: int = 10000) -> int:
+        '''Reconstruye la frontera desde las URLs pendientes en la base de datos'''
+        from .models import URLQueue
+
+        self.clear()
+        rows = URLQueue.objects.filter(
+            session_id=self.session_id,
+            status='pending'
+        ).values_list('id', 'priority', 'discovered_at').iterator(chunk_size=batch_size)
+
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                total += self.push(batch)
+                batch = []
+        total += self.push(batch)
+        return total
+
+    def sync(self) -> bool:
+        '''Reconstruye la frontera si no coincide con las URLs pendientes en URLQueue'''
+        from .models import URLQueue
+
+        pending = URLQueue.objects.filter(session_id=self.session_id, status='pending').count()
+        if pending == self.size():
+            return False
+
+        self.rebuild()
+        return True
+
+
+def redis_available() -> bool:
+    '''Resultado del último ping a Redis (se repite cada AVAILABILITY_TTL segundos)'''
+    global _available, _checked_at
+    now = time.monotonic()
+    if _available is None or now - _checked_at > AVAILABILITY_TTL:
+        try:
+            get_redis_client().ping()
+            _available = True
+        except redis.RedisError as e:
+            if _available is not False:
+                logger.warning(f'Redis no disponible (frontera y progreso en vivo deshabilitados): {str(e)}')
+            _available = False
+        _checked_at = now
+    return _available
+
+
+def get_frontier(session_id: int) -> Optional[URLFrontier]:
+    '''
+    Retorna la frontera Redis de la sesión, o None si está deshabilitada o Redis
+    no responde (en ese caso se planifica directamente desde URLQueue)
+    '''
+    if settings.CRAWLER_SETTINGS.get('FRONTIER_BACKEND', 'redis') != 'redis':
+        return None
+
+    return URLFrontier(session_id) if redis_available() else None
+
+
+def discard_frontier(session_id: int):
+    '''Elimina la frontera de una sesión finalizada o cancelada'''
+    frontier = get_frontier(session_id)
+    if frontier is None:
+        return
+
+    try:
+        frontier.clear()
+    except redis.RedisError as e:
+        logger.warning(f'No se pudo eliminar la frontera de la sesión {session_id}: {str(e)}')
+
+
+def enqueue_urls(session_id: int, url_items: Iterable):
+    '''Publica URLs recién creadas en la frontera. Los fallos no son críticos'''
+    frontier = get_frontier(session_id)
+    if frontier is None:
+        return
+
+    try:
+        frontier.push(url_items)
+    except redis.RedisError as e:
+        # Se recuperan al reconstruir la frontera desde URLQueue
+        logger.warning(f'No se pudieron publicar URLs en la frontera de la sesión {session_id}: {str(e)}')
@@ -0,0 +1,91 @@
+# crawler/http_client.py
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger('crawler')
+
+# Bytes máximos que se leen de una respuesta descartada para devolver el socket al pool
+DRAIN_LIMIT = 64 * 1024
+
+# Un requests.Session por CrawlSession dentro de cada proceso worker
+_http_sessions: 'OrderedDict[int, requests.Session]' = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_request_headers() -> Dict[str, str]:
+    '''Headers HTTP comunes a todas las descargas del crawler'''
+    return {
+        'User-Agent': settings.CRAWLER_SETTINGS['USER_AGENT'],
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'es-ES,es;q=0.8,en-US;q=0.5,en;q=0.3',
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+    }
+
+
+def get_http_session(crawl_session_id: int) -> requests.Session:
+    '''
+    Retorna el requests.Session asociado a una sesión de crawling, creándolo si
+    no existe. Las conexiones (y el handshake TLS) se reutilizan entre requests
+    al mismo host mientras el worker siga vivo.
+    '''
+    with _lock:
+        http = _http_sessions.get(crawl_session_id)
+        if http is not None:
+            _http_sessions.move_to_end(crawl_session_id)
+            return http
+
+        crawler_settings = settings.CRAWLER_SETTINGS
+        pool_size = crawler_settings.get('HTTP_POOL_SIZE', 20)
+
+        http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=0,  # Los reintentos los gestiona el crawler
+        )
+        http.mount('http://', adapter)
+        http.mount('https://', adapter)
+        http.headers.update(get_request_headers())
+        http.verify = False  # Deshabilitar verificación SSL para evitar errores de certificado
+
+        _http_sessions[crawl_session_id] = http
+
+        # Limitar sesiones abiertas por proceso: cerrar la usada hace más tiempo
+        max_sessions = crawler_settings.get('HTTP_POOL_MAX_SESSIONS', 8)
+        while len(_http_sessions) > max_sessions:
+            _, oldest = _http_sessions.popitem(last=False)
+            oldest.close()
+
+        return http
+
+
+def close_http_session(crawl_session_id: int):
+    '''Cierra las conexiones abiertas para una sesión de crawling en este proceso'''
+    with _lock:
+        http = _http_sessions.pop(crawl_session_id, None)
+    if http is not None:
+        http.close()
+
+
+def release_response(response: requests.Response):
+    '''
+    Libera una respuesta obtenida con stream=True. Si el cuerpo pendiente es
+    pequeño se consume para que la conexión vuelva al pool en lugar de cerrarse.
+    '''
+    try:
+        if not response.raw.closed:
+            content_length = response.headers.get('content-length')
+            if content_length and content_length.isdigit() and int(content_length) <= DRAIN_LIMIT:
+                response.content  # Consumir el cuerpo pendiente
+    except Exception as e:
+        logger.debug(f'No se pudo drenar la respuesta de {response.url}: {str(e)}')
+    finally:
+        response.close()
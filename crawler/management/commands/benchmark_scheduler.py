@@ -0,0 +1,133 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from crawler.models import CrawlSession, URLQueue
+
+
+class Rollback(Exception):
+    '''Descarta los datos de prueba al terminar'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la consulta del planificador (URLs pendientes por prioridad) con '
+        'colas crecientes. Los datos se crean en una transacción que se revierte'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=str,
+            default='10000,100000,1000000',
+            help='Tamaños de cola a medir, separados por coma',
+        )
+        parser.add_argument(
+            '--pending-ratio',
+            type=float,
+            default=0.1,
+            help='Fracción de URLs en estado pendiente (el resto ya procesadas)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='URLs por lote del planificador (DISPATCH_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Repeticiones de la consulta por tamaño',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes debe ser una lista de enteros separados por coma')
+
+        try:
+            with transaction.atomic():
+                self._run(sizes, options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _run(self, sizes, options):
+        user = User.objects.create(username=f'benchmark-{int(time.time())}')
+        session = CrawlSession.objects.create(
+            name='Benchmark planificador',
+            user=user,
+            target_domain='benchmark.local',
+            target_url='http://benchmark.local/',
+        )
+        # Otra sesión con la misma cantidad de URLs: el índice debe aislar por sesión
+        other = CrawlSession.objects.create(
+            name='Benchmark (otra sesión)',
+            user=user,
+            target_domain='other.local',
+            target_url='http://other.local/',
+        )
+
+        self.stdout.write(f'{"URLs":>10} {"pendientes":>10} {"media ms":>9} {"p95 ms":>8}')
+        created = 0
+        for size in sizes:
+            self._populate(session, created, size, options['pending_ratio'])
+            self._populate(other, created, size, options['pending_ratio'])
+            created = size
+
+            timings = self._measure(session, options['limit'], options['repeat'])
+            pending = URLQueue.objects.filter(session=session, status='pending').count()
+            mean = sum(timings) / len(timings)
+            p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+            self.stdout.write(f'{size:>10} {pending:>10} {mean:>9.3f} {p95:>8.3f}')
+
+        self.stdout.write('\nPlan de la consulta:')
+        for line in self._explain(session, options['limit']):
+            self.stdout.write(f'  {line}')
+
+    def _populate(self, session, start, end, pending_ratio, batch_size=10000):
+        statuses = ['completed', 'failed', 'skipped']
+        base_time = timezone.now() - timedelta(days=1)
+
+        for batch_start in range(start, end, batch_size):
+            batch = []
+            for i in range(batch_start, min(batch_start + batch_size, end)):
+                pending = random.random() < pending_ratio
+                batch.append(URLQueue(
+                    session=session,
+                    url=f'{session.target_url}page/{i}',
+                    depth=i % 5,
+                    priority=random.randint(1, 4),
+                    status='pending' if pending else random.choice(statuses),
+                    discovered_at=base_time + timedelta(milliseconds=i),
+                ))
+            URLQueue.objects.bulk_create(batch, batch_size=1000)
+
+    def _scheduler_query(self, session, limit):
+        # Misma forma que process_url_queue / claim_pending_urls
+        return URLQueue.objects.filter(
+            session=session,
+            status='pending'
+        ).order_by('priority', 'discovered_at').values_list('id', flat=True)[:limit]
+
+    def _measure(self, session, limit, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(self._scheduler_query(session, limit))
+            timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings)
+
+    def _explain(self, session, limit):
+        sql, params = self._scheduler_query(session, limit).query.sql_with_params()
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
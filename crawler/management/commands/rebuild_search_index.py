@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crawler.models import CrawlResult
+from crawler.search import rebuild_search_index, remove_from_index, search_backend
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye el índice de texto completo de los resultados (todas las '
+        'sesiones o una). Necesario para resultados extraídos antes del índice'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--session',
+            type=int,
+            help='Reindexar solo esta sesión',
+        )
+
+    def handle(self, *args, **options):
+        if search_backend() is None:
+            raise CommandError('La base de datos actual no tiene índice de texto completo (SQLite o PostgreSQL)')
+
+        results = CrawlResult.objects.order_by('id')
+        if options['session']:
+            results = results.filter(session_id=options['session'])
+            remove_from_index(session_id=options['session'])
+
+        started = time.perf_counter()
+        indexed = rebuild_search_index(results)
+        self.stdout.write(self.style.SUCCESS(
+            f'{indexed} resultados indexados en {time.perf_counter() - started:.1f} s'
+        ))
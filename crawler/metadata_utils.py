@@ -2,114 +2,186 @@
 from typing import Dict, List, Any, Set, Tuple
 from collections import defaultdict, Counter
 from datetime import datetime, timedelta
+import json
+import math
 import re
 import logging
 
 logger = logging.getLogger('crawler')
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Distancia máxima (en grados, ~1 km) entre una coordenada y el origen de su cluster
+CLUSTER_DISTANCE = 0.01
+
+# Coordenadas incluidas en el análisis; la lista completa se consulta paginada
+MAX_COORDINATES = 500
+MAX_CLUSTER_COORDINATES = 50
+
+
+# Contadores que forman los agregados de metadatos de una sesión
+AGGREGATE_COUNTERS = ('authors', 'creators', 'modifiers', 'software', 'versions', 'creation_days', 'gps')
+
+
+def empty_aggregates() -> Dict[str, Any]:
+    return {'results': 0, **{name: {} for name in AGGREGATE_COUNTERS}}
+
+
+def merge_aggregates(target: Dict[str, Any], delta: Dict[str, Any], sign: int = 1) -> Dict[str, Any]:
+    """
+    Suma (sign=1) o resta (sign=-1) los agregados delta sobre target. Los
+    contadores son combinables: el resultado no depende del orden en que se
+    procesaron los archivos.
+    """
+    target['results'] = target.get('results', 0) + sign * delta.get('results', 0)
+
+    for name in AGGREGATE_COUNTERS:
+        counter = target.setdefault(name, {})
+        for key, count in delta.get(name, {}).items():
+            value = counter.get(key, 0) + sign * count
+            if value > 0:
+                counter[key] = value
+            else:
+                counter.pop(key, None)
+
+    return target
+
 
 class MetadataAnalyzer:
-    """Analizador de metadatos extraídos para identificar patrones y riesgos"""
+    """
+    Analizador de metadatos extraídos para identificar patrones y riesgos.
+
+    Los metadatos se reducen a agregados combinables (ver merge_aggregates) y
+    los análisis trabajan sobre ellos, no sobre cada resultado: se puede
+    construir a partir de resultados (crawl_results) o de agregados ya
+    guardados (aggregates).
+    """
     
-    def __init__(self, crawl_results):
+    def __init__(self, crawl_results=None, aggregates: Dict[str, Any] = None):
         self.crawl_results = crawl_results
+        self.aggregates = aggregates
         self.analysis_results = {}
+
+    def collect(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Aporte de los metadatos de un resultado a los agregados de la sesión"""
+        aggregates = empty_aggregates()
+        if not metadata:
+            return aggregates
+
+        aggregates['results'] = 1
+
+        def add(counter: str, key: str):
+            aggregates[counter][key] = aggregates[counter].get(key, 0) + 1
+
+        for category in ['pdf_metadata', 'office_metadata']:
+            cat_data = metadata.get(category)
+            if not isinstance(cat_data, dict):
+                continue
+
+            # Autores
+            for field, counter in [('author', 'authors'), ('creator', 'creators'), ('last_modified_by', 'modifiers')]:
+                if cat_data.get(field):
+                    add(counter, self._clean_author_name(cat_data[field]))
+
+            # Fechas de creación
+            for date_field in ['creation_date', 'created', 'datetime_original']:
+                if cat_data.get(date_field):
+                    parsed_date = self._parse_date(str(cat_data[date_field]))
+                    if parsed_date:
+                        add('creation_days', parsed_date.date().isoformat())
+
+        for category in ['pdf_metadata', 'office_metadata', 'exif_metadata']:
+            cat_data = metadata.get(category)
+            if not isinstance(cat_data, dict):
+                continue
+
+            # Software/Producer/Creator que indique herramientas
+            for field in ['producer', 'creator', 'software', 'encoding_software']:
+                if cat_data.get(field):
+                    software_info = str(cat_data[field])
+                    add('software', software_info)
+
+                    # Extraer versión si es posible
+                    version = self._extract_version(software_info)
+                    if version:
+                        add('versions', json.dumps([software_info, version]))
+
+        # Coordenadas GPS en metadatos EXIF
+        gps_data = metadata.get('exif_metadata', {}).get('gps_coordinates') if isinstance(metadata.get('exif_metadata'), dict) else None
+        if isinstance(gps_data, dict) and 'latitude' in gps_data and 'longitude' in gps_data:
+            add('gps', json.dumps([gps_data['latitude'], gps_data['longitude']]))
+
+        return aggregates
+
+    def build_aggregates(self) -> Dict[str, Any]:
+        """Agregados de todos los resultados (una sola pasada)"""
+        aggregates = empty_aggregates()
+        for result in self.crawl_results:
+            merge_aggregates(aggregates, self.collect(result.metadata))
+        return aggregates
     
     def analyze_all(self) -> Dict[str, Any]:
         """Ejecuta todos los análisis disponibles"""
+        if self.aggregates is None:
+            self.aggregates = self.build_aggregates()
+
+        # Los riesgos se evalúan sobre los análisis anteriores
         self.analysis_results = {
             'authors_analysis': self.analyze_authors(),
             'software_analysis': self.analyze_software(),
             'temporal_analysis': self.analyze_temporal_patterns(),
             'location_analysis': self.analyze_location_data(),
-            'risk_assessment': self.assess_security_risks(),
-            'privacy_assessment': self.assess_privacy_risks(),
         }
+        self.analysis_results['risk_assessment'] = self.assess_security_risks()
+        self.analysis_results['privacy_assessment'] = self.assess_privacy_risks()
         return self.analysis_results
     
     def analyze_authors(self) -> Dict[str, Any]:
         """Analiza patrones de autores en los documentos"""
-        authors = []
-        creators = []
-        last_modified_by = []
-        
-        for result in self.crawl_results:
-            metadata = result.metadata
-            
-            # Extraer autores de diferentes tipos de archivos
-            for category in ['pdf_metadata', 'office_metadata']:
-                if category in metadata:
-                    cat_data = metadata[category]
-                    
-                    if 'author' in cat_data and cat_data['author']:
-                        authors.append(self._clean_author_name(cat_data['author']))
-                    
-                    if 'creator' in cat_data and cat_data['creator']:
-                        creators.append(self._clean_author_name(cat_data['creator']))
-                    
-                    if 'last_modified_by' in cat_data and cat_data['last_modified_by']:
-                        last_modified_by.append(self._clean_author_name(cat_data['last_modified_by']))
-        
-        # Contar frecuencias
-        author_counts = Counter(authors)
-        creator_counts = Counter(creators)
-        modifier_counts = Counter(last_modified_by)
+        author_counts = self._counter('authors')
+        creator_counts = self._counter('creators')
+        modifier_counts = self._counter('modifiers')
         
         # Identificar usuarios muy activos (posible riesgo)
-        high_activity_threshold = max(3, len(self.crawl_results) * 0.1)
+        high_activity_threshold = max(3, self.aggregates['results'] * 0.1)
         high_activity_authors = [
             author for author, count in author_counts.items() 
             if count >= high_activity_threshold
         ]
         
         # Detectar patrones de nombres corporativos
-        corporate_patterns = self._detect_corporate_patterns(authors + creators)
+        names = list(author_counts) + list(creator_counts)
+        corporate_patterns = self._detect_corporate_patterns(names)
         
         return {
-            'total_unique_authors': len(set(authors)),
-            'total_unique_creators': len(set(creators)),
+            'total_unique_authors': len(author_counts),
+            'total_unique_creators': len(creator_counts),
             'most_frequent_authors': author_counts.most_common(10),
             'most_frequent_creators': creator_counts.most_common(10),
             'high_activity_authors': high_activity_authors,
             'corporate_patterns': corporate_patterns,
-            'email_addresses_found': self._extract_email_addresses(authors + creators + last_modified_by),
+            'email_addresses_found': self._extract_email_addresses(names + list(modifier_counts)),
         }
     
     def analyze_software(self) -> Dict[str, Any]:
         """Analiza el software utilizado para crear los documentos"""
-        software_detected = []
-        versions_detected = []
-        
-        for result in self.crawl_results:
-            metadata = result.metadata
-            
-            # Extraer información de software
-            for category in ['pdf_metadata', 'office_metadata', 'exif_metadata']:
-                if category in metadata:
-                    cat_data = metadata[category]
-                    
-                    # Software/Producer/Creator que indique herramientas
-                    software_fields = ['producer', 'creator', 'software', 'encoding_software']
-                    for field in software_fields:
-                        if field in cat_data and cat_data[field]:
-                            software_info = cat_data[field]
-                            software_detected.append(software_info)
-                            
-                            # Extraer versión si es posible
-                            version = self._extract_version(software_info)
-                            if version:
-                                versions_detected.append((software_info, version))
-        
-        software_counts = Counter(software_detected)
+        software_counts = self._counter('software')
+        versions_detected = {
+            tuple(json.loads(key)): count for key, count in self._counter('versions').items()
+        }
         
         # Detectar software desactualizado
         outdated_software = self._detect_outdated_software(versions_detected)
         
         # Categorizar por tipo de software
-        software_categories = self._categorize_software(software_detected)
+        software_categories = self._categorize_software(list(software_counts))
         
         return {
-            'total_software_detected': len(set(software_detected)),
+            'total_software_detected': len(software_counts),
             'most_common_software': software_counts.most_common(10),
             'outdated_software': outdated_software,
             'software_categories': software_categories,
@@ -117,84 +189,51 @@ class MetadataAnalyzer:
         }
     
     def analyze_temporal_patterns(self) -> Dict[str, Any]:
-        """Analiza patrones temporales en las fechas de creación/modificación"""
-        creation_dates = []
-        modification_dates = []
-        
-        for result in self.crawl_results:
-            metadata = result.metadata
-            
-            for category in ['pdf_metadata', 'office_metadata']:
-                if category in metadata:
-                    cat_data = metadata[category]
-                    
-                    # Fechas de creación
-                    for date_field in ['creation_date', 'created', 'datetime_original']:
-                        if date_field in cat_data and cat_data[date_field]:
-                            parsed_date = self._parse_date(cat_data[date_field])
-                            if parsed_date:
-                                creation_dates.append(parsed_date)
-                    
-                    # Fechas de modificación
-                    for date_field in ['modification_date', 'modified']:
-                        if date_field in cat_data and cat_data[date_field]:
-                            parsed_date = self._parse_date(cat_data[date_field])
-                            if parsed_date:
-                                modification_dates.append(parsed_date)
+        """Analiza patrones temporales en las fechas de creación (histograma por día)"""
+        creation_days = {
+            datetime.fromisoformat(day): count for day, count in self.aggregates['creation_days'].items()
+        }
         
         # Análisis temporal
         date_analysis = {}
         
-        if creation_dates:
-            creation_dates.sort()
+        if creation_days:
+            earliest = min(creation_days)
+            latest = max(creation_days)
             date_analysis['creation_date_range'] = {
-                'earliest': creation_dates[0].isoformat(),
-                'latest': creation_dates[-1].isoformat(),
-                'span_days': (creation_dates[-1] - creation_dates[0]).days
+                'earliest': earliest.isoformat(),
+                'latest': latest.isoformat(),
+                'span_days': (latest - earliest).days
             }
             
             # Actividad por año/mes
-            date_analysis['activity_by_year'] = self._group_dates_by_period(creation_dates, 'year')
-            date_analysis['activity_by_month'] = self._group_dates_by_period(creation_dates, 'month')
-            date_analysis['activity_by_weekday'] = self._group_dates_by_weekday(creation_dates)
+            date_analysis['activity_by_year'] = self._group_dates_by_period(creation_days, 'year')
+            date_analysis['activity_by_month'] = self._group_dates_by_period(creation_days, 'month')
+            date_analysis['activity_by_weekday'] = self._group_dates_by_weekday(creation_days)
             
             # Detectar períodos de alta actividad
-            date_analysis['high_activity_periods'] = self._detect_high_activity_periods(creation_dates)
+            date_analysis['high_activity_periods'] = self._detect_high_activity_periods(creation_days)
         
         return date_analysis
     
     def analyze_location_data(self) -> Dict[str, Any]:
         """Analiza datos de geolocalización en metadatos"""
-        gps_coordinates = []
-        location_strings = []
-        
-        for result in self.crawl_results:
-            metadata = result.metadata
-            
-            # Buscar coordenadas GPS en metadatos EXIF
-            if 'exif_metadata' in metadata:
-                exif_data = metadata['exif_metadata']
-                if 'gps_coordinates' in exif_data:
-                    gps_data = exif_data['gps_coordinates']
-                    if isinstance(gps_data, dict) and 'latitude' in gps_data and 'longitude' in gps_data:
-                        gps_coordinates.append((gps_data['latitude'], gps_data['longitude']))
-                        if 'coordinates_string' in gps_data:
-                            location_strings.append(gps_data['coordinates_string'])
+        gps_counts = gps_points(self.aggregates)
+        total_files = sum(gps_counts.values())
         
         location_analysis = {
-            'total_files_with_gps': len(gps_coordinates),
-            'unique_locations': len(set(gps_coordinates)),
-            'coordinates_found': gps_coordinates,
+            'total_files_with_gps': total_files,
+            'unique_locations': len(gps_counts),
+            'coordinates_found': list(gps_counts)[:MAX_COORDINATES],
+            'coordinates_truncated': len(gps_counts) > MAX_COORDINATES,
         }
         
-        if gps_coordinates:
+        if gps_counts:
             # Calcular centro geográfico
-            avg_lat = sum(coord[0] for coord in gps_coordinates) / len(gps_coordinates)
-            avg_lon = sum(coord[1] for coord in gps_coordinates) / len(gps_coordinates)
-            location_analysis['geographic_center'] = (avg_lat, avg_lon)
+            location_analysis['geographic_center'] = self._weighted_center(gps_counts)
             
             # Detectar clustering de ubicaciones
-            location_analysis['location_clusters'] = self._detect_location_clusters(gps_coordinates)
+            location_analysis['location_clusters'] = self._detect_location_clusters(gps_counts)
         
         return location_analysis
     
@@ -296,6 +335,10 @@ class MetadataAnalyzer:
         }
     
     # Métodos auxiliares
+    def _counter(self, name: str) -> Counter:
+        """Contador de los agregados en orden fijo (los empates no dependen del orden de extracción)"""
+        return Counter(dict(sorted(self.aggregates[name].items())))
+
     def _clean_author_name(self, author: str) -> str:
         """Limpia y normaliza nombres de autores"""
         if not author:
@@ -324,7 +367,7 @@ class MetadataAnalyzer:
                     patterns.append(name)
                     break
         
-        return list(set(patterns))
+        return sorted(set(patterns))
     
     def _extract_email_addresses(self, text_list: List[str]) -> List[str]:
         """Extrae direcciones de correo electrónico"""
@@ -336,7 +379,7 @@ class MetadataAnalyzer:
                 found_emails = re.findall(email_pattern, str(text))
                 emails.extend(found_emails)
         
-        return list(set(emails))
+        return sorted(set(emails))
     
     def _extract_version(self, software_string: str) -> str:
         """Extrae número de versión de string de software"""
@@ -358,8 +401,8 @@ class MetadataAnalyzer:
         
         return ""
     
-    def _detect_outdated_software(self, versions: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
-        """Detecta software desactualizado"""
+    def _detect_outdated_software(self, versions: Dict[Tuple[str, str], int]) -> List[Dict[str, Any]]:
+        """Detecta software desactualizado (versions: (software, versión) -> documentos)"""
         current_year = datetime.now().year
         outdated = []
         
@@ -371,7 +414,7 @@ class MetadataAnalyzer:
             'LibreOffice': {'latest_major': 2023, 'support_years': 2},
         }
         
-        for software, version in versions:
+        for (software, version), count in versions.items():
             # Detectar año en la versión o nombre del software
             year_match = re.search(r'(20\d{2})', software + ' ' + version)
             if year_match:
@@ -382,7 +425,8 @@ class MetadataAnalyzer:
                         'version': version,
                         'year': software_year,
                         'age_years': current_year - software_year,
-                        'risk_level': min((current_year - software_year) // 2, 10)
+                        'risk_level': min((current_year - software_year) // 2, 10),
+                        'occurrences': count,
                     })
         
         return outdated
@@ -420,14 +464,16 @@ class MetadataAnalyzer:
         
         return dict(categories)
     
-    def _analyze_versions(self, versions: List[Tuple[str, str]]) -> Dict[str, Any]:
+    def _analyze_versions(self, versions: Dict[Tuple[str, str], int]) -> Dict[str, Any]:
         """Analiza distribución de versiones"""
-        version_counts = Counter([version for software, version in versions])
+        version_counts = Counter()
+        for (software, version), count in versions.items():
+            version_counts[version] += count
         
         return {
             'total_versions_detected': len(version_counts),
             'most_common_versions': version_counts.most_common(5),
-            'version_diversity': len(set([version for software, version in versions]))
+            'version_diversity': len(version_counts)
         }
     
     def _parse_date(self, date_string: str) -> datetime:
@@ -453,11 +499,11 @@ class MetadataAnalyzer:
         
         return None
     
-    def _group_dates_by_period(self, dates: List[datetime], period: str) -> Dict[str, int]:
+    def _group_dates_by_period(self, dates: Dict[datetime, int], period: str) -> Dict[str, int]:
         """Agrupa fechas por período (year, month)"""
         grouped = defaultdict(int)
         
-        for date in dates:
+        for date, count in dates.items():
             if period == 'year':
                 key = str(date.year)
             elif period == 'month':
@@ -465,31 +511,31 @@ class MetadataAnalyzer:
             else:
                 key = date.strftime('%Y-%m-%d')
             
-            grouped[key] += 1
+            grouped[key] += count
         
         return dict(grouped)
     
-    def _group_dates_by_weekday(self, dates: List[datetime]) -> Dict[str, int]:
+    def _group_dates_by_weekday(self, dates: Dict[datetime, int]) -> Dict[str, int]:
         """Agrupa fechas por día de la semana"""
         weekdays = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
         grouped = defaultdict(int)
         
-        for date in dates:
+        for date, count in dates.items():
             weekday_name = weekdays[date.weekday()]
-            grouped[weekday_name] += 1
+            grouped[weekday_name] += count
         
         return dict(grouped)
     
-    def _detect_high_activity_periods(self, dates: List[datetime]) -> List[Dict[str, Any]]:
+    def _detect_high_activity_periods(self, dates: Dict[datetime, int]) -> List[Dict[str, Any]]:
         """Detecta períodos de alta actividad"""
         if not dates:
             return []
         
         # Agrupar por semana
         week_counts = defaultdict(int)
-        for date in dates:
+        for date, count in dates.items():
             week_key = date.strftime('%Y-W%U')
-            week_counts[week_key] += 1
+            week_counts[week_key] += count
         
         # Calcular promedio y detectar picos
         avg_activity = sum(week_counts.values()) / len(week_counts)
@@ -506,42 +552,72 @@ class MetadataAnalyzer:
         
         return high_activity
     
-    def _detect_location_clusters(self, coordinates: List[Tuple[float, float]]) -> List[Dict[str, Any]]:
-        """Detecta clusters de ubicaciones GPS"""
-        if len(coordinates) < 2:
+    def _weighted_center(self, points: Dict[Tuple[float, float], int]) -> Tuple[float, float]:
+        """Centro de coordenadas únicas ponderadas por cantidad de archivos"""
+        total = sum(points.values())
+        center_lat = sum(coord[0] * count for coord, count in points.items()) / total
+        center_lon = sum(coord[1] * count for coord, count in points.items()) / total
+        return (center_lat, center_lon)
+
+    def _grid_cells(self, coordinates: List[Tuple[float, float]]) -> List[Tuple[int, int]]:
+        """Celda de la grilla (de lado CLUSTER_DISTANCE) de cada coordenada"""
+        if NUMPY_AVAILABLE:
+            cells = np.floor(np.asarray(coordinates, dtype=float) / CLUSTER_DISTANCE).astype(np.int64)
+            return [tuple(cell) for cell in cells.tolist()]
+        return [
+            (math.floor(lat / CLUSTER_DISTANCE), math.floor(lon / CLUSTER_DISTANCE))
+            for lat, lon in coordinates
+        ]
+    
+    def _detect_location_clusters(self, points: Dict[Tuple[float, float], int]) -> List[Dict[str, Any]]:
+        """
+        Detecta clusters de ubicaciones GPS: cada coordenada aún libre es origen
+        de un cluster con las coordenadas a menos de CLUSTER_DISTANCE. Con una
+        grilla de celdas de ese tamaño solo se comparan las 9 celdas vecinas,
+        en lugar de todas las coordenadas entre sí. points son coordenadas
+        únicas con su cantidad de archivos.
+        """
+        if sum(points.values()) < 2:
             return []
-        
-        # Algoritmo simple de clustering por proximidad
+
+        coordinates = list(points)
+        cells = self._grid_cells(coordinates)
+
+        # Coordenadas libres por celda (se retiran al asignarlas a un cluster)
+        grid = {}
+        for index, cell in enumerate(cells):
+            grid.setdefault(cell, {})[index] = None
+
         clusters = []
-        processed = set()
-        
-        for i, coord1 in enumerate(coordinates):
-            if i in processed:
+        for index, cell in enumerate(cells):
+            if index not in grid[cell]:
                 continue
-            
-            cluster = [coord1]
-            processed.add(i)
-            
-            for j, coord2 in enumerate(coordinates[i+1:], i+1):
-                if j in processed:
-                    continue
-                
-                # Calcular distancia aproximada (en grados)
-                distance = ((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)**0.5
-                
-                if distance < 0.01:  # Aproximadamente 1km
-                    cluster.append(coord2)
-                    processed.add(j)
-            
-            if len(cluster) > 1:
-                # Calcular centro del cluster
-                center_lat = sum(coord[0] for coord in cluster) / len(cluster)
-                center_lon = sum(coord[1] for coord in cluster) / len(cluster)
-                
+            del grid[cell][index]
+
+            seed_lat, seed_lon = coordinates[index]
+            members = [index]
+            for d_lat in (-1, 0, 1):
+                for d_lon in (-1, 0, 1):
+                    neighbors = grid.get((cell[0] + d_lat, cell[1] + d_lon))
+                    if not neighbors:
+                        continue
+                    # Distancia aproximada (en grados)
+                    close = [
+                        other for other in neighbors
+                        if math.hypot(seed_lat - coordinates[other][0], seed_lon - coordinates[other][1]) < CLUSTER_DISTANCE
+                    ]
+                    for other in close:
+                        del neighbors[other]
+                    members.extend(close)
+
+            cluster_points = {coordinates[member]: points[coordinates[member]] for member in sorted(members)}
+            size = sum(cluster_points.values())
+            if size > 1:
                 clusters.append({
-                    'center': (center_lat, center_lon),
-                    'coordinates': cluster,
-                    'size': len(cluster)
+                    'center': self._weighted_center(cluster_points),
+                    'coordinates': list(cluster_points)[:MAX_CLUSTER_COORDINATES],
+                    'unique_locations': len(cluster_points),
+                    'size': size
                 })
         
         return clusters
@@ -558,20 +634,83 @@ class MetadataAnalyzer:
             return 'Crítico'
 
 
+def gps_points(aggregates: Dict[str, Any]) -> Dict[Tuple[float, float], int]:
+    """
+    Coordenadas únicas de los agregados con su cantidad de archivos, en orden
+    fijo (el resultado no depende del orden en que se extrajeron los archivos)
+    """
+    return dict(sorted(
+        (tuple(json.loads(key)), count) for key, count in aggregates.get('gps', {}).items()
+    ))
+
+
+def get_session_aggregate(session):
+    """
+    Agregados de metadatos de la sesión. Las sesiones anteriores a los
+    agregados incrementales se recorren una sola vez para construirlos.
+    """
+    from .models import CrawlResult, SessionMetadataAggregate
+
+    aggregate = SessionMetadataAggregate.objects.filter(session=session).first()
+    if aggregate is not None:
+        return aggregate
+
+    results = CrawlResult.objects.filter(session=session).exclude(metadata={}).only('metadata')
+    data = MetadataAnalyzer(results.iterator(chunk_size=500)).build_aggregates()
+    aggregate, _ = SessionMetadataAggregate.objects.get_or_create(session=session, defaults={'data': data})
+    return aggregate
+
+
+def update_session_aggregates(session_id: int, old_metadata: Dict[str, Any], new_metadata: Dict[str, Any]):
+    """
+    Aplica a los agregados de la sesión el cambio de metadatos de un resultado
+    (old_metadata vacío al extraer por primera vez, new_metadata vacío al borrar)
+    """
+    from django.db import transaction
+    from .models import SessionMetadataAggregate
+
+    if old_metadata == new_metadata:
+        return
+
+    analyzer = MetadataAnalyzer()
+    with transaction.atomic():
+        aggregate = SessionMetadataAggregate.objects.select_for_update().filter(session_id=session_id).first()
+        if aggregate is None:
+            # Se construirá completo en el primer análisis
+            return
+
+        data = aggregate.data or empty_aggregates()
+        merge_aggregates(data, analyzer.collect(old_metadata), sign=-1)
+        merge_aggregates(data, analyzer.collect(new_metadata))
+
+        aggregate.data = data
+        aggregate.version += 1
+        aggregate.save(update_fields=['data', 'version', 'updated_at'])
+
+
 def analyze_session_metadata(session):
-    """Función de conveniencia para analizar metadatos de una sesión completa"""
-    from .models import CrawlResult
-    
-    results = CrawlResult.objects.filter(
-        session=session
-    ).exclude(metadata={})
-    
-    if not results.exists():
+    """
+    Análisis de metadatos de una sesión completa. Se calcula a partir de los
+    agregados de la sesión y se guarda hasta el siguiente cambio.
+    """
+    from .models import SessionMetadataAggregate
+
+    aggregate = get_session_aggregate(session)
+
+    if not aggregate.data.get('results'):
         return {
             'error': 'No se encontraron resultados con metadatos para esta sesión'
         }
-    
-    analyzer = MetadataAnalyzer(results)
-    analysis = analyzer.analyze_all()
-    
-    return analysis
\ No newline at end of file
+
+    if aggregate.summary_version == aggregate.version:
+        return aggregate.summary
+
+    analysis = MetadataAnalyzer(aggregates=aggregate.data).analyze_all()
+
+    # Si los agregados cambiaron mientras tanto, el análisis queda desactualizado
+    SessionMetadataAggregate.objects.filter(
+        pk=aggregate.pk,
+        version=aggregate.version
+    ).update(summary=analysis, summary_version=aggregate.version)
+
+    return analysis
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0003_crawlresult_content_extracted_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='crawlresult',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash SHA-256 del archivo', max_length=64),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0004_crawlresult_file_hash_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(help_text='Hash SHA-256 del archivo', max_length=64)),
+                ('file_extension', models.CharField(blank=True, help_text='Extensión usada para elegir el extractor', max_length=10)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('compression', models.CharField(choices=[('zlib', 'zlib'), ('zstd', 'Zstandard')], default='zlib', max_length=10)),
+                ('content_data', models.BinaryField(blank=True, default=b'')),
+                ('content_length', models.IntegerField(default=0)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Caché de Extracción',
+                'verbose_name_plural': 'Caché de Extracciones',
+                'unique_together': {('file_hash', 'file_extension')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0005_extractioncache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='crawllog',
+            index=models.Index(fields=['session', 'level', '-created_at'], name='log_session_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='crawllog',
+            index=models.Index(fields=['session', '-created_at'], name='log_session_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='crawlresult',
+            index=models.Index(fields=['session', '-created_at'], name='result_session_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='urlqueue',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['session', 'priority', 'discovered_at'], name='urlqueue_pending_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='urlqueue',
+            index=models.Index(fields=['session', 'status'], name='urlqueue_session_status_idx'),
+        ),
+    ]
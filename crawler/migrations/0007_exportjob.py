@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0006_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('export_format', models.CharField(choices=[('csv', 'CSV'), ('json', 'JSON'), ('ndjson', 'JSON por líneas'), ('pdf', 'PDF')], max_length=10)),
+                ('options', models.JSONField(blank=True, default=dict, help_text='Opciones de la exportación (metadatos, análisis...)')),
+                ('fingerprint', models.CharField(db_index=True, help_text='Hash de formato, opciones y versión de la sesión exportada', max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'Generando'), ('completed', 'Completado'), ('failed', 'Fallido')], default='pending', max_length=20)),
+                ('progress', models.IntegerField(default=0, help_text='Porcentaje completado')),
+                ('rows_written', models.IntegerField(default=0)),
+                ('total_rows', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True)),
+                ('file_path', models.CharField(blank=True, max_length=500)),
+                ('file_name', models.CharField(blank=True, help_text='Nombre de descarga', max_length=255)),
+                ('file_size', models.BigIntegerField(default=0)),
+                ('compression', models.CharField(blank=True, max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='crawler.crawlsession')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='crawl_exports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Exportación',
+                'verbose_name_plural': 'Exportaciones',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0007_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionMetadataAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField(blank=True, default=dict, help_text='Contadores combinables (ver metadata_utils)')),
+                ('version', models.PositiveIntegerField(default=0, help_text='Aumenta con cada cambio de data')),
+                ('summary', models.JSONField(blank=True, default=dict)),
+                ('summary_version', models.IntegerField(default=-1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='metadata_aggregate', to='crawler.crawlsession')),
+            ],
+            options={
+                'verbose_name': 'Agregado de Metadatos',
+                'verbose_name_plural': 'Agregados de Metadatos',
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# DDL copiado aquí para no depender de crawler.search (ni de los modelos o
+# settings actuales): la tabla se crea siempre que el motor lo soporte y
+# SEARCH_INDEX_ENABLED solo decide si se usa
+SEARCH_TABLE = 'crawler_search_index'
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        # Sin copia del texto (el contenido ya está comprimido en CrawlResultContent).
+        # Antes de SQLite 3.43 una tabla contentless no admite borrar filas: ahí guarda su copia
+        contentless = ''
+        if schema_editor.connection.Database.sqlite_version_info >= (3, 43):
+            contentless = "content='', contentless_delete=1, "
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            "session_id UNINDEXED, file_name, url, title, description, content, "
+            f"{contentless}tokenize='unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            "result_id integer PRIMARY KEY REFERENCES crawler_crawlresult(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "session_id integer NOT NULL, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)")
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_session_idx ON {SEARCH_TABLE} (session_id)")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+    '''
+    Índice de texto completo de CrawlResult (FTS5 en SQLite, tsvector + GIN en
+    PostgreSQL). Los resultados existentes se indexan con el comando
+    rebuild_search_index.
+    '''
+
+    dependencies = [
+        ('crawler', '0008_sessionmetadataaggregate'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
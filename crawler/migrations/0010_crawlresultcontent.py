@@ -0,0 +1,89 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:33
+
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 200
+
+# Copia de la compresión de crawler.content_store: la migración no debe
+# depender de los modelos ni de los settings actuales
+ZLIB_LEVEL = 6
+
+
+def compress_content(text):
+    '''El contenido existente se mueve siempre con zlib (no requiere dependencias)'''
+    return 'zlib', zlib.compress(text.encode('utf-8'), ZLIB_LEVEL)
+
+
+def decompress_content(compression, data):
+    if not data:
+        return ''
+    if compression == 'zstd':
+        import zstandard
+        raw = zstandard.ZstdDecompressor().decompress(bytes(data))
+    else:
+        raw = zlib.decompress(bytes(data))
+    return raw.decode('utf-8')
+
+
+def move_content(apps, schema_editor):
+    '''Comprime el contenido existente en CrawlResultContent'''
+    CrawlResult = apps.get_model('crawler', 'CrawlResult')
+    CrawlResultContent = apps.get_model('crawler', 'CrawlResultContent')
+
+    rows = (
+        CrawlResult.objects.exclude(full_content__isnull=True).exclude(full_content='')
+        .values_list('id', 'full_content').iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    for result_id, text in rows:
+        compression, data = compress_content(text)
+        batch.append(CrawlResultContent(result_id=result_id, compression=compression, data=data))
+        if len(batch) >= BATCH_SIZE:
+            CrawlResultContent.objects.bulk_create(batch)
+            batch = []
+    CrawlResultContent.objects.bulk_create(batch)
+
+
+def restore_content(apps, schema_editor):
+    CrawlResult = apps.get_model('crawler', 'CrawlResult')
+    CrawlResultContent = apps.get_model('crawler', 'CrawlResultContent')
+
+    for content in CrawlResultContent.objects.iterator(chunk_size=BATCH_SIZE):
+        CrawlResult.objects.filter(id=content.result_id).update(
+            full_content=decompress_content(content.compression, content.data)
+        )
+
+
+class Migration(migrations.Migration):
+    '''
+    Mueve CrawlResult.full_content a CrawlResultContent (comprimido), para que
+    las consultas de resultados no arrastren el contenido completo.
+    '''
+
+    dependencies = [
+        ('crawler', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlResultContent',
+            fields=[
+                ('result', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='crawler.crawlresult')),
+                ('compression', models.CharField(choices=[('zlib', 'zlib'), ('zstd', 'Zstandard')], default='zlib', max_length=10)),
+                ('data', models.BinaryField(help_text='Contenido completo en UTF-8 comprimido (máximo 1M caracteres)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Contenido de Resultado',
+                'verbose_name_plural': 'Contenidos de Resultados',
+            },
+        ),
+        migrations.RunPython(move_content, restore_content),
+        migrations.RemoveField(
+            model_name='crawlresult',
+            name='full_content',
+        ),
+    ]
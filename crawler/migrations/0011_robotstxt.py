@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0010_crawlresultcontent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RobotsTxt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin', models.CharField(help_text='Esquema y host, p. ej. https://example.com', max_length=255, unique=True)),
+                ('status', models.CharField(choices=[('fetching', 'Descargando'), ('ok', 'Reglas obtenidas'), ('unavailable', 'No disponible (sin restricciones)'), ('unreachable', 'Inaccesible (todo bloqueado)')], default='fetching', max_length=20)),
+                ('http_status', models.IntegerField(blank=True, null=True)),
+                ('rules', models.JSONField(blank=True, default=dict)),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, max_length=100)),
+                ('fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'robots.txt',
+                'verbose_name_plural': 'robots.txt',
+            },
+        ),
+    ]
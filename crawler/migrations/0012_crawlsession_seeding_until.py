@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0011_robotstxt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawlsession',
+            name='seeding_until',
+            field=models.DateTimeField(blank=True, help_text='Siembra de sitemaps en curso: la sesión no se completa antes de esta fecha', null=True),
+        ),
+    ]
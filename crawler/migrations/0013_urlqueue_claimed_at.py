@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0012_crawlsession_seeding_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='urlqueue',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, help_text="Momento en que un worker la marcó como 'processing'", null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crawler', '0013_urlqueue_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='last_accessed_at',
+            field=models.DateTimeField(blank=True, help_text='Inicio de la última descarga del archivo', null=True),
+        ),
+    ]
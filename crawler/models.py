@@ -1,8 +1,28 @@
 from django.db import models
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.urls import reverse
 import json
 
+
+class CrawlSessionQuerySet(models.QuerySet):
+
+    def summary(self):
+        '''Totales de un conjunto de sesiones calculados en una sola consulta'''
+        return self.order_by().aggregate(
+            total_sessions=Count('id'),
+            active_sessions=Count('id', filter=Q(status__in=['pending', 'running', 'paused'])),
+            completed_sessions=Count('id', filter=Q(status='completed')),
+            failed_sessions=Count('id', filter=Q(status='failed')),
+            total_urls_discovered=Coalesce(Sum('total_urls_discovered'), 0),
+            total_urls_processed=Coalesce(Sum('total_urls_processed'), 0),
+            total_files_found=Coalesce(Sum('total_files_found'), 0),
+            total_errors=Coalesce(Sum('total_errors'), 0),
+        )
+
+
 class CrawlSession(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pendiente'),
@@ -54,6 +74,8 @@ class CrawlSession(models.Model):
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
+    seeding_until = models.DateTimeField(null=True, blank=True,
+                                         help_text="Siembra de sitemaps en curso: la sesión no se completa antes de esta fecha")
 
     # Estadísticas
     total_urls_discovered = models.IntegerField(default=0)
@@ -68,6 +90,8 @@ class CrawlSession(models.Model):
         help_text="Configuración avanzada adicional"
     )
 
+    objects = CrawlSessionQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Sesión de Crawling'
         verbose_name_plural = 'Sesiones de Crawling'
@@ -92,6 +116,53 @@ class CrawlSession(models.Model):
     def is_active(self):
         return self.status in ['pending', 'running', 'paused']
 
+    @property
+    def is_seeding(self):
+        '''True mientras process_sitemaps sigue agregando URLs a la cola'''
+        return self.seeding_until is not None and self.seeding_until > timezone.now()
+
+    def increment_counters(self, **deltas):
+        '''
+        Incrementa estadísticas con un UPDATE atómico (total = total + n), sin
+        pisar los incrementos de otros workers ni reescribir el resto de columnas.
+        total_errors sube cuando una URL pasa a 'failed' y baja cuando un
+        reintento la saca de ese estado.
+        Ej: session.increment_counters(total_urls_processed=1)
+        '''
+        deltas = {field: amount for field, amount in deltas.items() if amount}
+        if not deltas:
+            return
+
+        updates = {field: F(field) + amount for field, amount in deltas.items()}
+        CrawlSession.objects.filter(pk=self.pk).update(updated_at=timezone.now(), **updates)
+
+        # Valor aproximado en memoria; refresh_from_db() para el exacto
+        for field, amount in deltas.items():
+            setattr(self, field, getattr(self, field) + amount)
+
+    def recalculate_counters(self):
+        '''
+        Recalcula las estadísticas desde URLQueue y CrawlResult (reconciliación
+        periódica) con un solo UPDATE: los conteos se calculan en la base de
+        datos al escribir, sin leer primero y pisar incrementos concurrentes.
+        total_errors cuenta las URLs fallidas, igual que increment_counters.
+        '''
+        def count(queryset):
+            rows = queryset.order_by().values('session').annotate(total=Count('id')).values('total')
+            return Coalesce(Subquery(rows), 0)
+
+        urls = URLQueue.objects.filter(session=OuterRef('pk'))
+        counters = {
+            'total_urls_discovered': count(urls),
+            'total_urls_processed': count(urls.filter(status='completed')),
+            'total_files_found': count(CrawlResult.objects.filter(session=OuterRef('pk'))),
+            'total_errors': count(urls.filter(status='failed')),
+        }
+        CrawlSession.objects.filter(pk=self.pk).update(updated_at=timezone.now(), **counters)
+
+        self.refresh_from_db(fields=list(counters))
+        return {field: getattr(self, field) for field in counters}
+
     def get_file_types_list(self):
         '''Retorna la lista de tipos de archivo como lista Python'''
         if isinstance(self.file_types, str):
@@ -155,6 +226,8 @@ class URLQueue(models.Model):
     # Timestamps
     discovered_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True,
+                                      help_text="Momento en que un worker la marcó como 'processing'")
 
     # Resultados del procesamiento
     http_status_code = models.IntegerField(null=True, blank=True)
@@ -170,6 +243,17 @@ class URLQueue(models.Model):
         verbose_name_plural = 'URLs en Cola'
         ordering = ['priority', 'discovered_at']
         unique_together = ['session', 'url']
+        indexes = [
+            # Planificador: pendientes de una sesión por (priority, discovered_at).
+            # Parcial: solo indexa las pendientes, su tamaño no crece con las ya procesadas
+            models.Index(
+                fields=['session', 'priority', 'discovered_at'],
+                condition=Q(status='pending'),
+                name='urlqueue_pending_sched_idx',
+            ),
+            # Conteos por estado de una sesión (dashboard, fin de sesión)
+            models.Index(fields=['session', 'status'], name='urlqueue_session_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.url} (depth: {self.depth})"
@@ -184,7 +268,7 @@ class CrawlResult(models.Model):
     # Información del archivo/recurso
     file_name = models.CharField(max_length=255, blank=True)
     file_path = models.CharField(max_length=500, blank=True, help_text="Ruta local donde se guardó el archivo")
-    file_hash = models.CharField(max_length=64, blank=True, help_text="Hash SHA-256 del archivo")
+    file_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text="Hash SHA-256 del archivo")
 
     # Metadatos extraídos (como JSON)
     metadata = models.JSONField(default=dict, blank=True)
@@ -194,9 +278,7 @@ class CrawlResult(models.Model):
     description = models.TextField(blank=True)
     keywords = models.TextField(blank=True)
     
-    # Contenido completo del documento
-    full_content = models.TextField(blank=True, null=True, 
-                                   help_text="Contenido completo extraído del archivo (máximo 1M caracteres)")
+    # Contenido completo del documento: comprimido en CrawlResultContent (crawler/content_store.py)
     content_length = models.IntegerField(default=0, 
                                        help_text="Número de caracteres del contenido completo")
     content_extracted_at = models.DateTimeField(null=True, blank=True,
@@ -210,11 +292,39 @@ class CrawlResult(models.Model):
         verbose_name = 'Resultado de Crawling'
         verbose_name_plural = 'Resultados de Crawling'
         ordering = ['-created_at']
+        indexes = [
+            # Resultados de una sesión, más recientes primero
+            models.Index(fields=['session', '-created_at'], name='result_session_created_idx'),
+        ]
 
     def __str__(self):
         return f"Resultado: {self.url_queue_item.url}"
 
 
+class CrawlResultContent(models.Model):
+    '''
+    Contenido completo extraído de un CrawlResult, comprimido y fuera de la fila
+    principal: los listados y exportaciones de resultados no lo cargan.
+    '''
+
+    COMPRESSION_CHOICES = [
+        ('zlib', 'zlib'),
+        ('zstd', 'Zstandard'),
+    ]
+
+    result = models.OneToOneField(CrawlResult, on_delete=models.CASCADE, primary_key=True, related_name='content')
+    compression = models.CharField(max_length=10, choices=COMPRESSION_CHOICES, default='zlib')
+    data = models.BinaryField(help_text="Contenido completo en UTF-8 comprimido (máximo 1M caracteres)")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Contenido de Resultado'
+        verbose_name_plural = 'Contenidos de Resultados'
+
+    def __str__(self):
+        return f"Contenido del resultado {self.result_id} ({self.compression})"
+
+
 class CrawlLog(models.Model):
     '''Log de eventos durante el crawling'''
 
@@ -236,6 +346,150 @@ class CrawlLog(models.Model):
         verbose_name = 'Log de Crawling'
         verbose_name_plural = 'Logs de Crawling'
         ordering = ['-created_at']
+        indexes = [
+            # Logs de una sesión (con o sin filtro de nivel), más recientes primero
+            models.Index(fields=['session', 'level', '-created_at'], name='log_session_level_idx'),
+            models.Index(fields=['session', '-created_at'], name='log_session_created_idx'),
+        ]
 
     def __str__(self):
         return f"[{self.level}] {self.message[:50]}..."
+
+
+class ExtractionCache(models.Model):
+    '''
+    Resultado de extracción reutilizable entre CrawlResult con el mismo contenido.
+    Solo guarda lo que depende de los bytes del archivo (no la URL ni el referrer).
+    '''
+
+    file_hash = models.CharField(max_length=64, help_text="Hash SHA-256 del archivo")
+    file_extension = models.CharField(max_length=10, blank=True, help_text="Extensión usada para elegir el extractor")
+
+    metadata = models.JSONField(default=dict, blank=True)
+    # Contenido completo comprimido como CrawlResultContent (crawler/content_store.py)
+    compression = models.CharField(max_length=10, choices=CrawlResultContent.COMPRESSION_CHOICES, default='zlib')
+    content_data = models.BinaryField(blank=True, default=b'')
+    content_length = models.IntegerField(default=0)
+
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Caché de Extracción'
+        verbose_name_plural = 'Caché de Extracciones'
+        unique_together = ['file_hash', 'file_extension']
+
+    def __str__(self):
+        return f"{self.file_hash[:12]}{self.file_extension} ({self.hits} usos)"
+
+
+class RobotsTxt(models.Model):
+    '''
+    robots.txt de un origen (esquema + host), compartido por todas las sesiones
+    y workers. Guarda los grupos ya parseados; se revalida al vencer expires_at
+    con ETag / Last-Modified (ver crawler/robots.py).
+    '''
+
+    STATUS_CHOICES = [
+        ('fetching', 'Descargando'),
+        ('ok', 'Reglas obtenidas'),
+        ('unavailable', 'No disponible (sin restricciones)'),
+        ('unreachable', 'Inaccesible (todo bloqueado)'),
+    ]
+
+    origin = models.CharField(max_length=255, unique=True, help_text="Esquema y host, p. ej. https://example.com")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='fetching')
+    http_status = models.IntegerField(null=True, blank=True)
+
+    # {'groups': {user_agent: {'allow': [...], 'disallow': [...], 'crawl_delay': float}}, 'sitemaps': [...]}
+    rules = models.JSONField(default=dict, blank=True)
+
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=100, blank=True)
+    fetched_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'robots.txt'
+        verbose_name_plural = 'robots.txt'
+
+    def __str__(self):
+        return f"{self.origin}/robots.txt ({self.status})"
+
+
+class SessionMetadataAggregate(models.Model):
+    '''
+    Agregados de los metadatos de una sesión (autores, software, histograma de
+    fechas, coordenadas GPS). Se actualizan con cada extracción para que el
+    análisis no tenga que recorrer todos los resultados.
+    '''
+
+    session = models.OneToOneField(CrawlSession, on_delete=models.CASCADE, related_name='metadata_aggregate')
+    data = models.JSONField(default=dict, blank=True, help_text="Contadores combinables (ver metadata_utils)")
+    version = models.PositiveIntegerField(default=0, help_text="Aumenta con cada cambio de data")
+
+    # Análisis calculado a partir de data; vigente mientras summary_version == version
+    summary = models.JSONField(default=dict, blank=True)
+    summary_version = models.IntegerField(default=-1)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Agregado de Metadatos'
+        verbose_name_plural = 'Agregados de Metadatos'
+
+    def __str__(self):
+        return f"Metadatos de {self.session.name} ({self.data.get('results', 0)} resultados)"
+
+
+class ExportJob(models.Model):
+    '''Exportación de una sesión generada en segundo plano (archivo comprimido reutilizable)'''
+
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('json', 'JSON'),
+        ('ndjson', 'JSON por líneas'),
+        ('pdf', 'PDF'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('running', 'Generando'),
+        ('completed', 'Completado'),
+        ('failed', 'Fallido'),
+    ]
+
+    session = models.ForeignKey(CrawlSession, on_delete=models.CASCADE, related_name='export_jobs')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='crawl_exports')
+    export_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    options = models.JSONField(default=dict, blank=True, help_text="Opciones de la exportación (metadatos, análisis...)")
+    fingerprint = models.CharField(max_length=64, db_index=True,
+                                   help_text="Hash de formato, opciones y versión de la sesión exportada")
+
+    # Progreso
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    progress = models.IntegerField(default=0, help_text="Porcentaje completado")
+    rows_written = models.IntegerField(default=0)
+    total_rows = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True)
+
+    # Archivo generado
+    file_path = models.CharField(max_length=500, blank=True)
+    file_name = models.CharField(max_length=255, blank=True, help_text="Nombre de descarga")
+    file_size = models.BigIntegerField(default=0)
+    compression = models.CharField(max_length=10, blank=True)
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    last_accessed_at = models.DateTimeField(null=True, blank=True, help_text="Inicio de la última descarga del archivo")
+
+    class Meta:
+        verbose_name = 'Exportación'
+        verbose_name_plural = 'Exportaciones'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_export_format_display()} de {self.session.name} ({self.get_status_display()})"
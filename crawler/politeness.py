@@ -0,0 +1,279 @@
+# crawler/politeness.py
+import logging
+import threading
+import time
+from datetime import timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import redis
+from django.conf import settings
+
+from .frontier import get_redis_client, redis_available
+
+logger = logging.getLogger('crawler')
+
+# Respuestas que indican que el servidor pide bajar el ritmo
+THROTTLE_STATUS_CODES = (429, 503)
+
+# Una respuesta solo cuenta como pico de latencia si además supera estos segundos
+LATENCY_SPIKE_MIN = 1.0
+
+# Peso de la última respuesta en el promedio móvil de latencia
+LATENCY_EWMA_WEIGHT = 0.2
+
+# Segundos que se conserva el estado de un host sin actividad
+STATE_TTL = 3600
+
+# Reserva un turno (GCRA / token bucket): retorna los segundos a esperar.
+# ARGV: now, max_rate, min_interval (Crawl-delay), burst, max_delay (-1 = sin límite), ttl
+RESERVE_SCRIPT = '''
+local state = redis.call('HMGET', KEYS[1], 'tat', 'rate', 'blocked_until')
+local now = tonumber(ARGV[1])
+local max_rate = tonumber(ARGV[2])
+local rate = math.min(tonumber(state[2]) or max_rate, max_rate)
+local interval = math.max(1 / rate, tonumber(ARGV[3]))
+local burst = tonumber(ARGV[4])
+local tat = math.max(tonumber(state[1]) or 0, now)
+local start = math.max(now, tat - (burst - 1) * interval, tonumber(state[3]) or 0)
+local max_delay = tonumber(ARGV[5])
+if max_delay >= 0 and start - now > max_delay then
+    return tostring(start - now)
+end
+redis.call('HSET', KEYS[1], 'tat', tostring(math.max(tat, start) + interval), 'rate', tostring(rate))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[6]))
+return tostring(start - now)
+'''
+
+# Ajusta el ritmo con AIMD según la respuesta: retorna el nuevo rate.
+# ARGV: now, max_rate, min_rate, throttled (0/1), retry_after, latency (-1 = sin dato),
+#       increase, decrease, latency_factor, latency_min, ewma_weight, ttl
+FEEDBACK_SCRIPT = '''
+local state = redis.call('HMGET', KEYS[1], 'rate', 'latency', 'blocked_until')
+local now = tonumber(ARGV[1])
+local max_rate = tonumber(ARGV[2])
+local min_rate = tonumber(ARGV[3])
+local rate = math.min(tonumber(state[1]) or max_rate, max_rate)
+local average = tonumber(state[2])
+local blocked_until = tonumber(state[3]) or 0
+local latency = tonumber(ARGV[6])
+local decrease = tonumber(ARGV[8])
+
+if ARGV[4] == '1' then
+    rate = math.max(min_rate, rate * decrease)
+    blocked_until = math.max(blocked_until, now + tonumber(ARGV[5]))
+elseif latency >= 0 then
+    if average and latency > average * tonumber(ARGV[9]) and latency > tonumber(ARGV[10]) then
+        rate = math.max(min_rate, rate * decrease)
+    else
+        rate = math.min(max_rate, rate + tonumber(ARGV[7]))
+    end
+    local weight = tonumber(ARGV[11])
+    average = average and (average * (1 - weight) + latency * weight) or latency
+end
+
+redis.call('HSET', KEYS[1], 'rate', tostring(rate), 'blocked_until', tostring(blocked_until))
+if average then
+    redis.call('HSET', KEYS[1], 'latency', tostring(average))
+end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[12]))
+return tostring(rate)
+'''
+
+
+_scripts: Dict[str, 'redis.commands.core.Script'] = {}
+
+
+def _run_script(source: str, key: str, args: list) -> float:
+    '''Ejecuta un script Lua con EVALSHA (redis-py lo carga si el servidor no lo tiene)'''
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = get_redis_client().register_script(source)
+    return float(script(keys=[key], args=args))
+
+
+def _politeness_settings() -> Dict:
+    return settings.CRAWLER_SETTINGS
+
+
+def get_host(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+def parse_retry_after(value: Optional[str], now: float = None) -> float:
+    '''Segundos indicados por Retry-After (número o fecha HTTP); 0 si no es válido'''
+    if not value:
+        return 0.0
+    value = value.strip()
+    if value.isdigit():
+        seconds = float(value)
+    else:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return 0.0
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=dt_timezone.utc)
+        seconds = retry_at.timestamp() - (now if now is not None else time.time())
+    return min(max(seconds, 0.0), _politeness_settings().get('POLITENESS_MAX_RETRY_AFTER', 3600))
+
+
+class _LocalState:
+    '''Estado por host en memoria del proceso, usado cuando Redis no responde'''
+
+    def __init__(self):
+        self.hosts: Dict[str, Dict[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, key, now, max_rate, min_interval, burst, max_delay):
+        with self.lock:
+            state = self.hosts.setdefault(key, {})
+            rate = min(state.get('rate', max_rate), max_rate)
+            interval = max(1 / rate, min_interval)
+            tat = max(state.get('tat', 0.0), now)
+            start = max(now, tat - (burst - 1) * interval, state.get('blocked_until', 0.0))
+            if max_delay >= 0 and start - now > max_delay:
+                return start - now
+            state['tat'] = max(tat, start) + interval
+            state['rate'] = rate
+            return start - now
+
+    def blocked_until(self, key):
+        with self.lock:
+            return self.hosts.get(key, {}).get('blocked_until', 0.0)
+
+    def feedback(self, key, now, max_rate, min_rate, throttled, retry_after, latency,
+                 increase, decrease, latency_factor, latency_min, ewma_weight):
+        with self.lock:
+            state = self.hosts.setdefault(key, {})
+            rate = min(state.get('rate', max_rate), max_rate)
+            average = state.get('latency')
+
+            if throttled:
+                rate = max(min_rate, rate * decrease)
+                state['blocked_until'] = max(state.get('blocked_until', 0.0), now + retry_after)
+            elif latency >= 0:
+                if average is not None and latency > average * latency_factor and latency > latency_min:
+                    rate = max(min_rate, rate * decrease)
+                else:
+                    rate = min(max_rate, rate + increase)
+                average = latency if average is None else average * (1 - ewma_weight) + latency * ewma_weight
+                state['latency'] = average
+
+            state['rate'] = rate
+            return rate
+
+
+_local_state = _LocalState()
+
+
+class HostRateLimiter:
+    '''
+    Ritmo de descarga por (sesión, host), compartido entre workers a través de
+    Redis. Cada request reserva un turno en un token bucket cuyo rate se ajusta
+    con AIMD: baja a la mitad ante 429/503, timeouts o picos de latencia, y
+    sube de a poco con cada respuesta sana, sin superar el rate_limit de la
+    sesión ni el Crawl-delay de robots.txt. Retry-After bloquea el host hasta
+    la fecha indicada. Sin Redis el estado queda en memoria del proceso.
+    '''
+
+    def __init__(self, session_id: int, max_rate: float, respect_crawl_delay: bool = True):
+        config = _politeness_settings()
+        self.session_id = session_id
+        # rate_limit <= 0 significa sin límite configurado
+        self.max_rate = max_rate if max_rate and max_rate > 0 else config.get('POLITENESS_UNLIMITED_RATE', 100.0)
+        self.min_rate = min(config.get('POLITENESS_MIN_RATE', 0.05), self.max_rate)
+        self.increase = config.get('POLITENESS_INCREASE', 0.05)
+        self.decrease = config.get('POLITENESS_DECREASE', 0.5)
+        self.latency_factor = config.get('POLITENESS_LATENCY_FACTOR', 3.0)
+        self.burst = max(1, int(config.get('POLITENESS_BURST', 1)))
+        self.respect_crawl_delay = respect_crawl_delay
+        self._crawl_delays: Dict[str, float] = {}
+
+    def key(self, host: str) -> str:
+        return f'fisgon:politeness:{self.session_id}:{host}'
+
+    def crawl_delay(self, url: str) -> float:
+        '''Crawl-delay de robots.txt para el host de url (0 si no hay o no se respeta)'''
+        host = get_host(url)
+        if host in self._crawl_delays:
+            return self._crawl_delays[host]
+
+        delay = 0.0
+        if self.respect_crawl_delay:
+            from .robots import get_robots_matcher
+            try:
+                # Sin esperar a otro worker: en el motor asíncrono corre en el hilo de los callbacks
+                matcher = get_robots_matcher(url, self.session_id, wait=False)
+            except Exception as e:
+                logger.warning(f'No se pudo obtener Crawl-delay de {host}: {str(e)}')
+                return delay
+            if matcher.temporary:
+                return delay
+            delay = float(matcher.crawl_delay or 0)
+        self._crawl_delays[host] = delay
+        return delay
+
+    def _host_max_rate(self, url: str) -> float:
+        delay = self.crawl_delay(url)
+        return min(self.max_rate, 1 / delay) if delay > 0 else self.max_rate
+
+    def reserve(self, url: str, max_delay: float = None) -> float:
+        '''
+        Reserva el próximo turno para el host de url y retorna los segundos a
+        esperar antes de enviar el request. Si la espera supera max_delay no se
+        reserva nada (el llamador debe devolver la URL a la cola).
+        '''
+        now = time.time()
+        key = self.key(get_host(url))
+        args = [now, self._host_max_rate(url), self.crawl_delay(url), self.burst,
+                -1 if max_delay is None else max_delay]
+
+        if redis_available():
+            try:
+                return _run_script(RESERVE_SCRIPT, key, [*args, STATE_TTL])
+            except redis.RedisError as e:
+                logger.warning(f'Rate limit distribuido no disponible, usando estado local: {str(e)}')
+        return _local_state.reserve(key, *args)
+
+    def blocked_for(self, url: str) -> float:
+        '''Segundos que faltan para que termine el Retry-After del host (0 si no hay)'''
+        key = self.key(get_host(url))
+        if redis_available():
+            try:
+                blocked_until = float(get_redis_client().hget(key, 'blocked_until') or 0)
+                return max(blocked_until - time.time(), 0.0)
+            except redis.RedisError as e:
+                logger.warning(f'Rate limit distribuido no disponible, usando estado local: {str(e)}')
+        return max(_local_state.blocked_until(key) - time.time(), 0.0)
+
+    def record(self, url: str, status_code: Optional[int], response_time: Optional[float], headers=None) -> float:
+        '''
+        Ajusta el ritmo del host según una respuesta (status_code None = timeout).
+        Retorna el nuevo rate en requests por segundo.
+        '''
+        now = time.time()
+        throttled = status_code is None or status_code in THROTTLE_STATUS_CODES
+        retry_after = parse_retry_after((headers or {}).get('Retry-After'), now) if throttled else 0.0
+        latency = -1 if throttled or response_time is None else response_time
+
+        key = self.key(get_host(url))
+        args = [now, self._host_max_rate(url), self.min_rate, throttled, retry_after, latency,
+                self.increase, self.decrease, self.latency_factor, LATENCY_SPIKE_MIN, LATENCY_EWMA_WEIGHT]
+
+        if throttled:
+            logger.info(f'{get_host(url)} pide bajar el ritmo (HTTP {status_code}, Retry-After {retry_after:.0f}s)')
+
+        if redis_available():
+            try:
+                redis_args = [*args[:3], '1' if throttled else '0', *args[4:], STATE_TTL]
+                return _run_script(FEEDBACK_SCRIPT, key, redis_args)
+            except redis.RedisError as e:
+                logger.warning(f'Rate limit distribuido no disponible, usando estado local: {str(e)}')
+        return _local_state.feedback(key, *args)
+
+
+def get_host_limiter(session) -> HostRateLimiter:
+    '''Limitador por host de una sesión de crawling'''
+    return HostRateLimiter(session.id, session.rate_limit, respect_crawl_delay=session.respect_robots_txt)
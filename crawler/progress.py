@@ -0,0 +1,84 @@
+# crawler/progress.py
+import logging
+
+import redis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .frontier import get_redis_client, redis_available
+
+logger = logging.getLogger('crawler')
+
+
+def session_group_name(session_id: int) -> str:
+    '''Grupo de Channels con los navegadores que siguen una sesión'''
+    return f'crawler_session_{session_id}'
+
+
+def _publish_interval_ms() -> int:
+    '''Intervalo mínimo entre notificaciones de una sesión (0 = sin límite)'''
+    per_second = settings.CRAWLER_SETTINGS.get('PROGRESS_UPDATES_PER_SECOND', 2)
+    return max(int(1000 / per_second), 1) if per_second > 0 else 0
+
+
+def _acquire_publish_slot(session_id: int, interval_ms: int) -> bool:
+    '''
+    Limita las notificaciones a PROGRESS_UPDATES_PER_SECOND por sesión entre
+    todos los workers: solo publica quien crea la clave mientras no expira.
+    '''
+    if not interval_ms:
+        return True
+
+    return bool(get_redis_client().set(
+        f'fisgon:progress:{session_id}', 1, nx=True, px=interval_ms
+    ))
+
+
+def _schedule_trailing_publish(session_id: int, interval_ms: int):
+    '''
+    Programa una publicación al cerrar el intervalo, una por intervalo entre
+    todos los workers, para que la última actualización descartada no se pierda
+    si después no llegan más
+    '''
+    if get_redis_client().set(f'fisgon:progress:trailing:{session_id}', 1, nx=True, px=interval_ms):
+        from .tasks import publish_trailing_progress
+        publish_trailing_progress.apply_async(args=[session_id], countdown=interval_ms / 1000)
+
+
+def publish_session_progress(session_id: int, force: bool = False):
+    '''
+    Envía el estado actual de la sesión a los navegadores suscritos. Las
+    llamadas dentro del intervalo mínimo se descartan y dejan programada una
+    publicación al final del intervalo: cada mensaje lleva el snapshot
+    completo, así que incluye los cambios omitidos.
+    force=True (cambios de estado) publica siempre. Los fallos no son críticos.
+    '''
+    from .models import CrawlSession
+    from .snapshot import refresh_session_snapshot
+
+    # El channel layer y el limitador usan el mismo Redis
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not redis_available():
+        return
+
+    try:
+        if not force:
+            interval_ms = _publish_interval_ms()
+            if not _acquire_publish_slot(session_id, interval_ms):
+                _schedule_trailing_publish(session_id, interval_ms)
+                return
+
+        session = CrawlSession.objects.get(id=session_id)
+        snapshot = refresh_session_snapshot(session)
+
+        async_to_sync(channel_layer.group_send)(
+            session_group_name(session_id),
+            {'type': 'session.progress', 'snapshot': snapshot}
+        )
+    except CrawlSession.DoesNotExist:
+        pass
+    except (redis.RedisError, OSError) as e:
+        logger.debug(f'No se pudo publicar el progreso de la sesión {session_id}: {str(e)}')
+    except Exception as e:
+        logger.warning(f'Error publicando progreso de la sesión {session_id}: {str(e)}')
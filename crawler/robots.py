@@ -0,0 +1,356 @@
+# crawler/robots.py
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+import requests
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .http_client import get_http_session, get_request_headers, release_response
+from .models import RobotsTxt
+
+logger = logging.getLogger('crawler')
+
+# Tamaño máximo que se procesa de un robots.txt (RFC 9309)
+MAX_ROBOTS_BYTES = 500 * 1024
+
+# Caracteres que no se codifican al normalizar rutas y reglas ('*' y '$' son comodines)
+PATH_SAFE_CHARS = "/?=&;:@!$'()*+,~-._"
+
+# Matchers compilados por proceso worker (se revalidan contra RobotsTxt cada ROBOTS_LOCAL_TTL)
+MAX_LOCAL_MATCHERS = 1000
+_matchers: 'OrderedDict[str, Tuple[float, RobotsMatcher]]' = OrderedDict()
+_lock = threading.Lock()
+
+
+def _robots_settings() -> Dict:
+    return settings.CRAWLER_SETTINGS
+
+
+def get_origin(url: str) -> str:
+    '''Esquema y host de una URL (clave del caché de robots.txt)'''
+    parts = urlsplit(url)
+    return f'{parts.scheme.lower()}://{parts.netloc.lower()}'
+
+
+def user_agent_token() -> str:
+    '''Nombre del producto del User-Agent configurado, p. ej. 'fisgoncrawler' '''
+    user_agent = _robots_settings().get('USER_AGENT', '')
+    return user_agent.split('/', 1)[0].strip().lower()
+
+
+def normalize_path(path: str) -> str:
+    '''Ruta con la codificación de caracteres unificada (%-escapes en mayúsculas)'''
+    return quote(unquote(path), safe=PATH_SAFE_CHARS)
+
+
+# =====================================================================
+# Parseo y matcher
+# =====================================================================
+
+def parse_robots_txt(content: str) -> Dict:
+    '''
+    Grupos de reglas por user-agent y sitemaps. Varias líneas User-agent
+    seguidas comparten el mismo grupo; grupos repetidos se combinan.
+    '''
+    groups = {}
+    sitemaps = []
+    current = []
+    in_rules = False
+
+    for line in content.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if ':' not in line:
+            continue
+
+        directive, value = line.split(':', 1)
+        directive = directive.strip().lower()
+        value = value.strip()
+
+        if directive == 'user-agent':
+            if in_rules:
+                current = []
+                in_rules = False
+            agent = value.lower()
+            group = groups.setdefault(agent, {'allow': [], 'disallow': [], 'crawl_delay': None})
+            current.append(group)
+        elif directive in ('allow', 'disallow'):
+            in_rules = True
+            if value:
+                for group in current:
+                    group[directive].append(value)
+        elif directive == 'crawl-delay':
+            in_rules = True
+            try:
+                delay = float(value)
+            except ValueError:
+                continue
+            for group in current:
+                group['crawl_delay'] = delay
+        elif directive == 'sitemap' and value:
+            sitemaps.append(value)
+
+    return {'groups': groups, 'sitemaps': sitemaps}
+
+
+def select_group(groups: Dict, token: str) -> Optional[Dict]:
+    '''Grupo que aplica al crawler: el del user-agent igual al token del producto, o '*' (RFC 9309)'''
+    token = token.lower()
+    for agent, group in groups.items():
+        if agent != '*' and agent.lower() == token:
+            return group
+    return groups.get('*')
+
+
+class RobotsMatcher:
+    '''
+    Reglas Allow/Disallow compiladas. Se ordenan por longitud descendente
+    (Allow primero en empates), así la primera regla que coincide es la más
+    específica. Las reglas sin comodines se comparan como prefijo.
+    temporary indica que no hay reglas por un error pasajero (5xx, red o
+    descarga en curso): se bloquea todo, pero las URLs se postergan en vez de
+    descartarse.
+    '''
+
+    def __init__(self, allow: Iterable[str] = (), disallow: Iterable[str] = (),
+                 crawl_delay: float = None, sitemaps: List[str] = None, disallow_all: bool = False,
+                 temporary: bool = False):
+        self.crawl_delay = crawl_delay
+        self.sitemaps = sitemaps or []
+        self.disallow_all = disallow_all
+        self.temporary = temporary
+        self.allow = list(allow)
+        self.disallow = list(disallow)
+
+        rules = [(pattern, True) for pattern in self.allow] + [(pattern, False) for pattern in self.disallow]
+        rules.sort(key=lambda rule: (-len(rule[0]), not rule[1]))
+        self.rules = [self._compile(pattern, allowed) for pattern, allowed in rules]
+
+    @staticmethod
+    def _compile(pattern: str, allowed: bool):
+        pattern = normalize_path(pattern)
+        anchored = pattern.endswith('$')
+        if anchored:
+            pattern = pattern[:-1]
+        pattern = pattern.rstrip('*') if not anchored else pattern
+
+        if '*' not in pattern and not anchored:
+            return allowed, pattern, None
+
+        regex = '.*'.join(re.escape(part) for part in pattern.split('*'))
+        return allowed, None, re.compile(regex + (r'\Z' if anchored else ''))
+
+    def allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if path == '/robots.txt':
+            return True
+        if self.disallow_all:
+            return False
+
+        target = normalize_path(f'{path}?{parts.query}' if parts.query else path)
+        for allowed, prefix, regex in self.rules:
+            if prefix is not None:
+                if target.startswith(prefix):
+                    return allowed
+            elif regex.match(target):
+                return allowed
+        return True
+
+
+def compile_matcher(entry: RobotsTxt) -> RobotsMatcher:
+    '''Matcher para el crawler a partir de un RobotsTxt almacenado'''
+    rules = entry.rules or {}
+    if entry.status in ('unreachable', 'fetching') and not rules:
+        return RobotsMatcher(disallow_all=True, temporary=True)
+
+    group = select_group(rules.get('groups', {}), user_agent_token()) or {}
+    return RobotsMatcher(
+        allow=group.get('allow', []),
+        disallow=group.get('disallow', []),
+        crawl_delay=group.get('crawl_delay'),
+        sitemaps=rules.get('sitemaps', []),
+    )
+
+
+# =====================================================================
+# Descarga y caché compartido
+# =====================================================================
+
+def _read_body(response) -> str:
+    body = b''
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        body += chunk
+        if len(body) >= MAX_ROBOTS_BYTES:
+            break
+    return body[:MAX_ROBOTS_BYTES].decode('utf-8', errors='replace')
+
+
+def _fetch(entry: RobotsTxt, session_id: int = None) -> RobotsTxt:
+    '''Descarga (o revalida) el robots.txt de entry y guarda el resultado'''
+    config = _robots_settings()
+    now = timezone.now()
+    headers = {}
+    if entry.status == 'ok':
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+
+    robots_url = f'{entry.origin}/robots.txt'
+    timeout = config.get('ROBOTS_FETCH_TIMEOUT', 10)
+    ttl = timedelta(seconds=config.get('ROBOTS_CACHE_TTL', 86400))
+    error_ttl = timedelta(seconds=config.get('ROBOTS_ERROR_TTL', 600))
+
+    try:
+        if session_id is not None:
+            response = get_http_session(session_id).get(robots_url, headers=headers, timeout=timeout, stream=True)
+        else:
+            response = requests.get(
+                robots_url, headers={**get_request_headers(), **headers}, timeout=timeout, stream=True, verify=False
+            )
+        try:
+            status_code = response.status_code
+            body = _read_body(response) if 200 <= status_code < 300 else ''
+            response_headers = response.headers
+        finally:
+            release_response(response)
+    except Exception as e:
+        logger.warning(f'No se pudo descargar {robots_url}: {str(e)}')
+        status_code = None
+
+    entry.http_status = status_code
+    entry.fetched_at = now
+
+    if status_code == 304:
+        entry.expires_at = now + ttl
+    elif status_code is not None and 200 <= status_code < 300:
+        entry.status = 'ok'
+        entry.rules = parse_robots_txt(body)
+        entry.etag = response_headers.get('ETag', '')[:255]
+        entry.last_modified = response_headers.get('Last-Modified', '')[:100]
+        entry.expires_at = now + ttl
+    elif status_code is not None and 400 <= status_code < 500 and status_code != 429:
+        # Sin robots.txt: no hay restricciones
+        entry.status = 'unavailable'
+        entry.rules = {}
+        entry.etag = entry.last_modified = ''
+        entry.expires_at = now + ttl
+    else:
+        # Error de servidor o de red: se conservan las reglas anteriores; sin ellas se bloquea todo
+        if entry.status not in ('ok', 'unavailable'):
+            entry.status = 'unreachable'
+            entry.rules = {}
+        entry.expires_at = now + error_ttl
+
+    entry.save()
+    logger.info(f'robots.txt de {entry.origin}: {entry.status} (HTTP {status_code})')
+    return entry
+
+
+def _wait_for_fetch(origin: str) -> RobotsTxt:
+    '''Espera a que otro worker termine de descargar el robots.txt del origen'''
+    deadline = time.monotonic() + _robots_settings().get('ROBOTS_FETCH_TIMEOUT', 10) + 2
+    while time.monotonic() < deadline:
+        entry = RobotsTxt.objects.filter(origin=origin).first()
+        if entry is not None and entry.status != 'fetching':
+            return entry
+        time.sleep(0.25)
+
+    # Sin respuesta a tiempo: sin reglas, las URLs del origen se postergan
+    return RobotsTxt(origin=origin, status='fetching', expires_at=timezone.now())
+
+
+def get_robots_entry(origin: str, session_id: int = None, wait: bool = True) -> RobotsTxt:
+    '''
+    robots.txt vigente de un origen. Solo un worker lo descarga o revalida a la
+    vez (reclamando la fila); los demás usan las reglas anteriores o esperan.
+    Con wait=False no se espera a otro worker: si no hay reglas anteriores se
+    retorna una entrada 'fetching' sin reglas (el origen queda postergado).
+    '''
+    def wait_for_fetch():
+        if wait:
+            return _wait_for_fetch(origin)
+        return RobotsTxt(origin=origin, status='fetching', expires_at=timezone.now())
+
+    now = timezone.now()
+    lock_until = now + timedelta(seconds=_robots_settings().get('ROBOTS_FETCH_TIMEOUT', 10) + 5)
+
+    entry = RobotsTxt.objects.filter(origin=origin).first()
+    if entry is None:
+        try:
+            entry = RobotsTxt.objects.create(origin=origin, status='fetching', expires_at=lock_until)
+        except IntegrityError:
+            return wait_for_fetch()
+        return _fetch(entry, session_id)
+
+    if entry.expires_at > now:
+        return wait_for_fetch() if entry.status == 'fetching' else entry
+
+    claimed = RobotsTxt.objects.filter(id=entry.id, expires_at=entry.expires_at).update(expires_at=lock_until)
+    if claimed:
+        return _fetch(entry, session_id)
+    return wait_for_fetch() if entry.status == 'fetching' else entry
+
+
+def get_robots_matcher(url: str, session_id: int = None, wait: bool = True) -> RobotsMatcher:
+    '''Matcher del origen de url, compilado una vez por proceso mientras esté vigente'''
+    origin = get_origin(url)
+    now = time.monotonic()
+
+    with _lock:
+        cached = _matchers.get(origin)
+        if cached is not None and cached[0] > now:
+            _matchers.move_to_end(origin)
+            return cached[1]
+
+    entry = get_robots_entry(origin, session_id, wait=wait)
+    matcher = compile_matcher(entry)
+
+    if entry.status != 'fetching':
+        remaining = (entry.expires_at - timezone.now()).total_seconds()
+        ttl = min(_robots_settings().get('ROBOTS_LOCAL_TTL', 60), max(remaining, 1))
+        with _lock:
+            _matchers[origin] = (now + ttl, matcher)
+            _matchers.move_to_end(origin)
+            while len(_matchers) > MAX_LOCAL_MATCHERS:
+                _matchers.popitem(last=False)
+    return matcher
+
+
+def clear_local_matchers():
+    '''Descarta los matchers compilados de este proceso'''
+    with _lock:
+        _matchers.clear()
+
+
+def is_allowed(url: str, session_id: int = None) -> bool:
+    '''True si robots.txt permite al crawler descargar url'''
+    return get_robots_matcher(url, session_id).allowed(url)
+
+
+def fetch_permission(url: str, session_id: int = None, wait: bool = True) -> Optional[bool]:
+    '''True / False según robots.txt, o None si no hay reglas por un error pasajero (reintentar más tarde)'''
+    matcher = get_robots_matcher(url, session_id, wait=wait)
+    if matcher.temporary:
+        return None
+    return matcher.allowed(url)
+
+
+def filter_allowed(urls: Iterable[str], session_id: int = None, wait: bool = True) -> Tuple[List[str], List[str]]:
+    '''
+    Separa urls en (permitidas, bloqueadas por robots.txt). Las de orígenes
+    sin reglas por un error pasajero quedan entre las permitidas: se vuelven a
+    verificar al descargarlas (fetch_permission).
+    '''
+    allowed, blocked = [], []
+    for url in urls:
+        (blocked if fetch_permission(url, session_id, wait=wait) is False else allowed).append(url)
+    return allowed, blocked
@@ -4,4 +4,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/crawler/$', consumers.CrawlerConsumer.as_asgi()),
+    re_path(r'ws/crawler/sessions/(?P<session_id>\d+)/$', consumers.SessionProgressConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,77 @@
+# crawler/scanner.py
+import heapq
+import re
+from typing import Any, Dict, Iterator, NamedTuple
+
+# Patrones de datos sensibles, compilados una sola vez al importar el módulo
+SENSITIVE_PATTERNS = {
+    'rut': r'\b\d{1,2}\.\d{3}\.\d{3}-[\dkK]\b',  # RUT chileno
+    'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b',  # Email
+    'card': r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b',  # Tarjeta/cuenta
+    'secret_keyword': r'\b(?:password|passwd|clave|token|key)',  # Palabras clave sensibles
+    'phone': r'\b(?:\+56|56)?\s?9\s?\d{4}\s?\d{4}\b',  # Teléfonos chilenos
+}
+
+COMPILED_PATTERNS = {
+    name: re.compile(pattern, re.IGNORECASE) for name, pattern in SENSITIVE_PATTERNS.items()
+}
+
+# Expresión combinada para saber si un texto corto (p. ej. una celda) tiene algún dato sensible
+SENSITIVE_DATA_RE = re.compile(
+    '|'.join(f'(?P<{name}>{pattern})' for name, pattern in SENSITIVE_PATTERNS.items()),
+    re.IGNORECASE
+)
+
+# Hallazgos guardados por documento (los conteos incluyen todos)
+MAX_FINDINGS = 100
+
+
+class Finding(NamedTuple):
+    '''Dato sensible encontrado en un texto (posiciones en caracteres)'''
+    type: str
+    start: int
+    end: int
+    value: str
+
+
+def contains_sensitive_data(text: str) -> bool:
+    '''True si el texto contiene algún dato sensible'''
+    return bool(text) and SENSITIVE_DATA_RE.search(text) is not None
+
+
+def _iter_type(name: str, text: str) -> Iterator[Finding]:
+    for match in COMPILED_PATTERNS[name].finditer(text):
+        yield Finding(name, match.start(), match.end(), match.group())
+
+
+def iter_findings(text: str) -> Iterator[Finding]:
+    '''
+    Hallazgos ordenados por posición, entregados a medida que se encuentran.
+    Cada patrón recorre el texto por separado (en textos largos es más rápido
+    que una alternativa combinada) y los resultados se intercalan por posición.
+    '''
+    if not text:
+        return
+    yield from heapq.merge(*(_iter_type(name, text) for name in COMPILED_PATTERNS), key=lambda finding: finding.start)
+
+
+def scan_text(text: str, max_findings: int = MAX_FINDINGS) -> Dict[str, Any]:
+    '''
+    Resumen de datos sensibles de un texto extraído: cantidad por tipo y los
+    primeros max_findings hallazgos con su posición
+    '''
+    counts = {name: 0 for name in SENSITIVE_PATTERNS}
+    findings = []
+
+    for finding in iter_findings(text):
+        counts[finding.type] += 1
+        if len(findings) < max_findings:
+            findings.append(finding._asdict())
+
+    total = sum(counts.values())
+    return {
+        'total': total,
+        'counts': {name: count for name, count in counts.items() if count},
+        'findings': findings,
+        'truncated': total > len(findings),
+    }
@@ -0,0 +1,368 @@
+# crawler/search.py
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .content_store import load_content, load_contents
+
+logger = logging.getLogger('crawler')
+
+# Índice de texto completo: tabla virtual FTS5 (SQLite) o tabla con tsvector + GIN (PostgreSQL)
+SEARCH_TABLE = 'crawler_search_index'
+
+# Marcadores de resaltado: se reemplazan por <mark> después de escapar el texto
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# Peso de cada columna en el ranking (nombre, URL, título, descripción, contenido)
+SQLITE_RANK_WEIGHTS = (5.0, 2.0, 8.0, 3.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_backend(using=None) -> Optional[str]:
+    '''Motor de búsqueda disponible para la base de datos ('sqlite', 'postgresql') o None'''
+    if not settings.CRAWLER_SETTINGS.get('SEARCH_INDEX_ENABLED', True):
+        return None
+    using = using or connection
+    if using.vendor not in ('sqlite', 'postgresql') or not search_index_exists(using):
+        return None
+    return using.vendor
+
+
+# Si la tabla del índice existe, por conexión. Se limpia con post_migrate
+_index_tables: Dict[str, bool] = {}
+
+
+def search_index_exists(using=None) -> bool:
+    '''
+    True si la tabla del índice existe. Si falta (migración sin soporte del
+    motor) las búsquedas usan el filtro simple en lugar de fallar
+    '''
+    using = using or connection
+    if using.alias not in _index_tables:
+        _index_tables[using.alias] = SEARCH_TABLE in using.introspection.table_names()
+    return _index_tables[using.alias]
+
+
+def clear_index_cache():
+    _index_tables.clear()
+
+
+def _text_config() -> str:
+    return settings.CRAWLER_SETTINGS.get('SEARCH_TEXT_CONFIG', 'spanish')
+
+
+def _max_chars() -> int:
+    return settings.CRAWLER_SETTINGS.get('SEARCH_INDEX_MAX_CHARS', 1000000)
+
+
+# =====================================================================
+# Indexación
+# =====================================================================
+
+def index_result(result, content: str = None) -> bool:
+    '''
+    Agrega o reemplaza un CrawlResult en el índice. Sin content se carga el
+    contenido almacenado. Los errores se registran sin interrumpir la
+    extracción (la búsqueda simplemente no lo encontrará).
+    '''
+    vendor = search_backend()
+    if vendor is None:
+        return False
+
+    url = result.url_queue_item.url if result.url_queue_item_id else ''
+    if content is None:
+        content = load_content(result)
+    content = (content or '')[:_max_chars()]
+    fields = [result.file_name or '', url, result.title or '', result.description or '']
+
+    try:
+        with connection.cursor() as cursor:
+            if vendor == 'sqlite':
+                cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [result.id])
+                cursor.execute(
+                    f'INSERT INTO {SEARCH_TABLE} (rowid, session_id, file_name, url, title, description, content) '
+                    'VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                    [result.id, result.session_id, *fields, content]
+                )
+            else:
+                config = _text_config()
+                cursor.execute(
+                    f'INSERT INTO {SEARCH_TABLE} (result_id, session_id, document) VALUES (%s, %s, '
+                    "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+                    "setweight(to_tsvector(%s::regconfig, %s), 'B') || "
+                    "setweight(to_tsvector(%s::regconfig, %s), 'D')) "
+                    'ON CONFLICT (result_id) DO UPDATE SET session_id = EXCLUDED.session_id, document = EXCLUDED.document',
+                    [
+                        result.id, result.session_id,
+                        config, f'{fields[0]} {fields[2]}',
+                        config, f'{fields[1]} {fields[3]}',
+                        config, content,
+                    ]
+                )
+        return True
+    except Exception as e:
+        logger.warning(f'No se pudo indexar el resultado {result.id}: {str(e)}')
+        return False
+
+
+def remove_from_index(result_ids: Sequence[int] = (), session_id: int = None):
+    '''Elimina resultados (o todos los de una sesión) del índice'''
+    vendor = search_backend()
+    if vendor is None or (not result_ids and session_id is None):
+        return
+
+    id_column = 'rowid' if vendor == 'sqlite' else 'result_id'
+    try:
+        with connection.cursor() as cursor:
+            if session_id is not None and vendor == 'sqlite':
+                # La tabla FTS5 sin contenido no guarda session_id: se usan los resultados (aún no borrados)
+                cursor.execute(
+                    f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT id FROM crawler_crawlresult WHERE session_id = %s)',
+                    [session_id]
+                )
+            elif session_id is not None:
+                cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE session_id = %s', [session_id])
+            else:
+                placeholders = ', '.join(['%s'] * len(result_ids))
+                cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {id_column} IN ({placeholders})', list(result_ids))
+    except Exception as e:
+        logger.warning(f'No se pudo actualizar el índice de búsqueda: {str(e)}')
+
+
+# =====================================================================
+# Búsqueda
+# =====================================================================
+
+def fts_query(text: str) -> str:
+    '''
+    Consulta FTS5 segura a partir del texto del usuario: todas las palabras
+    (AND), la última también como prefijo
+    '''
+    tokens = TOKEN_RE.findall(text)
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    return ' '.join(terms)
+
+
+def _fold(text: str) -> str:
+    '''Minúsculas y sin tildes, como el tokenizador unicode61 con remove_diacritics'''
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def make_snippet(text: str, query: str, words: int = 24) -> str:
+    '''
+    Fragmento de text alrededor de la primera coincidencia de query, con las
+    mismas reglas que fts_query (la última palabra también como prefijo)
+    '''
+    terms = [_fold(token) for token in TOKEN_RE.findall(query)]
+    if not text or not terms:
+        return ''
+    exact, prefix = set(terms[:-1]), terms[-1]
+
+    def matches(token: str) -> bool:
+        token = _fold(token)
+        return token in exact or token.startswith(prefix)
+
+    tokens = list(TOKEN_RE.finditer(text))
+    first = next((i for i, match in enumerate(tokens) if matches(match.group())), 0)
+    start = max(first - words // 4, 0)
+    window = tokens[start:start + words]
+    if not window:
+        return ''
+
+    parts = ['…' if start > 0 else '']
+    position = window[0].start()
+    for match in window:
+        parts.append(text[position:match.start()])
+        if matches(match.group()):
+            parts.append(f'{HIGHLIGHT_START}{match.group()}{HIGHLIGHT_END}')
+        else:
+            parts.append(match.group())
+        position = match.end()
+    # Puntuación hasta la siguiente palabra (o el final del texto)
+    end = start + len(window)
+    parts.append(text[position:tokens[end].start() if end < len(tokens) else len(text)].rstrip())
+    if end < len(tokens):
+        parts.append('…')
+    return ''.join(parts)
+
+
+def highlight(snippet: str) -> str:
+    '''Fragmento con las coincidencias en <mark> (el resto del texto escapado)'''
+    if not snippet:
+        return ''
+    return mark_safe(
+        escape(snippet).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+    )
+
+
+class SearchResults:
+    '''
+    Resultados de una búsqueda de texto completo ordenados por relevancia.
+    Se comporta como una secuencia para Paginator: count() y cada página
+    ejecutan una consulta al índice (LIMIT/OFFSET) y cargan solo esos
+    CrawlResult, cada uno con search_rank y search_snippet.
+    '''
+
+    def __init__(self, text: str, queryset):
+        self.text = text
+        self.queryset = queryset
+        self.vendor = search_backend()
+        self._count = None
+
+    def _restriction(self):
+        '''Subconsulta con los ids permitidos (sesión, tipo de archivo, usuario)'''
+        sql, params = self.queryset.order_by().values('id').query.sql_with_params()
+        return sql, list(params)
+
+    def count(self) -> int:
+        if self._count is None:
+            self._count = self._count_matches()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = index.start or 0
+            stop = index.stop if index.stop is not None else self.count()
+            return self.page(start, max(stop - start, 0))
+        hits = self.page(index, 1)
+        if not hits:
+            raise IndexError(index)
+        return hits[0]
+
+    def _count_matches(self) -> int:
+        restriction, params = self._restriction()
+        with connection.cursor() as cursor:
+            if self.vendor == 'sqlite':
+                cursor.execute(
+                    f'WITH hits AS MATERIALIZED (SELECT rowid AS id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s) '
+                    f'SELECT count(*) FROM hits WHERE id IN ({restriction})',
+                    [fts_query(self.text), *params]
+                )
+            else:
+                cursor.execute(
+                    f'SELECT count(*) FROM {SEARCH_TABLE} '
+                    'WHERE document @@ websearch_to_tsquery(%s::regconfig, %s) '
+                    f'AND result_id IN ({restriction})',
+                    [_text_config(), self.text, *params]
+                )
+            return cursor.fetchone()[0]
+
+    def _ranked_ids(self, offset: int, limit: int) -> List[tuple]:
+        restriction, params = self._restriction()
+        with connection.cursor() as cursor:
+            if self.vendor == 'sqlite':
+                weights = ', '.join(str(weight) for weight in SQLITE_RANK_WEIGHTS)
+                cursor.execute(
+                    'WITH hits AS MATERIALIZED ('
+                    f'SELECT rowid AS id, bm25({SEARCH_TABLE}, 0, {weights}) AS rank '
+                    f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s) '
+                    f'SELECT id, rank FROM hits WHERE id IN ({restriction}) '
+                    'ORDER BY rank LIMIT %s OFFSET %s',
+                    [fts_query(self.text), *params, limit, offset]
+                )
+            else:
+                cursor.execute(
+                    f'SELECT result_id, ts_rank_cd(document, query) AS rank FROM {SEARCH_TABLE}, '
+                    'websearch_to_tsquery(%s::regconfig, %s) query '
+                    f'WHERE document @@ query AND result_id IN ({restriction}) '
+                    'ORDER BY rank DESC LIMIT %s OFFSET %s',
+                    [_text_config(), self.text, *params, limit, offset]
+                )
+            return cursor.fetchall()
+
+    def _documents(self, hits: List[Any]) -> List[str]:
+        '''Texto de donde sale el fragmento de cada resultado: el índice no guarda el contenido'''
+        contents = load_contents(hit.id for hit in hits)
+        return [
+            (contents.get(hit.id) or f'{hit.title} {hit.description} {hit.file_name}')[:100000]
+            for hit in hits
+        ]
+
+    def _snippets(self, hits: List[Any]) -> Dict[int, str]:
+        '''Fragmentos de SQLite, generados en Python solo para los resultados de la página'''
+        return {
+            hit.id: make_snippet(document, self.text)
+            for hit, document in zip(hits, self._documents(hits))
+        }
+
+    def _headlines(self, hits: List[Any]) -> Dict[int, str]:
+        '''Fragmentos de PostgreSQL (ts_headline) solo para los resultados de la página'''
+        documents = self._documents(hits)
+        config = _text_config()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT doc.id, ts_headline(%s::regconfig, doc.body, websearch_to_tsquery(%s::regconfig, %s), %s) '
+                'FROM unnest(%s::integer[], %s::text[]) AS doc(id, body)',
+                [
+                    config, config, self.text,
+                    f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords=30, MinWords=10',
+                    [hit.id for hit in hits], documents,
+                ]
+            )
+            return dict(cursor.fetchall())
+
+    def page(self, offset: int, limit: int) -> List[Any]:
+        if limit <= 0 or not self.has_terms:
+            return []
+
+        rows = self._ranked_ids(offset, limit)
+        results = self.queryset.filter(id__in=[row[0] for row in rows]).in_bulk()
+
+        hits = []
+        for result_id, rank in rows:
+            result = results.get(result_id)
+            if result is None:
+                continue
+            result.search_rank = rank
+            hits.append(result)
+
+        if hits:
+            snippets = self._headlines(hits) if self.vendor == 'postgresql' else self._snippets(hits)
+            for result in hits:
+                result.search_snippet = highlight(snippets.get(result.id, ''))
+        return hits
+
+    @property
+    def has_terms(self) -> bool:
+        return bool(TOKEN_RE.search(self.text))
+
+
+def search_results(text: str, queryset):
+    '''
+    Búsqueda de texto completo dentro de queryset (CrawlResult ya filtrados
+    por sesión, tipo o usuario). Sin índice disponible se usa la búsqueda
+    simple por nombre, URL, título y descripción.
+    '''
+    if search_backend() and TOKEN_RE.search(text):
+        return SearchResults(text, queryset)
+
+    return queryset.filter(
+        Q(file_name__icontains=text) |
+        Q(url_queue_item__url__icontains=text) |
+        Q(title__icontains=text) |
+        Q(description__icontains=text)
+    )
+
+
+def rebuild_search_index(queryset, batch_size: int = 500) -> int:
+    '''Reindexa los resultados de queryset; retorna cuántos se indexaron'''
+    indexed = 0
+    for result in queryset.select_related('url_queue_item', 'content').iterator(chunk_size=batch_size):
+        if index_result(result):
+            indexed += 1
+    return indexed
@@ -1,47 +1,67 @@
-from django.db.models.signals import post_save, pre_delete
+from django.db import transaction
+from django.db.models.signals import post_migrate, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 import os
 import logging
 
-from .models import CrawlSession, CrawlResult, URLQueue
+from .metadata_utils import update_session_aggregates
+from .models import CrawlSession, CrawlResult, ExportJob, SessionMetadataAggregate
+from .progress import publish_session_progress
+from .search import clear_index_cache, remove_from_index
+from .snapshot import invalidate_session_snapshot
+from .storage import is_blob_path, release_blob
 
 logger = logging.getLogger('crawler')
 
 
+@receiver(post_migrate)
+def reset_search_index_cache(sender, **kwargs):
+    """
+    Las migraciones crean o eliminan la tabla del índice de búsqueda: se
+    vuelve a comprobar si existe
+    """
+    clear_index_cache()
+
+
+# Campos de CrawlSession que forman parte del snapshot de progreso
+SNAPSHOT_FIELDS = {
+    'status', 'started_at', 'completed_at', 'max_pages',
+    'total_urls_discovered', 'total_urls_processed', 'total_files_found', 'total_errors',
+}
+
+
 @receiver(post_save, sender=CrawlSession)
-def crawl_session_created(sender, instance, created, **kwargs):
+def crawl_session_created(sender, instance, created, update_fields=None, **kwargs):
     """
     Se ejecuta cuando se crea o actualiza una sesión de crawling
     """
+    if not created and (update_fields is None or SNAPSHOT_FIELDS & set(update_fields)):
+        # Cambios de estado visibles de inmediato en los dashboards y navegadores suscritos
+        invalidate_session_snapshot(instance.id)
+        publish_session_progress(instance.id, force=True)
+
     if created:
         logger.info(f'Nueva sesión de crawling creada: {instance.name} por {instance.user.username}')
 
+        # Agregados de metadatos vacíos: cada extracción los actualiza
+        SessionMetadataAggregate.objects.get_or_create(session=instance)
+
         # Crear directorio para almacenar archivos de esta sesión
         from django.conf import settings
         session_dir = os.path.join(settings.MEDIA_ROOT, 'crawler', str(instance.id))
         os.makedirs(session_dir, exist_ok=True)
 
 
-@receiver(post_save, sender=URLQueue)
-def url_queue_updated(sender, instance, created, **kwargs):
-    """
-    Se ejecuta cuando se actualiza el estado de una URL en la cola
-    """
-    if not created and instance.status == 'completed':
-        # Actualizar estadísticas de la sesión
-        session = instance.session
-        session.total_urls_processed = session.url_queue.filter(status='completed').count()
-        session.total_files_found = session.results.count()
-        session.total_errors = session.url_queue.filter(status='failed').count()
-        session.save(update_fields=['total_urls_processed', 'total_files_found', 'total_errors'])
-
-
 @receiver(pre_delete, sender=CrawlSession)
 def cleanup_session_files(sender, instance, **kwargs):
     """
-    Limpia archivos cuando se elimina una sesión
+    Limpia archivos cuando se elimina una sesión (los blobs compartidos se
+    liberan al borrarse en cascada cada CrawlResult)
     """
+    # Entradas del índice de búsqueda de toda la sesión en una sola consulta
+    remove_from_index(session_id=instance.id)
+
     try:
         from django.conf import settings
         import shutil
@@ -54,14 +74,47 @@ def cleanup_session_files(sender, instance, **kwargs):
         logger.error(f'Error eliminando archivos de sesión {instance.id}: {str(e)}')
 
 
-@receiver(pre_delete, sender=CrawlResult)
+@receiver(post_delete, sender=CrawlResult)
 def cleanup_result_file(sender, instance, **kwargs):
     """
-    Elimina archivo físico cuando se borra un resultado
+    Elimina el archivo físico cuando se borra un resultado. Los blobs compartidos
+    solo se eliminan cuando ya no queda ningún resultado que los referencie
     """
-    try:
-        if instance.file_path and os.path.exists(instance.file_path):
-            os.remove(instance.file_path)
-            logger.info(f'Archivo eliminado: {instance.file_path}')
-    except Exception as e:
-        logger.error(f'Error eliminando archivo {instance.file_path}: {str(e)}')
+    file_path = instance.file_path
+    file_hash = instance.file_hash
+
+    # Al borrar la sesión completa los agregados se eliminan con ella
+    origin = kwargs.get('origin')
+    if getattr(origin, 'model', type(origin)) is not CrawlSession:
+        update_session_aggregates(instance.session_id, instance.metadata, {})
+        remove_from_index([instance.id])
+
+    def remove_file():
+        try:
+            if is_blob_path(file_path):
+                release_blob(file_path, file_hash)
+            elif file_path and os.path.exists(file_path):
+                os.remove(file_path)
+                logger.info(f'Archivo eliminado: {file_path}')
+        except Exception as e:
+            logger.error(f'Error eliminando archivo {file_path}: {str(e)}')
+
+    # Esperar al commit para contar referencias sobre datos definitivos
+    transaction.on_commit(remove_file)
+
+
+@receiver(post_delete, sender=ExportJob)
+def cleanup_export_file(sender, instance, **kwargs):
+    """
+    Elimina el archivo generado cuando se borra una exportación
+    """
+    file_path = instance.file_path
+
+    def remove_file():
+        try:
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+        except Exception as e:
+            logger.error(f'Error eliminando exportación {file_path}: {str(e)}')
+
+    transaction.on_commit(remove_file)
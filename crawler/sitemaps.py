@@ -0,0 +1,170 @@
+# crawler/sitemaps.py
+import gzip
+import io
+import logging
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from urllib.parse import urljoin
+from xml.etree.ElementTree import ParseError, iterparse
+
+from django.conf import settings
+from django.utils import timezone
+
+from .http_client import get_http_session, release_response
+from .utils import get_url_priority
+
+logger = logging.getLogger('crawler')
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Límite del protocolo sitemaps.org: 50 MB sin comprimir por archivo
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024
+
+
+class SitemapError(Exception):
+    '''Sitemap inválido o que supera los límites configurados'''
+
+
+class SitemapEntry(NamedTuple):
+    '''<url> (kind='url') o <sitemap> de un índice (kind='sitemap')'''
+    kind: str
+    loc: str
+    lastmod: Optional[datetime]
+
+
+class LimitedReader(io.RawIOBase):
+    '''Lector que falla al superar max_bytes (protege de sitemaps .gz gigantes)'''
+
+    def __init__(self, stream, max_bytes: int):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.read_bytes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        self.read_bytes += len(data)
+        if self.read_bytes > self.max_bytes:
+            raise SitemapError(f'Sitemap mayor a {self.max_bytes} bytes')
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def parse_lastmod(value: str) -> Optional[datetime]:
+    '''Fecha W3C de <lastmod> (fecha sola o con hora); None si no es válida'''
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+
+def open_sitemap(stream, max_bytes: int = MAX_SITEMAP_BYTES):
+    '''Stream de lectura del XML, descomprimiendo si es .gz (detectado por la firma)'''
+    buffered = io.BufferedReader(LimitedReader(stream, max_bytes))
+    if buffered.peek(2)[:2] == GZIP_MAGIC:
+        return io.BufferedReader(LimitedReader(gzip.GzipFile(fileobj=buffered), max_bytes))
+    return buffered
+
+
+def iter_sitemap(stream) -> Iterator[SitemapEntry]:
+    '''
+    Entradas de un sitemap o índice de sitemaps leídas con iterparse: cada
+    <url> / <sitemap> se entrega y se libera, la memoria no crece con el archivo.
+    '''
+    root = None
+    loc = lastmod = None
+
+    try:
+        for event, element in iterparse(stream, events=('start', 'end')):
+            if root is None:
+                root = element
+            if event != 'end':
+                continue
+
+            tag = element.tag.rsplit('}', 1)[-1]
+            if tag == 'loc':
+                loc = (element.text or '').strip()
+            elif tag == 'lastmod':
+                lastmod = parse_lastmod(element.text or '')
+            elif tag in ('url', 'sitemap'):
+                if loc:
+                    yield SitemapEntry(tag, loc, lastmod)
+                loc = lastmod = None
+                root.clear()
+    except ParseError as e:
+        raise SitemapError(f'XML inválido: {str(e)}')
+
+
+def sitemap_priority(url: str, lastmod: Optional[datetime], now: datetime = None) -> int:
+    '''
+    Prioridad de URLQueue (menor = antes) según el tipo de archivo, adelantando
+    los documentos modificados recientemente y postergando los antiguos
+    '''
+    priority = get_url_priority(url)
+    if lastmod is None:
+        return priority
+
+    config = settings.CRAWLER_SETTINGS
+    age_days = ((now or timezone.now()) - lastmod).days
+    if age_days <= config.get('SITEMAP_FRESH_DAYS', 30):
+        return max(priority - 1, 1)
+    if age_days > config.get('SITEMAP_STALE_DAYS', 365):
+        return priority + 1
+    return priority
+
+
+def fetch_sitemap_entries(url: str, session_id: int) -> Iterator[SitemapEntry]:
+    '''Descarga un sitemap en streaming y entrega sus entradas'''
+    timeout = settings.CRAWLER_SETTINGS.get('TIMEOUT', 30)
+    response = get_http_session(session_id).get(url, timeout=timeout, stream=True)
+    try:
+        if response.status_code != 200:
+            raise SitemapError(f'HTTP {response.status_code}')
+        response.raw.decode_content = True  # Content-Encoding: gzip lo resuelve urllib3
+        yield from iter_sitemap(open_sitemap(response.raw))
+    finally:
+        release_response(response)
+
+
+def iter_sitemap_urls(sitemap_urls: List[str], session_id: int, stats: Dict = None) -> Iterator[SitemapEntry]:
+    '''
+    URLs de página de los sitemaps indicados, recorriendo los índices en
+    anchura. Se detiene al alcanzar SITEMAP_MAX_URLS o SITEMAP_MAX_FILES.
+    Los errores de un sitemap se registran en stats y no detienen el resto.
+    '''
+    config = settings.CRAWLER_SETTINGS
+    max_urls = config.get('SITEMAP_MAX_URLS', 100000)
+    max_files = config.get('SITEMAP_MAX_FILES', 100)
+    stats = stats if stats is not None else {}
+    stats.update({'sitemaps': 0, 'urls': 0, 'errors': []})
+
+    pending = deque(sitemap_urls)
+    seen = set(sitemap_urls)
+
+    while pending and stats['sitemaps'] < max_files:
+        sitemap_url = pending.popleft()
+        stats['sitemaps'] += 1
+        try:
+            for entry in fetch_sitemap_entries(sitemap_url, session_id):
+                if entry.kind == 'sitemap':
+                    child = urljoin(sitemap_url, entry.loc)
+                    if child not in seen:
+                        seen.add(child)
+                        pending.append(child)
+                    continue
+
+                stats['urls'] += 1
+                yield SitemapEntry('url', urljoin(sitemap_url, entry.loc), entry.lastmod)
+                if stats['urls'] >= max_urls:
+                    return
+        except Exception as e:
+            logger.warning(f'Error leyendo sitemap {sitemap_url}: {str(e)}')
+            stats['errors'].append({'url': sitemap_url, 'error': str(e)})
@@ -0,0 +1,97 @@
+# crawler/snapshot.py
+import logging
+from typing import Any, Dict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.db.models import Count
+
+from .models import CrawlSession, URLQueue
+
+logger = logging.getLogger('crawler')
+
+URL_STATUSES = ('pending', 'processing', 'completed', 'failed', 'skipped')
+
+
+def get_shared_cache():
+    '''Caché compartida entre procesos web y workers (alias 'crawler' si existe)'''
+    try:
+        return caches['crawler']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def _snapshot_key(session_id: int) -> str:
+    return f'fisgon:snapshot:{session_id}'
+
+
+def get_url_stats(session_id: int) -> Dict[str, int]:
+    '''Cantidad de URLs por estado de una sesión en una sola consulta agrupada'''
+    counts = dict(
+        URLQueue.objects.filter(session_id=session_id)
+        .order_by()
+        .values_list('status')
+        .annotate(total=Count('id'))
+    )
+    return {status: counts.get(status, 0) for status in URL_STATUSES}
+
+
+def build_session_snapshot(session: CrawlSession) -> Dict[str, Any]:
+    return {
+        'id': session.id,
+        'status': session.status,
+        'status_display': session.get_status_display(),
+        'progress_percentage': session.progress_percentage,
+        'total_urls_discovered': session.total_urls_discovered,
+        'total_urls_processed': session.total_urls_processed,
+        'total_files_found': session.total_files_found,
+        'total_errors': session.total_errors,
+        'url_stats': get_url_stats(session.id),
+        'is_active': session.is_active,
+        'started_at': session.started_at.isoformat() if session.started_at else None,
+        'completed_at': session.completed_at.isoformat() if session.completed_at else None,
+    }
+
+
+def get_session_snapshot(session: CrawlSession) -> Dict[str, Any]:
+    '''
+    Estado y estadísticas de una sesión, cacheados unos segundos
+    (SNAPSHOT_TTL) para que los dashboards que consultan el progreso
+    compartan una sola consulta. Si la caché falla se calcula directamente.
+    '''
+    cache = get_shared_cache()
+    key = _snapshot_key(session.id)
+
+    try:
+        snapshot = cache.get(key)
+    except Exception as e:
+        logger.debug(f'Caché de snapshots no disponible: {str(e)}')
+        return build_session_snapshot(session)
+
+    if snapshot is None:
+        snapshot = build_session_snapshot(session)
+        try:
+            cache.set(key, snapshot, settings.CRAWLER_SETTINGS.get('SNAPSHOT_TTL', 2))
+        except Exception as e:
+            logger.debug(f'No se pudo guardar el snapshot de la sesión {session.id}: {str(e)}')
+
+    return snapshot
+
+
+def refresh_session_snapshot(session: CrawlSession) -> Dict[str, Any]:
+    '''Recalcula el snapshot y lo deja en caché (lo usan las notificaciones de progreso)'''
+    snapshot = build_session_snapshot(session)
+    try:
+        get_shared_cache().set(_snapshot_key(session.id), snapshot, settings.CRAWLER_SETTINGS.get('SNAPSHOT_TTL', 2))
+    except Exception as e:
+        logger.debug(f'No se pudo guardar el snapshot de la sesión {session.id}: {str(e)}')
+    return snapshot
+
+
+def invalidate_session_snapshot(session_id: int):
+    '''Descarta el snapshot cacheado (p. ej. al cambiar el estado de la sesión)'''
+    try:
+        get_shared_cache().delete(_snapshot_key(session_id))
+    except Exception as e:
+        logger.debug(f'No se pudo invalidar el snapshot de la sesión {session_id}: {str(e)}')
@@ -0,0 +1,187 @@
+# crawler/storage.py
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+
+logger = logging.getLogger('crawler')
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# Tamaño de los bloques leídos de la red y escritos a disco
+CHUNK_SIZE = 64 * 1024
+
+
+class FileTooLarge(Exception):
+    '''El cuerpo de la respuesta superó el tamaño máximo permitido'''
+
+
+def get_session_storage_dir(session_id: int) -> str:
+    '''Directorio de archivos temporales (y heredados) de una sesión de crawling'''
+    return os.path.join(settings.MEDIA_ROOT, 'crawler', str(session_id))
+
+
+def get_blob_root() -> str:
+    '''Directorio del almacén de archivos direccionado por contenido'''
+    return os.path.join(settings.MEDIA_ROOT, 'crawler', 'blobs')
+
+
+def get_blob_path(file_hash: str, file_name: str = '') -> str:
+    '''
+    Ruta del blob de un archivo: blobs/<ab>/<cd>/<sha256>.<ext>. Se conserva la
+    extensión porque los extractores de metadatos eligen el formato por ella.
+    '''
+    extension = os.path.splitext(file_name)[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,10}', extension):
+        extension = ''
+    return os.path.join(get_blob_root(), file_hash[:2], file_hash[2:4], f'{file_hash}{extension}')
+
+
+def is_blob_path(file_path: str) -> bool:
+    return bool(file_path) and os.path.abspath(file_path).startswith(get_blob_root() + os.sep)
+
+
+@contextmanager
+def blob_lock(file_hash: str):
+    '''
+    Lock entre procesos (flock) para un hash. store_blob y release_blob lo
+    toman para que un blob no se elimine entre que otra descarga lo encuentra
+    y su CrawlResult queda apuntándolo. Se usan 256 archivos de lock
+    (por los dos primeros caracteres del hash) para no acumular uno por blob.
+    '''
+    if not FCNTL_AVAILABLE:
+        yield
+        return
+
+    lock_dir = os.path.join(get_blob_root(), '.locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, file_hash[:2] or '_'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def store_blob(temp_path: str, blob_path: str, file_hash: str) -> bool:
+    '''
+    Mueve una descarga temporal a su blob. Si el contenido ya estaba almacenado
+    el temporal se descarta. Retorna True si se escribió un blob nuevo.
+    El CrawlResult que referencia el blob debe existir antes de llamarla.
+    '''
+    with blob_lock(file_hash):
+        if os.path.exists(blob_path):
+            os.remove(temp_path)
+            return False
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(temp_path, blob_path)  # Atómico: dos descargas iguales dejan el mismo blob
+        return True
+
+
+def release_blob(file_path: str, file_hash: str):
+    '''Elimina un blob si ningún CrawlResult lo referencia'''
+    from .models import CrawlResult
+
+    # La verificación y el borrado ocurren bajo el mismo lock que store_blob
+    with blob_lock(file_hash):
+        if CrawlResult.objects.filter(file_hash=file_hash, file_path=file_path).exists():
+            return
+
+        try:
+            os.remove(file_path)
+            logger.info(f'Blob eliminado: {file_path}')
+        except FileNotFoundError:
+            pass
+
+
+class DownloadWriter:
+    '''
+    Escribe una descarga en un archivo temporal (.part) mientras calcula su
+    SHA-256, sin mantener el contenido en memoria
+    '''
+
+    def __init__(self, directory: str, max_size: int = 0):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self._file = os.fdopen(fd, 'wb')
+        self._sha256 = hashlib.sha256()
+        self.max_size = max_size
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.max_size and self.size > self.max_size:
+            raise FileTooLarge(f'Más de {self.max_size} bytes')
+        self._sha256.update(chunk)
+        self._file.write(chunk)
+
+    def close(self) -> str:
+        '''Cierra el archivo y retorna el hash SHA-256 del contenido'''
+        if not self._file.closed:
+            self._file.close()
+        return self._sha256.hexdigest()
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ResponseBody:
+    '''
+    Cuerpo de una respuesta HTTP leído por bloques. Según lo que se necesite
+    de la URL se conserva en memoria (HTML para extraer enlaces), se escribe a
+    disco (archivos de interés) o solo se cuenta su tamaño.
+    '''
+
+    def __init__(self, max_size: int = 0, keep_in_memory: bool = False,
+                 storage_dir: Optional[str] = None):
+        self.max_size = max_size
+        self.size = 0
+        self._chunks = [] if keep_in_memory else None
+        self._writer = DownloadWriter(storage_dir, max_size) if storage_dir else None
+        self.file_path = None
+        self.file_hash = None
+        self.handed_off = False  # El archivo temporal ya pertenece a otra tarea
+
+    @property
+    def content(self) -> Optional[bytes]:
+        return b''.join(self._chunks) if self._chunks is not None else None
+
+    @property
+    def on_disk(self) -> bool:
+        '''True si el cuerpo se escribe a un archivo (feed, finish y discard hacen I/O de disco)'''
+        return self._writer is not None
+
+    def feed(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.max_size and self.size > self.max_size:
+            raise FileTooLarge(f'Más de {self.max_size} bytes')
+        if self._chunks is not None:
+            self._chunks.append(chunk)
+        if self._writer is not None:
+            self._writer.write(chunk)
+
+    def finish(self) -> 'ResponseBody':
+        if self._writer is not None:
+            self.file_hash = self._writer.close()
+            self.file_path = self._writer.path
+        return self
+
+    def discard(self):
+        '''Elimina el archivo temporal si todavía no se entregó a otra tarea'''
+        self._chunks = None
+        if self._writer is not None and not self.handed_off:
+            self._writer.discard()
@@ -1,22 +1,40 @@
 from celery import shared_task, current_task
+from django.db import transaction
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.conf import settings
 import requests
+import redis
+import asyncio
 import time
 import logging
 from urllib.parse import urljoin, urlparse, urlunparse
 from bs4 import BeautifulSoup
 import hashlib
+import json
 import os
-from typing import List, Dict, Set
-
-from .models import CrawlSession, URLQueue, CrawlResult, CrawlLog
+from datetime import datetime, timedelta
+from typing import List, Dict, Set, Optional
+
+from .models import CrawlSession, URLQueue, CrawlResult, CrawlLog, ExportJob
+from .fetcher import AsyncFetchEngine, AIOHTTP_AVAILABLE
+from .http_client import get_http_session, close_http_session, get_request_headers, release_response
+from .frontier import get_frontier, enqueue_urls, discard_frontier
+from .progress import publish_session_progress
+from .content_store import save_content
+from .extraction_cache import get_cached_extraction, load_cached_content, store_extraction
+from .extraction_guard import ExtractionBudget, enforce_budget
+from .metadata_utils import update_session_aggregates
+from .politeness import THROTTLE_STATUS_CODES, get_host_limiter
+from .robots import compile_matcher, fetch_permission, filter_allowed, get_origin, get_robots_entry, get_robots_matcher
+from .scanner import scan_text
+from .search import index_result
+from .sitemaps import iter_sitemap_urls, sitemap_priority
+from .storage import CHUNK_SIZE, FileTooLarge, ResponseBody, get_session_storage_dir, get_blob_path, store_blob
 from .utils import (
     is_valid_url,
     get_file_extension,
     is_allowed_file_type,
-    extract_robots_txt,
-    should_respect_robots_txt,
     is_same_domain,
     get_url_priority,
     get_domain_from_url
@@ -38,7 +56,13 @@ def start_crawl_session(self, session_id: int):
         session = CrawlSession.objects.get(id=session_id)
         session.status = 'running'
         session.started_at = timezone.now()
-        session.save()
+        sitemap_seeding = settings.CRAWLER_SETTINGS.get('SITEMAP_SEEDING', True)
+        if sitemap_seeding:
+            # La cola puede vaciarse antes de que lleguen las URLs de los sitemaps
+            session.seeding_until = session.started_at + timedelta(
+                seconds=settings.CRAWLER_SETTINGS.get('SITEMAP_SEEDING_TIMEOUT', 600)
+            )
+        session.save(update_fields=['status', 'started_at', 'seeding_until', 'updated_at'])
 
         # Log de inicio
         CrawlLog.objects.create(
@@ -63,15 +87,17 @@ def start_crawl_session(self, session_id: int):
         
         # Actualizar contador de URLs descubiertas si se creó una nueva URL
         if url_created[1]:  # get_or_create devuelve (object, created)
-            session.total_urls_discovered += 1
-            session.save()
+            session.increment_counters(total_urls_discovered=1)
+            enqueue_urls(session_id, [url_created[0]])
 
         # Procesar robots.txt si está habilitado
         if session.respect_robots_txt:
             process_robots_txt.delay(session_id)
 
-        # Iniciar procesamiento de URLs
-        process_url_queue.delay(session_id)
+        # Los sitemaps alimentan la frontera mientras ya se procesa target_url
+        if sitemap_seeding:
+            process_sitemaps.delay(session_id)
+        schedule_url_processing(session_id)
 
         return {'status': 'started', 'session_id': session_id}
 
@@ -82,7 +108,7 @@ def start_crawl_session(self, session_id: int):
         logger.error(f'Error iniciando crawling: {str(e)}')
         if 'session' in locals():
             session.status = 'failed'
-            session.save()
+            session.save(update_fields=['status', 'updated_at'])
             CrawlLog.objects.create(
                 session=session,
                 level='ERROR',
@@ -93,39 +119,40 @@ def start_crawl_session(self, session_id: int):
 
 @shared_task(bind=True)
 def process_robots_txt(self, session_id: int):
-    '''Procesa el archivo robots.txt del dominio objetivo'''
+    '''
+    Descarga (o toma del caché compartido) el robots.txt del sitio objetivo.
+    Las URLs descubiertas se filtran con estas reglas en add_discovered_urls.
+    '''
     try:
         session = CrawlSession.objects.get(id=session_id)
-        robots_url = f"https://{session.target_domain}/robots.txt"
-
-        # response = requests.get(robots_url, timeout=10)
-
-        # Configuración de requests con SSL más permisivo
-        response = requests.get(
-            robots_url, 
-            timeout=10, 
-            verify=False,  # Deshabilitar verificación SSL para robots.txt problemáticos
-            headers={'User-Agent': settings.CRAWLER_SETTINGS.get('USER_AGENT', 'FisgonCrawler/1.0')}
-        )
-
-        if response.status_code == 200:
-            robots_rules = extract_robots_txt(response.text)
-
-            # Guardar reglas en la configuración avanzada
-            session.advanced_config['robots_txt'] = robots_rules
-            session.save()
+        origin = get_origin(session.target_url)
+        entry = get_robots_entry(origin, session_id)
+        matcher = compile_matcher(entry)
+
+        # Resumen de las reglas que aplican al crawler, visible en la configuración avanzada
+        session.advanced_config['robots_txt'] = {
+            'url': f'{origin}/robots.txt',
+            'status': entry.status,
+            'allow': matcher.allow,
+            'disallow': matcher.disallow,
+            'sitemap': matcher.sitemaps,
+            'crawl_delay': matcher.crawl_delay,
+        }
+        session.save(update_fields=['advanced_config', 'updated_at'])
 
+        if entry.status in ('ok', 'unavailable'):
             CrawlLog.objects.create(
                 session=session,
                 level='INFO',
-                message='Robots.txt procesado correctamente',
-                details={'rules_found': len(robots_rules)}
+                message='Robots.txt procesado correctamente' if entry.status == 'ok' else 'El sitio no tiene robots.txt',
+                details={'rules_found': len(matcher.rules), 'http_status': entry.http_status}
             )
         else:
             CrawlLog.objects.create(
                 session=session,
                 level='WARNING',
-                message=f'No se pudo obtener robots.txt (HTTP {response.status_code})'
+                message=f'No se pudo obtener robots.txt (HTTP {entry.http_status})',
+                details={'status': entry.status}
             )
 
     except Exception as e:
@@ -142,79 +169,170 @@ def process_robots_txt(self, session_id: int):
             pass
 
 
+@shared_task(bind=True)
+def process_sitemaps(self, session_id: int, batch_size: int = 1000):
+    '''
+    Siembra la cola con las URLs de los sitemaps del sitio (declarados en
+    robots.txt o /sitemap.xml), incluyendo índices y archivos .gz. Las URLs se
+    insertan por lotes con prioridad según tipo de archivo y lastmod, en
+    paralelo con el procesamiento de la cola; al terminar la sesión ya se
+    puede completar.
+    '''
+    try:
+        session = CrawlSession.objects.get(id=session_id)
+        origin = get_origin(session.target_url)
+        sitemap_urls = get_robots_matcher(session.target_url, session_id).sitemaps or [f'{origin}/sitemap.xml']
+
+        stats = {}
+        urls_added = 0
+        batch = {}
+        now = timezone.now()
+
+        def flush():
+            nonlocal urls_added
+            new_items = add_discovered_urls(
+                session, set(batch), parent_url=sitemap_urls[0], depth=1, priorities=batch
+            )
+            urls_added += len(new_items)
+            batch.clear()
+
+        # La validación de dominio se hace una vez por host (un sitemap suele tener uno solo)
+        allowed_hosts = {}
+
+        for entry in iter_sitemap_urls(sitemap_urls, session_id, stats):
+            parts = urlparse(entry.loc)
+            if parts.scheme not in ('http', 'https') or not parts.netloc:
+                continue
+            host = (parts.scheme, parts.netloc)
+            if host not in allowed_hosts:
+                host_url = f'{parts.scheme}://{parts.netloc}/'
+                allowed_hosts[host] = is_valid_url(host_url) and is_same_domain(host_url, session.target_domain)
+            if not allowed_hosts[host]:
+                continue
+            batch[entry.loc] = sitemap_priority(entry.loc, entry.lastmod, now)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        CrawlLog.objects.create(
+            session=session,
+            level='INFO' if urls_added or not stats['errors'] else 'WARNING',
+            message=f'Sitemaps procesados: {urls_added} URLs agregadas desde {stats["sitemaps"]} sitemaps',
+            details={
+                'sitemaps': sitemap_urls,
+                'sitemaps_read': stats['sitemaps'],
+                'urls_found': stats['urls'],
+                'urls_added': urls_added,
+                'errors': stats['errors'][:10],
+            }
+        )
+
+        return {'status': 'completed', 'urls_added': urls_added}
+
+    except CrawlSession.DoesNotExist:
+        logger.error(f'Sesión {session_id} no encontrada')
+        return {'status': 'error', 'message': 'Sesión no encontrada'}
+    except Exception as e:
+        # Sin sitemaps el crawling sigue desde target_url
+        logger.error(f'Error procesando sitemaps: {str(e)}')
+        return {'status': 'error', 'message': str(e)}
+    finally:
+        CrawlSession.objects.filter(id=session_id).update(seeding_until=None)
+
+
 @shared_task(bind=True)
 def process_url_queue(self, session_id: int):
-    '''Procesa la cola de URLs de una sesión'''
+    '''
+    Despacha URLs de la frontera a process_single_url. El rate limit por host
+    (politeness.HostRateLimiter) se aplica como countdown de cada tarea, sin
+    dormir dentro del worker.
+    '''
     try:
         session = CrawlSession.objects.get(id=session_id)
 
         if session.status != 'running':
             return {'status': 'stopped', 'reason': f'Session status: {session.status}'}
 
-        # Obtener URLs pendientes con límite
-        pending_urls = URLQueue.objects.filter(
-            session=session,
-            status='pending'
-        ).order_by('priority', 'discovered_at')[:10]  # Procesar en lotes de 10
-        
-        # Log para debugging
-        total_urls_in_queue = URLQueue.objects.filter(session=session).count()
-        logger.info(f'Session {session_id}: {pending_urls.count()} pending URLs, {total_urls_in_queue} total URLs in queue')
-
-        if not pending_urls.exists():
-            # No hay más URLs pendientes, verificar si completamos
-            if session.max_pages > 0 and session.total_urls_processed >= session.max_pages:
+        crawler_settings = settings.CRAWLER_SETTINGS
+        limit = crawler_settings.get('DISPATCH_BATCH_SIZE', 50)
+        if session.max_pages > 0:
+            limit = min(limit, session.max_pages - session.total_urls_processed)
+            if limit <= 0:
                 complete_crawl_session.delay(session_id)
                 return {'status': 'completed', 'reason': 'Max pages reached'}
 
-            # Verificar si hay URLs siendo procesadas actualmente
-            processing_urls = URLQueue.objects.filter(
+        frontier = get_frontier(session_id)
+        url_ids = []
+        if frontier is not None:
+            try:
+                url_ids = frontier.pop(limit)
+                if not url_ids:
+                    # Esperar URLs nuevas sin consultar la base de datos
+                    first_id = frontier.wait_pop(crawler_settings.get('FRONTIER_WAIT_SECONDS', 5))
+                    if first_id is not None:
+                        url_ids = [first_id] + frontier.pop(limit - 1)
+            except redis.RedisError as e:
+                logger.warning(f'Error leyendo la frontera de la sesión {session_id}: {str(e)}')
+                frontier = None
+
+        if frontier is None:
+            url_ids = list(URLQueue.objects.filter(
                 session=session,
-                status='processing'
-            ).count()
-
-            if processing_urls > 0:
-                # Hay URLs siendo procesadas, esperar y reintentar
-                process_url_queue.apply_async(args=[session_id], countdown=15)
-                return {'status': 'waiting', 'reason': f'{processing_urls} URLs being processed'}
-
-            # Esperar un poco más por si aparecen nuevas URLs
-            time.sleep(5)
-            remaining_urls = URLQueue.objects.filter(
+                status='pending'
+            ).order_by('priority', 'discovered_at').values_list('id', flat=True)[:limit])
+
+        if url_ids:
+            limiter = get_host_limiter(session)
+            max_delay = crawler_settings.get('POLITENESS_MAX_DISPATCH_DELAY', 60)
+            items = URLQueue.objects.only('id', 'url', 'priority', 'discovered_at').in_bulk(url_ids)
+            dispatched = 0
+            deferred = []
+            last_countdown = 0.0
+            for url_queue_id in url_ids:
+                item = items.get(url_queue_id)
+                if item is None:
+                    continue
+                countdown = limiter.reserve(item.url, max_delay=max_delay)
+                if countdown > max_delay:
+                    # Host en espera (Retry-After): la URL vuelve a la frontera sin crear tareas con ETA lejano
+                    deferred.append(item)
+                    continue
+                dispatched += 1
+                last_countdown = max(last_countdown, countdown)
+                process_single_url.apply_async(args=[session_id, url_queue_id], countdown=countdown)
+
+            if deferred:
+                enqueue_urls(session_id, deferred)
+
+            # El próximo lote se despacha cuando este ya fue liberado
+            process_url_queue.apply_async(args=[session_id], countdown=last_countdown if dispatched else max_delay)
+            return {'status': 'processing', 'processed': dispatched, 'deferred': len(deferred)}
+
+        # No hay URLs listas: verificar si quedan URLs en curso o pendientes
+        status_counts = dict(
+            URLQueue.objects.filter(
                 session=session,
                 status__in=['pending', 'processing']
-            ).count()
-
-            if remaining_urls == 0 and session.total_urls_processed > 0:
-                # Solo completar si hemos procesado al menos una URL
-                complete_crawl_session.delay(session_id)
-                return {'status': 'completed', 'reason': 'No more pending URLs'}
-            elif session.total_urls_processed == 0:
-                # Si no hemos procesado ninguna URL, podría ser un problema inicial
-                process_url_queue.apply_async(args=[session_id], countdown=10)
-                return {'status': 'retrying', 'reason': 'Initial URL processing'}
-
-        processed_count = 0
-        for url_item in pending_urls:
-            if session.max_pages > 0 and session.total_urls_processed >= session.max_pages:
-                break
+            ).order_by().values_list('status').annotate(total=Count('id'))
+        )
+        processing_urls = status_counts.get('processing', 0)
+        pending_urls = status_counts.get('pending', 0)
 
-            # Procesar URL individual
-            process_single_url.delay(session_id, url_item.id)
-            processed_count += 1
+        if pending_urls and frontier is not None:
+            # URLs pendientes que no llegaron a la frontera (p. ej. Redis reiniciado)
+            frontier.rebuild()
 
-            # Rate limiting
-            time.sleep(1.0 / session.rate_limit)
+        # Estado final de las URLs en curso aunque se hayan omitido notificaciones
+        publish_session_progress(session_id)
 
-        # Continuar procesando si hay más URLs o si no se procesó nada pero podrían aparecer más
-        if processed_count > 0:
-            # Programar próximo lote inmediatamente si se procesaron URLs
-            process_url_queue.apply_async(args=[session_id], countdown=5)
-        elif URLQueue.objects.filter(session=session, status__in=['pending', 'processing']).exists():
-            # Si no se procesó nada pero aún hay URLs pendientes/procesando, reintentar
-            process_url_queue.apply_async(args=[session_id], countdown=10)
+        if processing_urls or pending_urls or session.total_urls_processed == 0 or session.is_seeding:
+            # Con frontera la espera bloqueante ya marca el ritmo; sin ella se reintenta más tarde
+            process_url_queue.apply_async(args=[session_id], countdown=0 if frontier is not None else 5)
+            return {'status': 'waiting', 'reason': f'{processing_urls} URLs being processed'}
 
-        return {'status': 'processing', 'processed': processed_count}
+        complete_crawl_session.delay(session_id)
+        return {'status': 'completed', 'reason': 'No more pending URLs'}
 
     except CrawlSession.DoesNotExist:
         logger.error(f'Sesión {session_id} no encontrada')
@@ -225,135 +343,486 @@ def process_url_queue(self, session_id: int):
 
 
 @shared_task(bind=True)
-def process_single_url(self, session_id: int, url_queue_id: int):
+def process_single_url(self, session_id: int, url_queue_id: int, retry: bool = False):
     '''Procesa una URL individual'''
     try:
         session = CrawlSession.objects.get(id=session_id)
         url_item = URLQueue.objects.get(id=url_queue_id)
 
-        if url_item.status != 'pending':
+        # Reintentos y tareas reprogramadas pueden llegar después de detener o completar la sesión
+        if session.status != 'running':
+            return {'status': 'stopped', 'reason': f'Session status: {session.status}'}
+
+        # Turno reservado antes de un 429/503 del host: se reprograma tras el Retry-After
+        limiter = get_host_limiter(session)
+        if limiter.blocked_for(url_item.url) > 0:
+            max_delay = settings.CRAWLER_SETTINGS.get('POLITENESS_MAX_DISPATCH_DELAY', 60)
+            countdown = limiter.reserve(url_item.url, max_delay=max_delay)
+            if countdown > max_delay and not retry:
+                # Espera larga: vuelve a la frontera en lugar de quedar como tarea con ETA
+                enqueue_urls(session_id, [url_item])
+            else:
+                process_single_url.apply_async(
+                    args=[session_id, url_queue_id], kwargs={'retry': retry}, countdown=min(countdown, max_delay)
+                )
+            return {'status': 'deferred', 'reason': 'Host throttled'}
+
+        # Reservar la URL de forma atómica (los reintentos parten desde 'failed')
+        claimable_status = 'failed' if retry else 'pending'
+        claimed = URLQueue.objects.filter(
+            id=url_queue_id, status=claimable_status
+        ).update(status='processing', claimed_at=timezone.now())
+
+        if not claimed:
             return {'status': 'skipped', 'reason': f'URL status: {url_item.status}'}
 
+        if retry:
+            # Mientras se reintenta deja de contar como error (total_errors = URLs fallidas)
+            session.increment_counters(total_errors=-1)
+
         url_item.status = 'processing'
-        url_item.save()
+        if not check_robots_before_fetch(session, [url_item]):
+            return {'status': 'skipped', 'reason': 'robots.txt'}
 
         start_time = time.time()
 
-        # Configurar headers
-        headers = {
-            'User-Agent': settings.CRAWLER_SETTINGS['USER_AGENT'],
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'es-ES,es;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-
-        # # Realizar request
-        # response = requests.get(
-        #     url_item.url,
-        #     headers=headers,
-        #     timeout=settings.CRAWLER_SETTINGS['TIMEOUT'],
-        #     allow_redirects=session.follow_redirects,
-        #     stream=True
-        # )
-
-        # Realizar request con configuración SSL permisiva
-        response = requests.get(
+        # Realizar request con el pool de conexiones persistentes de la sesión
+        response = get_http_session(session_id).get(
             url_item.url,
-            headers=headers,
             timeout=settings.CRAWLER_SETTINGS.get('TIMEOUT', 30),
             allow_redirects=session.follow_redirects,
             stream=True,
-            verify=False  # Deshabilitar verificación SSL para evitar errores de certificado
         )
 
-        response_time = time.time() - start_time
+        # Latencia hasta los headers: no depende del tamaño del archivo
+        limiter.record(url_item.url, response.status_code, time.time() - start_time, response.headers)
 
-        # Actualizar información de la URL
-        url_item.http_status_code = response.status_code
-        url_item.response_time = response_time
-        url_item.content_type = response.headers.get('content-type', '')
-        url_item.processed_at = timezone.now()
+        body = None
+        try:
+            if response.status_code == 200:
+                body = read_response_body(session, url_item, response)
+            response_time = time.time() - start_time
 
-        if response.status_code != 200:
-            url_item.status = 'failed'
-            url_item.error_message = f'HTTP {response.status_code}'
-            url_item.save()
+            return handle_fetched_response(
+                session, url_item, response.status_code, response.headers, body, response_time
+            )
+        except Exception:
+            if body is not None:
+                body.discard()
+            raise
+        finally:
+            release_response(response)
 
-            session.total_errors += 1
-            session.save()
+    except requests.RequestException as e:
+        logger.error(f'Error de request para {url_item.url}: {str(e)}')
+        if isinstance(e, requests.Timeout):
+            limiter.record(url_item.url, None, None)
+        return handle_fetch_error(session, url_item, e)
 
-            return {'status': 'failed', 'http_status': response.status_code}
+    except Exception as e:
+        logger.error(f'Error procesando URL {url_item.url}: {str(e)}')
+        url_item.status = 'failed'
+        url_item.error_message = str(e)
+        url_item.save()
 
-        # Verificar tamaño del contenido
-        content_length = response.headers.get('content-length')
-        if content_length and int(content_length) > session.max_file_size:
-            url_item.status = 'skipped'
-            url_item.error_message = 'File too large'
-            url_item.save()
-            return {'status': 'skipped', 'reason': 'File too large'}
+        session.increment_counters(total_errors=1)
+        publish_session_progress(session.id)
 
-        # Obtener contenido
-        content = response.content
-        url_item.file_size = len(content)
+        return {'status': 'error', 'message': str(e)}
 
-        # Determinar tipo de archivo
-        file_extension = get_file_extension(url_item.url, url_item.content_type)
-        url_item.url_type = file_extension
 
-        # Procesar según el tipo de contenido
-        if file_extension == 'html':
-            # Extraer nuevas URLs si no hemos alcanzado la profundidad máxima
-            if url_item.depth < session.max_depth:
-                extract_urls_from_html.delay(session_id, url_queue_id, content.decode('utf-8', errors='ignore'))
+def open_response_body(session, url_item, headers) -> Optional[ResponseBody]:
+    '''
+    Prepara la lectura del cuerpo de una respuesta 200: el HTML que se va a
+    explorar queda en memoria y los archivos de interés se escriben a disco.
+    Retorna None si el Content-Length ya supera max_file_size.
+    '''
+    content_length = headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > session.max_file_size:
+        return None
 
-        # Si es un archivo de interés, guardarlo y extraer metadatos
-        if is_allowed_file_type(file_extension, session.get_file_types_list()):
-            save_and_extract_metadata.delay(session_id, url_queue_id, content)
+    file_extension = get_file_extension(url_item.url, headers.get('content-type', ''))
+    keep_in_memory = file_extension == 'html' and url_item.depth < session.max_depth
+    storage_dir = None
+    if is_allowed_file_type(file_extension, session.get_file_types_list()):
+        storage_dir = get_session_storage_dir(session.id)
 
-        url_item.status = 'completed'
-        url_item.save()
+    return ResponseBody(session.max_file_size, keep_in_memory, storage_dir)
 
-        # Actualizar estadísticas de la sesión
-        session.total_urls_processed += 1
-        if file_extension in session.get_file_types_list():
-            session.total_files_found += 1
-        session.save()
 
-        return {'status': 'completed', 'file_type': file_extension}
+def read_response_body(session, url_item, response: requests.Response) -> Optional[ResponseBody]:
+    '''Lee por bloques una respuesta de requests. None si supera max_file_size'''
+    body = open_response_body(session, url_item, response.headers)
+    if body is None:
+        return None
 
-    except requests.RequestException as e:
-        logger.error(f'Error de request para {url_item.url}: {str(e)}')
-        url_item.status = 'failed'
-        url_item.error_message = str(e)
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            body.feed(chunk)
+    except FileTooLarge:
+        body.discard()
+        return None
+    except Exception:
+        body.discard()
+        raise
+
+    return body.finish()
+
+
+def handle_fetched_response(session, url_item, status_code: int, headers, body: Optional[ResponseBody],
+                            response_time: float, inline_discovery: bool = False) -> Dict:
+    '''
+    Procesa la respuesta HTTP de una URL ya descargada. Es compartido por
+    process_single_url y el motor asíncrono (run_fetch_engine).
+    body es None cuando el cuerpo superó max_file_size durante la lectura.
+    '''
+    # Actualizar información de la URL
+    url_item.http_status_code = status_code
+    url_item.response_time = response_time
+    url_item.content_type = headers.get('content-type', '')
+    url_item.processed_at = timezone.now()
+
+    if status_code in THROTTLE_STATUS_CODES and url_item.retry_count < settings.CRAWLER_SETTINGS['MAX_RETRIES']:
+        # El servidor pidió bajar el ritmo: la URL vuelve a la cola y el limitador
+        # del host (ya informado de la respuesta) posterga su próximo turno
+        url_item.status = 'pending'
+        url_item.error_message = f'HTTP {status_code}'
         url_item.retry_count += 1
         url_item.save()
+        enqueue_urls(session.id, [url_item])
+        return {'status': 'throttled', 'http_status': status_code}
 
-        session.total_errors += 1
-        session.save()
+    if status_code != 200:
+        url_item.status = 'failed'
+        url_item.error_message = f'HTTP {status_code}'
+        url_item.save()
 
-        # Reintentar si no hemos superado el límite
-        if url_item.retry_count < settings.CRAWLER_SETTINGS['MAX_RETRIES']:
-            process_single_url.apply_async(
-                args=[session_id, url_queue_id],
-                countdown=60 * url_item.retry_count  # Backoff exponencial
-            )
+        session.increment_counters(total_errors=1)
+        publish_session_progress(session.id)
 
-        return {'status': 'failed', 'error': str(e)}
+        return {'status': 'failed', 'http_status': status_code}
 
-    except Exception as e:
-        logger.error(f'Error procesando URL {url_item.url}: {str(e)}')
-        url_item.status = 'failed'
-        url_item.error_message = str(e)
+    # Verificar tamaño del contenido
+    if body is None:
+        url_item.status = 'skipped'
+        url_item.error_message = 'File too large'
         url_item.save()
+        return {'status': 'skipped', 'reason': 'File too large'}
+
+    url_item.file_size = body.size
+
+    # Determinar tipo de archivo
+    file_extension = get_file_extension(url_item.url, url_item.content_type)
+    url_item.url_type = file_extension
+
+    # Procesar según el tipo de contenido
+    if file_extension == 'html':
+        # Extraer nuevas URLs si no hemos alcanzado la profundidad máxima
+        if url_item.depth < session.max_depth:
+            html_content = body.content.decode('utf-8', errors='ignore')
+            if inline_discovery:
+                extract_urls_from_html(session.id, url_item.id, html_content)
+            else:
+                extract_urls_from_html.delay(session.id, url_item.id, html_content)
+
+    # Si es un archivo de interés, guardarlo y extraer metadatos
+    if body.file_path:
+        save_and_extract_metadata.delay(session.id, url_item.id, body.file_path, body.file_hash)
+        body.handed_off = True
+
+    url_item.status = 'completed'
+    url_item.save()
+
+    # Actualizar estadísticas de la sesión (total_files_found se cuenta al crear el CrawlResult)
+    session.increment_counters(total_urls_processed=1)
+    publish_session_progress(session.id)
+
+    return {'status': 'completed', 'file_type': file_extension}
+
+
+def handle_fetch_error(session, url_item, error: Exception) -> Dict:
+    '''Registra un error de red y programa un reintento con backoff si corresponde'''
+    url_item.status = 'failed'
+    url_item.error_message = str(error)
+    url_item.retry_count += 1
+    url_item.save()
+
+    session.increment_counters(total_errors=1)
+    publish_session_progress(session.id)
+
+    # Reintentar si no hemos superado el límite
+    if url_item.retry_count < settings.CRAWLER_SETTINGS['MAX_RETRIES']:
+        process_single_url.apply_async(
+            args=[session.id, url_item.id],
+            kwargs={'retry': True},
+            countdown=60 * url_item.retry_count  # Backoff exponencial
+        )
+
+    return {'status': 'failed', 'error': str(error)}
+
+
+@shared_task(bind=True)
+def run_fetch_engine(self, session_id: int):
+    '''
+    Procesa la cola de URLs de una sesión con el motor asíncrono.
+    Cada ejecución dura como máximo ASYNC_SLICE_SECONDS y se vuelve a programar
+    mientras queden URLs, para no superar los time limits de Celery.
+    '''
+    try:
+        session = CrawlSession.objects.get(id=session_id)
 
-        session.total_errors += 1
-        session.save()
+        if session.status != 'running':
+            return {'status': 'stopped', 'reason': f'Session status: {session.status}'}
 
+        if not AIOHTTP_AVAILABLE:
+            logger.warning('aiohttp no disponible, usando procesamiento por tareas Celery')
+            process_url_queue.delay(session_id)
+            return {'status': 'fallback', 'engine': 'celery'}
+
+        crawler_settings = settings.CRAWLER_SETTINGS
+
+        # URLs que quedaron reservadas por un worker interrumpido. Las reservadas hace
+        # poco pueden pertenecer a otro ciclo o a process_single_url en curso
+        stale_before = timezone.now() - timedelta(seconds=crawler_settings.get('CLAIM_STALE_SECONDS', 900))
+        URLQueue.objects.filter(session=session, status='processing').filter(
+            Q(claimed_at__lt=stale_before) | Q(claimed_at__isnull=True)
+        ).update(status='pending')
+
+        frontier = get_frontier(session_id)
+        if frontier is not None:
+            try:
+                frontier.sync()
+            except redis.RedisError as e:
+                logger.warning(f'Error sincronizando la frontera de la sesión {session_id}: {str(e)}')
+                frontier = None
+
+        def claim(limit):
+            nonlocal frontier
+            if session.max_pages > 0:
+                in_progress = URLQueue.objects.filter(session=session, status='processing').count()
+                limit = min(limit, session.max_pages - session.total_urls_processed - in_progress)
+                if limit <= 0:
+                    return []
+
+            items = None
+            if frontier is not None:
+                try:
+                    items = claim_pending_urls(session, limit, frontier.pop(limit))
+                except redis.RedisError as e:
+                    logger.warning(f'Error leyendo la frontera de la sesión {session_id}: {str(e)}')
+                    frontier = None
+
+            if items is None:
+                items = claim_pending_urls(session, limit)
+            # Sin esperar a otro worker: este hilo atiende todos los callbacks del motor
+            return check_robots_before_fetch(session, items, wait=False)
+
+        def release(items):
+            URLQueue.objects.filter(
+                id__in=[item.id for item in items], status='processing'
+            ).update(status='pending')
+            enqueue_urls(session_id, items)
+
+        def open_body(item, headers):
+            return open_response_body(session, item, headers)
+
+        def on_response(item, status_code, headers, body, response_time):
+            handle_fetched_response(
+                session, item, status_code, headers, body, response_time, inline_discovery=True
+            )
+
+        def on_error(item, error):
+            logger.error(f'Error de request para {item.url}: {str(error)}')
+            handle_fetch_error(session, item, error)
+
+        def should_continue():
+            session.refresh_from_db(fields=['status', 'total_urls_processed'])
+            if session.max_pages > 0 and session.total_urls_processed >= session.max_pages:
+                return False
+            return session.status == 'running'
+
+        engine = AsyncFetchEngine(
+            claim=claim,
+            release=release,
+            on_response=on_response,
+            on_error=on_error,
+            open_body=open_body,
+            should_continue=should_continue,
+            host_limiter=get_host_limiter(session),
+            concurrency=crawler_settings.get('ASYNC_CONCURRENCY', 100),
+            rate_limit=session.rate_limit,
+            headers=get_request_headers(),
+            timeout=crawler_settings.get('TIMEOUT', 30),
+            follow_redirects=session.follow_redirects,
+            time_budget=crawler_settings.get('ASYNC_SLICE_SECONDS', 240),
+            keepalive_timeout=crawler_settings.get('HTTP_KEEPALIVE_TIMEOUT', 30),
+        )
+        stats = asyncio.run(engine.run())
+
+        logger.info(f'Session {session_id}: ciclo del motor asíncrono finalizado {stats}')
+        publish_session_progress(session_id, force=True)
+
+        session.refresh_from_db(fields=['status', 'total_urls_processed', 'seeding_until'])
+        if session.status != 'running':
+            return {'status': 'stopped', 'reason': f'Session status: {session.status}', **stats}
+
+        max_pages_reached = session.max_pages > 0 and session.total_urls_processed >= session.max_pages
+        queue_empty = stats['exhausted'] and not URLQueue.objects.filter(session=session, status='pending').exists()
+        if max_pages_reached or (queue_empty and not session.is_seeding):
+            complete_crawl_session.delay(session_id)
+            return {'status': 'completed', **stats}
+
+        # Quedan URLs: continuar en un nuevo ciclo. Si solo quedaron URLs de hosts en
+        # espera (Retry-After), se posterga hasta que el primero vuelva a aceptar requests
+        countdown = 0
+        if stats['deferred'] and not stats['fetched'] and not stats['errors']:
+            countdown = min(stats['deferred'], crawler_settings.get('ASYNC_SLICE_SECONDS', 240))
+        elif queue_empty:
+            # Cola vacía mientras los sitemaps siguen agregando URLs
+            countdown = 5
+        run_fetch_engine.apply_async(args=[session_id], countdown=countdown)
+        return {'status': 'processing', **stats}
+
+    except CrawlSession.DoesNotExist:
+        logger.error(f'Sesión {session_id} no encontrada')
+        return {'status': 'error', 'message': 'Sesión no encontrada'}
+    except Exception as e:
+        logger.error(f'Error en motor asíncrono: {str(e)}')
         return {'status': 'error', 'message': str(e)}
 
 
+def check_robots_before_fetch(session, items: List[URLQueue], wait: bool = True) -> List[URLQueue]:
+    '''
+    Verifica robots.txt de URLs recién reservadas. Las bloqueadas se marcan
+    'skipped'; las de orígenes sin reglas por un error pasajero vuelven a
+    'pending' sin publicarse en la frontera, que las retoma al reconstruirse.
+    Retorna las que se pueden descargar.
+    '''
+    if not session.respect_robots_txt or not items:
+        return items
+
+    ready, blocked, postponed = [], [], []
+    for item in items:
+        permission = fetch_permission(item.url, session.id, wait=wait)
+        if permission is None:
+            postponed.append(item.id)
+        elif permission:
+            ready.append(item)
+        else:
+            blocked.append(item.id)
+
+    if blocked:
+        URLQueue.objects.filter(id__in=blocked, status='processing').update(
+            status='skipped', error_message='Bloqueada por robots.txt', processed_at=timezone.now()
+        )
+    if postponed:
+        URLQueue.objects.filter(id__in=postponed, status='processing').update(status='pending')
+        logger.info(f'Sesión {session.id}: {len(postponed)} URLs postergadas, robots.txt no disponible')
+    return ready
+
+
+def claim_pending_urls(session, limit: int, url_ids: Optional[List[int]] = None) -> List[URLQueue]:
+    '''
+    Marca como 'processing' hasta `limit` URLs pendientes y las retorna. Con
+    url_ids (extraídos de la frontera) solo se reservan esos; sin ellos se
+    eligen por prioridad directamente desde URLQueue.
+    '''
+    if url_ids is not None and not url_ids:
+        return []
+
+    with transaction.atomic():
+        pending = URLQueue.objects.select_for_update(skip_locked=True).filter(
+            session=session,
+            status='pending'
+        )
+        if url_ids is not None:
+            pending = pending.filter(id__in=url_ids)
+        ids = list(pending.order_by('priority', 'discovered_at').values_list('id', flat=True)[:limit])
+        URLQueue.objects.filter(id__in=ids).update(status='processing', claimed_at=timezone.now())
+
+    items = list(URLQueue.objects.filter(id__in=ids).order_by('priority', 'discovered_at'))
+    for item in items:
+        item.status = 'processing'
+    return items
+
+
+def schedule_url_processing(session_id: int):
+    '''Inicia el procesamiento de la cola con el motor configurado en FETCH_ENGINE'''
+    if settings.CRAWLER_SETTINGS.get('FETCH_ENGINE', 'async') == 'async' and AIOHTTP_AVAILABLE:
+        run_fetch_engine.delay(session_id)
+    else:
+        process_url_queue.delay(session_id)
+
+
+def insert_new_urls(items: List[URLQueue]) -> List[URLQueue]:
+    '''
+    Inserta URLQueue ignorando las (session, url) que ya existen y retorna las
+    filas de esas URLs con su id (una consulta url__in). Los candidatos ya
+    vienen filtrados contra la base de datos, así que solo una carrera con otro
+    worker por la misma URL puede hacer que se cuente dos veces; la
+    reconciliación periódica (recalculate_counters) corrige el contador.
+    '''
+    if not items:
+        return []
+
+    URLQueue.objects.bulk_create(items, ignore_conflicts=True)
+    return list(URLQueue.objects.filter(
+        session_id=items[0].session_id,
+        url__in=[item.url for item in items],
+    ).only('id', 'url', 'priority', 'discovered_at'))
+
+
+def add_discovered_urls(session, urls: Set[str], parent_url: str = '', depth: int = 0,
+                        batch_size: int = 500, priorities: Dict[str, int] = None) -> List[URLQueue]:
+    '''
+    Agrega a la cola las URLs que la sesión aún no conoce y las publica en la
+    frontera. Las existentes se descartan con una consulta url__in por lote y
+    la inserción ignora las que otro worker agregó entre medio (insert_new_urls).
+    priorities permite fijar la prioridad de algunas URLs (p. ej. según lastmod
+    del sitemap); el resto usa get_url_priority.
+    Retorna las URLQueue efectivamente creadas por esta llamada.
+    '''
+    urls = list(urls)
+    created_items = []
+
+    # Las URLs bloqueadas por robots.txt no llegan a la cola (las de orígenes sin
+    # reglas por un error pasajero se agregan y se verifican al descargarlas)
+    if session.respect_robots_txt and urls:
+        urls, blocked = filter_allowed(urls, session.id, wait=False)
+        if blocked:
+            logger.info(f'Sesión {session.id}: {len(blocked)} URLs bloqueadas por robots.txt')
+
+    for start in range(0, len(urls), batch_size):
+        batch = urls[start:start + batch_size]
+        known = set(
+            URLQueue.objects.filter(session=session, url__in=batch).values_list('url', flat=True)
+        )
+        candidates = [url for url in batch if url not in known]
+        if not candidates:
+            continue
+
+        created_items.extend(insert_new_urls([
+            URLQueue(
+                session=session,
+                url=url,
+                parent_url=parent_url,
+                referrer=parent_url,  # IMPORTANTE: Guardar el referrer (URL padre)
+                depth=depth,
+                url_type=get_file_extension(url),
+                priority=priorities[url] if priorities and url in priorities else get_url_priority(url),
+                status='pending'
+            )
+            for url in candidates
+        ]))
+
+    if created_items:
+        session.increment_counters(total_urls_discovered=len(created_items))
+        publish_session_progress(session.id)
+        enqueue_urls(session.id, created_items)
+
+    return created_items
+
+
 @shared_task(bind=True)
 def extract_urls_from_html(self, session_id: int, url_queue_id: int, html_content: str):
     '''Extrae URLs de contenido HTML y guarda el referrer'''
@@ -391,33 +860,10 @@ def extract_urls_from_html(self, session_id: int, url_queue_id: int, html_conten
                 urls_found.add(full_url)
         
         # Crear nuevas entradas en URLQueue con referrer
-        urls_added = 0
-        for url in urls_found:
-            # Verificar si ya existe
-            if not URLQueue.objects.filter(session=session, url=url).exists():
-                
-                # Determinar tipo de archivo y prioridad
-                file_extension = get_file_extension(url)
-                priority = get_url_priority(url)
-                
-                # IMPORTANTE: Guardar el referrer (URL padre)
-                URLQueue.objects.create(
-                    session=session,
-                    url=url,
-                    parent_url=base_url,
-                    referrer=base_url, 
-                    depth=parent_url_item.depth + 1,
-                    url_type=file_extension,
-                    priority=priority,
-                    status='pending'
-                )
-                urls_added += 1
-        
-        # Actualizar estadísticas de la sesión
+        new_items = add_discovered_urls(session, urls_found, parent_url=base_url, depth=parent_url_item.depth + 1)
+        urls_added = len(new_items)
+
         if urls_added > 0:
-            session.total_urls_discovered += urls_added
-            session.save()
-            
             CrawlLog.objects.create(
                 session=session,
                 level='INFO',
@@ -506,8 +952,7 @@ def extract_urls_from_html_old(self, session_id: int, url_queue_id: int, html_co
                 urls_added += 1
 
         # Actualizar estadísticas
-        session.total_urls_discovered += urls_added
-        session.save()
+        session.increment_counters(total_urls_discovered=urls_added)
 
         if urls_added > 0:
             CrawlLog.objects.create(
@@ -525,29 +970,20 @@ def extract_urls_from_html_old(self, session_id: int, url_queue_id: int, html_co
 
 
 @shared_task(bind=True)
-def save_and_extract_metadata(self, session_id: int, url_queue_id: int, content: bytes):
+def save_and_extract_metadata(self, session_id: int, url_queue_id: int, temp_path: str, file_hash: str):
     '''Guarda archivo y extrae metadatos'''
     try:
         session = CrawlSession.objects.get(id=session_id)
         url_item = URLQueue.objects.get(id=url_queue_id)
 
-        # Crear hash del archivo
-        file_hash = hashlib.sha256(content).hexdigest()
-
         # Determinar nombre de archivo
         parsed_url = urlparse(url_item.url)
         file_name = os.path.basename(parsed_url.path) or f"file_{url_item.id}"
 
-        # Crear directorio si no existe
-        storage_dir = os.path.join(settings.MEDIA_ROOT, 'crawler', str(session.id))
-        os.makedirs(storage_dir, exist_ok=True)
-
-        # Guardar archivo
-        file_path = os.path.join(storage_dir, f"{file_hash}_{file_name}")
-        with open(file_path, 'wb') as f:
-            f.write(content)
+        # Almacén direccionado por contenido: cada archivo distinto se guarda una sola vez
+        file_path = get_blob_path(file_hash, file_name)
 
-        # Crear resultado
+        # Crear resultado antes de mover el blob para que cuente como referencia
         result = CrawlResult.objects.create(
             session=session,
             url_queue_item=url_item,
@@ -556,6 +992,9 @@ def save_and_extract_metadata(self, session_id: int, url_queue_id: int, content:
             file_hash=file_hash,
             metadata={}  # Se llenará con la extracción de metadatos
         )
+        store_blob(temp_path, file_path, file_hash)
+        session.increment_counters(total_files_found=1)
+        publish_session_progress(session.id)
 
         # Marcar como que tiene metadatos pendientes
         url_item.has_metadata = False
@@ -569,38 +1008,102 @@ def save_and_extract_metadata(self, session_id: int, url_queue_id: int, content:
 
     except Exception as e:
         logger.error(f'Error guardando archivo: {str(e)}')
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
         return {'status': 'error', 'message': str(e)}
 
 
-@shared_task(bind=True)
+def add_sensitive_data_scan(metadata: dict, full_content: str):
+    '''Agrega a los metadatos los datos sensibles encontrados en el contenido que se guardará'''
+    config = settings.CONTENT_EXTRACTION_SETTINGS
+    if not config.get('DETECT_SENSITIVE_DATA', True) or not full_content:
+        return
+    metadata['sensitive_data'] = scan_text(
+        full_content[:config.get('MAX_CONTENT_CHARS', 1000000)],
+        max_findings=config.get('MAX_SENSITIVE_FINDINGS', 100)
+    )
+
+
+@shared_task(
+    bind=True,
+    soft_time_limit=settings.CONTENT_EXTRACTION_SETTINGS.get('TASK_SOFT_TIME_LIMIT', 180),
+    time_limit=settings.CONTENT_EXTRACTION_SETTINGS.get('TASK_TIME_LIMIT', 240),
+)
 def extract_file_metadata(self, result_id: int):
     '''Extrae metadatos Y contenido completo de un archivo guardado'''
+    previous_metadata = None
     try:
         result = CrawlResult.objects.get(id=result_id)
+        previous_metadata = result.metadata
+        from_cache = False
         
         # Importar el módulo de extractores
         try:
-            from .extractors import extract_metadata_from_file, extract_full_content_from_file
-            
-            # Extraer metadatos usando el extractor apropiado
-            extracted_metadata = extract_metadata_from_file(
-                file_path=result.file_path,
-                file_url=result.url_queue_item.url,
-                referrer=result.url_queue_item.referrer  # Nuevo campo referrer
-            )
-            
+            from .extractors import extract_document
+
+            # Reutilizar la extracción de otro resultado con el mismo contenido
+            file_extension = os.path.splitext(result.file_path)[1].lower()
+            cached = get_cached_extraction(result.file_hash, file_extension)
+
+            if cached is not None:
+                extracted_metadata = dict(cached.metadata)
+                extracted_metadata.update({
+                    'file_path': result.file_path,
+                    'file_url': result.url_queue_item.url,
+                    'referrer': result.url_queue_item.referrer,
+                    'extracted_at': datetime.now().isoformat(),
+                })
+                full_content = load_cached_content(cached)
+                from_cache = True
+
+                # Entradas de caché anteriores al escáner
+                if 'sensitive_data' not in extracted_metadata:
+                    add_sensitive_data_scan(extracted_metadata, full_content)
+            else:
+                # Límites de CONTENT_EXTRACTION_SETTINGS: al superarlos se guarda lo extraído hasta ese momento
+                budget = ExtractionBudget.from_settings()
+                extracted_metadata = {}
+                full_content = ''
+
+                with enforce_budget(budget):
+                    # Metadatos y contenido completo con un solo parseo del documento
+                    extraction = extract_document(
+                        file_path=result.file_path,
+                        file_url=result.url_queue_item.url,
+                        referrer=result.url_queue_item.referrer,
+                        file_hash=result.file_hash,  # Ya calculado durante la descarga
+                        budget=budget
+                    )
+                    extracted_metadata = extraction['metadata']
+                    full_content = extraction['full_content']
+
+                if len(full_content) > budget.max_chars:
+                    budget.note('chars')
+                extracted_metadata['extraction_status'] = budget.status()
+                add_sensitive_data_scan(extracted_metadata, full_content)
+
+                # Un resultado cortado por tiempo o memoria podría completarse en otro intento
+                if budget.cacheable:
+                    store_extraction(result.file_hash, file_extension, extracted_metadata, full_content)
+
             # Guardar metadatos extraídos
             result.metadata = extracted_metadata
-            
-            # NUEVA: Extracción de contenido completo
-            full_content = extract_full_content_from_file(result.file_path)
+
+            stored_content = None
             if full_content and full_content.strip():
-                # Aplicar límite de 1M caracteres
-                result.full_content = full_content[:1000000]
+                # Aplicar límite de MAX_CONTENT_CHARS; el contenido se guarda comprimido fuera de la fila
+                stored_content = full_content[:settings.CONTENT_EXTRACTION_SETTINGS.get('MAX_CONTENT_CHARS', 1000000)]
+                save_content(result, stored_content)
                 result.content_length = len(full_content)
                 result.content_extracted_at = timezone.now()
                 
                 logger.info(f"Contenido completo extraído: {len(full_content)} caracteres de {result.file_name}")
+            else:
+                # Una re-extracción sin contenido no debe dejar el de un intento anterior
+                stored_content = ''
+                save_content(result, stored_content)
+                result.content_length = 0
+                result.content_extracted_at = None
             
             result.save()
             
@@ -623,6 +1126,9 @@ def extract_file_metadata(self, result_id: int):
                 result.keywords = extracted_metadata['office_metadata']['keywords']
             
             result.save()
+
+            # Índice de texto completo (nombre, URL, título, descripción y contenido)
+            index_result(result, content=stored_content)
             
         except ImportError:
             # Si extractors.py no existe, usar extracción básica
@@ -651,7 +1157,9 @@ def extract_file_metadata(self, result_id: int):
             'metadata_fields_count': len(result.metadata),
             'has_extraction_error': 'extraction_error' in result.metadata,
             'content_characters': result.content_length,
-            'has_full_content': bool(result.full_content and result.full_content.strip())
+            'has_full_content': result.content_length > 0,
+            'from_cache': from_cache,
+            'partial': result.metadata.get('extraction_status', {}).get('partial', False)
         }
         
         CrawlLog.objects.create(
@@ -660,6 +1168,9 @@ def extract_file_metadata(self, result_id: int):
             message=f'Metadatos y contenido extraídos de {result.file_name}',
             details=log_details
         )
+
+        # Agregados del análisis de metadatos de la sesión
+        update_session_aggregates(result.session_id, previous_metadata, result.metadata)
         
         return {
             'status': 'completed', 
@@ -681,6 +1192,9 @@ def extract_file_metadata(self, result_id: int):
                 'extracted_at': timezone.now().isoformat()
             }
             result.save()
+
+            if previous_metadata is not None:
+                update_session_aggregates(result.session_id, previous_metadata, result.metadata)
             
             CrawlLog.objects.create(
                 session=result.session,
@@ -732,7 +1246,10 @@ def complete_crawl_session(self, session_id: int):
         session = CrawlSession.objects.get(id=session_id)
         session.status = 'completed'
         session.completed_at = timezone.now()
-        session.save()
+        session.save(update_fields=['status', 'completed_at', 'updated_at'])
+
+        close_http_session(session_id)
+        discard_frontier(session_id)
 
         CrawlLog.objects.create(
             session=session,
@@ -754,6 +1271,47 @@ def complete_crawl_session(self, session_id: int):
         return {'status': 'error', 'message': str(e)}
 
 
+@shared_task(bind=True)
+def update_session_statistics(self):
+    '''
+    Reconcilia periódicamente las estadísticas de las sesiones activas con
+    URLQueue y CrawlResult (corrige incrementos perdidos, p. ej. por un worker
+    que murió entre guardar la URL y actualizar el contador)
+    '''
+    updated = 0
+    for session in CrawlSession.objects.filter(status__in=['running', 'paused']).only('id'):
+        try:
+            session.recalculate_counters()
+            updated += 1
+        except Exception as e:
+            logger.error(f'Error actualizando estadísticas de la sesión {session.id}: {str(e)}')
+
+    return {'status': 'completed', 'sessions_updated': updated}
+
+
+@shared_task(bind=True)
+def publish_trailing_progress(self, session_id: int):
+    '''Publica el progreso que quedó descartado por el límite de notificaciones'''
+    publish_session_progress(session_id, force=True)
+
+
+@shared_task(bind=True)
+def cleanup_superseded_exports(self):
+    '''Elimina las exportaciones reemplazadas cuyo período de gracia ya terminó'''
+    from .exporters import delete_superseded_exports
+
+    deleted = 0
+    latest = set()
+    for job in ExportJob.objects.filter(status='completed').select_related('session').order_by('-completed_at'):
+        key = (job.session_id, job.export_format, json.dumps(job.options, sort_keys=True))
+        if key in latest:
+            continue
+        latest.add(key)
+        deleted += delete_superseded_exports(job)
+
+    return {'status': 'completed', 'deleted': deleted}
+
+
 @shared_task(bind=True)
 def stop_crawl_session(self, session_id: int):
     '''Detiene una sesión de crawling'''
@@ -761,7 +1319,10 @@ def stop_crawl_session(self, session_id: int):
         session = CrawlSession.objects.get(id=session_id)
         session.status = 'cancelled'
         session.completed_at = timezone.now()
-        session.save()
+        session.save(update_fields=['status', 'completed_at', 'updated_at'])
+
+        close_http_session(session_id)
+        discard_frontier(session_id)
 
         # Cancelar todas las URLs pendientes
         URLQueue.objects.filter(
@@ -780,3 +1341,66 @@ def stop_crawl_session(self, session_id: int):
     except Exception as e:
         logger.error(f'Error cancelando sesión: {str(e)}')
         return {'status': 'error', 'message': str(e)}
+
+
+@shared_task(
+    bind=True,
+    soft_time_limit=settings.CRAWLER_SETTINGS.get('EXPORT_SOFT_TIME_LIMIT', 3300),
+    time_limit=settings.CRAWLER_SETTINGS.get('EXPORT_TIME_LIMIT', 3600),
+)
+def run_export_job(self, job_id: int):
+    '''
+    Genera el archivo de una exportación (ExportJob) informando el avance.
+    Al terminar descarta las exportaciones anteriores con las mismas opciones.
+    '''
+    from .exporters import build_export_artifact, delete_superseded_exports, export_download_info
+
+    try:
+        job = ExportJob.objects.select_related('session').get(id=job_id)
+    except ExportJob.DoesNotExist:
+        return {'status': 'error', 'message': 'Exportación no encontrada'}
+
+    if job.status == 'completed':
+        return {'status': 'completed', 'job_id': job_id}
+
+    job.status = 'running'
+    job.started_at = timezone.now()
+    job.total_rows = 0 if job.export_format == 'pdf' else job.session.url_queue.count()
+    job.save(update_fields=['status', 'started_at', 'total_rows'])
+
+    last_update = [time.monotonic()]
+
+    def on_progress(rows: int):
+        # Como máximo una escritura cada 2 segundos
+        if time.monotonic() - last_update[0] < 2:
+            return
+        last_update[0] = time.monotonic()
+        rows = min(rows, job.total_rows)
+        progress = min(int(rows * 100 / job.total_rows), 99) if job.total_rows else 0
+        ExportJob.objects.filter(id=job.id).update(rows_written=rows, progress=progress)
+
+    try:
+        file_path, compression = build_export_artifact(job, on_progress)
+
+        job.file_path = file_path
+        job.compression = compression
+        job.file_size = os.path.getsize(file_path)
+        job.file_name = export_download_info(job)[0]
+        job.rows_written = job.total_rows
+        job.progress = 100
+        job.status = 'completed'
+        job.completed_at = timezone.now()
+        job.save()
+
+        # Las exportaciones anteriores con las mismas opciones quedaron obsoletas
+        delete_superseded_exports(job)
+
+        return {'status': 'completed', 'job_id': job_id, 'file_size': job.file_size}
+
+    except Exception as e:
+        logger.error(f'Error generando exportación {job_id}: {str(e)}')
+        job.status = 'failed'
+        job.error_message = str(e)
+        job.completed_at = timezone.now()
+        job.save(update_fields=['status', 'error_message', 'completed_at'])
+        return {'status': 'error', 'message': str(e)}
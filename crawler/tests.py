@@ -1,3 +1,1476 @@
-from django.test import TestCase
+import asyncio
+import functools
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .content_store import load_content, save_content
+from .exporters import (
+    delete_superseded_exports, get_or_create_export_job, iter_csv_export, iter_json_export,
+    streaming_export_response,
+)
+from .extraction_cache import get_cached_extraction, load_cached_content, store_extraction
+from .extraction_guard import ExtractionBudget, ExtractionBudgetExceeded, enforce_budget
+from .extractors import DOCX_AVAILABLE, OPENPYXL_AVAILABLE, extract_document
+from .fetcher import AIOHTTP_AVAILABLE, AsyncFetchEngine
+from .http_client import close_http_session, get_http_session, release_response
+from .frontier import URLFrontier
+from .metadata_utils import MetadataAnalyzer, analyze_session_metadata, update_session_aggregates
+from .models import (
+    CrawlResult, CrawlResultContent, CrawlSession, ExportJob, ExtractionCache, RobotsTxt,
+    SessionMetadataAggregate, URLQueue,
+)
+from .politeness import HostRateLimiter, _LocalState, parse_retry_after
+from .progress import publish_session_progress
+from .robots import RobotsMatcher, clear_local_matchers, is_allowed, parse_robots_txt, select_group
+from .scanner import contains_sensitive_data, scan_text
+from .snapshot import get_session_snapshot, get_shared_cache
+from .sitemaps import SitemapError, iter_sitemap, open_sitemap, parse_lastmod, sitemap_priority
+from .storage import ResponseBody, get_blob_path, get_session_storage_dir, store_blob
+from .search import SEARCH_TABLE, index_result, search_backend, search_results
+from .signals import reset_search_index_cache
+from .tasks import (
+    add_discovered_urls, claim_pending_urls, cleanup_superseded_exports, complete_crawl_session, insert_new_urls,
+    process_single_url, process_sitemaps, process_url_queue, publish_trailing_progress, read_response_body,
+    run_fetch_engine, start_crawl_session,
+)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'crawler': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    },
+)
+class StatsQueryCountTests(TestCase):
+    '''
+    Las estadísticas se calculan en la base de datos: la cantidad de consultas
+    de cada página no debe crecer con el número de sesiones y resultados
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='stats', password='stats')
+        cls.user.groups.add(Group.objects.create(name='admin'))
+        cls.session = cls.create_session(results=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    @classmethod
+    def create_session(cls, results: int, session: CrawlSession = None) -> CrawlSession:
+        if session is None:
+            session = CrawlSession.objects.create(
+                name='Sesión',
+                user=cls.user,
+                target_domain='example.com',
+                target_url='https://example.com/',
+                status='completed',
+                total_urls_discovered=results,
+                total_urls_processed=results,
+                total_files_found=results,
+            )
+
+        offset = session.url_queue.count()
+        url_items = URLQueue.objects.bulk_create([
+            URLQueue(
+                session=session,
+                url=f'https://example.com/doc{offset + i}.{extension}',
+                url_type=extension,
+                status='completed',
+                file_size=1024,
+            )
+            for i, extension in enumerate(['pdf', 'docx', 'xlsx', 'png'] * (results // 4) + ['pdf'] * (results % 4))
+        ])
+        CrawlResult.objects.bulk_create([
+            CrawlResult(
+                session=session,
+                url_queue_item=url_item,
+                file_name=url_item.url.rsplit('/', 1)[-1],
+                metadata={'author': 'Autor'},
+            )
+            for url_item in url_items
+        ])
+        return session
+
+    def count_queries(self, url: str) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_constant_queries(self, url: str, grow):
+        before = self.count_queries(url)
+        grow()
+        after = self.count_queries(url)
+        self.assertEqual(before, after, f'{url}: {before} consultas con pocos datos, {after} con más datos')
+
+    def add_sessions(self):
+        for _ in range(10):
+            self.create_session(results=20)
+
+    def test_dashboard_index(self):
+        self.assert_constant_queries(reverse('index'), self.add_sessions)
+
+    def test_crawler_stats(self):
+        self.assert_constant_queries(reverse('crawler:stats'), self.add_sessions)
+
+    def test_api_dashboard_stats(self):
+        url = reverse('crawler:api_dashboard_stats')
+        self.assert_constant_queries(url, self.add_sessions)
+
+        data = self.client.get(url).json()
+        self.assertEqual(data['total_sessions'], 11)
+        self.assertEqual(data['total_files_found'], 2 + 10 * 20)
+
+    def test_session_results(self):
+        url = reverse('crawler:session_results', args=[self.session.pk])
+        self.assert_constant_queries(url, lambda: self.create_session(results=60, session=self.session))
+
+        response = self.client.get(url)
+        self.assertEqual(response.context['total_results'], 62)
+        self.assertEqual(response.context['total_size'], 62 * 1024)
+        self.assertEqual(response.context['file_type_counts']['pdf'], 2 + 15)
+
+    def test_session_summary_single_query(self):
+        self.add_sessions()
+        with self.assertNumQueries(1):
+            summary = CrawlSession.objects.filter(user=self.user).summary()
+
+        self.assertEqual(summary['total_sessions'], 11)
+        self.assertEqual(summary['completed_sessions'], 11)
+        self.assertEqual(summary['active_sessions'], 0)
+        self.assertEqual(summary['total_urls_processed'], 2 + 10 * 20)
+
+
+class SortedSetClient:
+    '''Sorted set en memoria con la parte de la API de Redis que usa URLFrontier'''
+
+    def __init__(self):
+        self.members = {}
+
+    def zadd(self, key, mapping, nx=False):
+        added = [member for member in mapping if member not in self.members]
+        for member, score in mapping.items():
+            if not nx or member in added:
+                self.members[member] = score
+        return len(added)
+
+    def zpopmin(self, key, count):
+        popped = sorted(self.members.items(), key=lambda item: item[1])[:count]
+        for member, _ in popped:
+            del self.members[member]
+        return popped
+
+
+class FrontierTests(TestCase):
+    '''Las URLs se entregan por prioridad y, dentro de una prioridad, por antigüedad'''
+
+    def setUp(self):
+        user = User.objects.create_user(username='frontier', password='frontier')
+        self.session = CrawlSession.objects.create(
+            name='Frontera', user=user, target_domain='example.com', target_url='https://example.com/',
+            status='running',
+        )
+        now = timezone.now()
+        self.items = {}
+        for name, priority, age in (('nueva', 2, 1), ('antigua', 2, 10), ('urgente', 1, 0), ('baja', 3, 60)):
+            item = URLQueue.objects.create(session=self.session, url=f'https://example.com/{name}', priority=priority)
+            URLQueue.objects.filter(id=item.id).update(discovered_at=now - timedelta(minutes=age))
+            self.items[name] = item.id
+
+    def expected(self, *names):
+        return [self.items[name] for name in names]
+
+    def test_frontier_pops_by_priority_then_discovery(self):
+        frontier = URLFrontier(self.session.id, client=SortedSetClient())
+        self.assertEqual(frontier.push(URLQueue.objects.filter(session=self.session)), 4)
+
+        self.assertEqual(frontier.pop(3), self.expected('urgente', 'antigua', 'nueva'))
+        self.assertEqual(frontier.pop(3), self.expected('baja'))
+
+    def test_claim_without_frontier_uses_the_same_order(self):
+        claimed = claim_pending_urls(self.session, 2)
+
+        self.assertEqual([item.id for item in claimed], self.expected('urgente', 'antigua'))
+        self.assertEqual(
+            set(URLQueue.objects.filter(status='processing').values_list('id', flat=True)),
+            set(self.expected('urgente', 'antigua')),
+        )
+
+
+class SchedulerIndexTests(TestCase):
+    '''La consulta del planificador usa el índice parcial de pendientes, sin ordenar en memoria'''
+
+    def test_benchmark_reports_index_plan_and_rolls_back(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Plan verificado solo en SQLite')
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        out = io.StringIO()
+
+        with self.settings(MEDIA_ROOT=media_root):
+            call_command('benchmark_scheduler', sizes='200,400', repeat=2, stdout=out)
+
+        plan = out.getvalue().split('Plan de la consulta:')[1]
+        self.assertIn('urlqueue_pending_sched_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertFalse(CrawlSession.objects.exists())
+        self.assertFalse(URLQueue.objects.exists())
+
+
+class BlobStorageTests(TestCase):
+    '''Un blob compartido solo se elimina cuando se borra el último resultado que lo usa'''
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        media = self.settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def write_download(self, content: bytes) -> str:
+        path = tempfile.mkstemp(dir=self.media_root, suffix='.part')[1]
+        with open(path, 'wb') as download:
+            download.write(content)
+        return path
+
+    def test_shared_blob_released_with_last_result(self):
+        user = User.objects.create_user(username='blobs', password='blobs')
+        session = CrawlSession.objects.create(
+            name='Blobs', user=user, target_domain='example.com', target_url='https://example.com/',
+        )
+        file_hash = 'ab' * 32
+        blob_path = get_blob_path(file_hash, 'informe.pdf')
+
+        results = []
+        for i, created in enumerate((True, False)):
+            temp_path = self.write_download(b'%PDF-1.4 informe')
+            self.assertEqual(store_blob(temp_path, blob_path, file_hash), created)
+            self.assertFalse(os.path.exists(temp_path))
+            url_item = URLQueue.objects.create(session=session, url=f'https://example.com/{i}/informe.pdf')
+            results.append(CrawlResult.objects.create(
+                session=session, url_queue_item=url_item, file_name='informe.pdf',
+                file_path=blob_path, file_hash=file_hash,
+            ))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            results[0].delete()
+        self.assertTrue(os.path.exists(blob_path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            results[1].delete()
+        self.assertFalse(os.path.exists(blob_path))
+
+
+class ExtractionBudgetTests(SimpleTestCase):
+    '''Al agotarse el tiempo se conserva el contenido ya extraído'''
+
+    def test_timeout_keeps_partial_docx_content(self):
+        if not DOCX_AVAILABLE:
+            self.skipTest('python-docx no instalado')
+        import docx
+
+        document = docx.Document()
+        for i in range(50):
+            document.add_paragraph(f'Párrafo {i}')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, 'informe.docx')
+        document.save(path)
+
+        # La alarma del presupuesto llega mientras se recorren los párrafos
+        checks = iter(range(100))
+
+        def expired(budget):
+            if next(checks) == 10:
+                budget.note('timeout')
+                raise ExtractionBudgetExceeded('timeout')
+            return False
+
+        budget = ExtractionBudget(timeout=60)
+        with mock.patch.object(ExtractionBudget, 'expired', expired), enforce_budget(budget):
+            extraction = extract_document(path, budget=budget)
+
+        self.assertNotIn('extraction_error', extraction['metadata'])
+        self.assertIn('Párrafo 0', extraction['full_content'])
+        self.assertNotIn('Párrafo 49', extraction['full_content'])
+        self.assertEqual(budget.status()['limits_reached'], ['timeout'])
+
+
+class XlsxExtractionTests(SimpleTestCase):
+    '''Hojas de cálculo sin <dimension> (read_only no conoce su tamaño)'''
+
+    def write_unsized_xlsx(self) -> str:
+        import openpyxl
+        import re
+        import zipfile
+
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = 'Datos'
+        for row in (('Nombre', 'Comuna'), ('Ana', 'Ñuñoa'), ('Luis', 'Temuco')):
+            sheet.append(row)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        source, path = os.path.join(directory, 'origen.xlsx'), os.path.join(directory, 'datos.xlsx')
+        workbook.save(source)
+
+        with zipfile.ZipFile(source) as original, zipfile.ZipFile(path, 'w') as stripped:
+            for entry in original.infolist():
+                data = original.read(entry)
+                if entry.filename.startswith('xl/worksheets/'):
+                    data = re.sub(rb'<dimension [^>]*/>', b'', data)
+                stripped.writestr(entry, data)
+        return path
+
+    def test_dimensions_and_content_without_dimension_element(self):
+        if not OPENPYXL_AVAILABLE:
+            self.skipTest('openpyxl no instalado')
+
+        extraction = extract_document(self.write_unsized_xlsx())
+
+        self.assertNotIn('extraction_error', extraction['metadata'])
+        self.assertEqual(
+            extraction['metadata']['sheets_info'],
+            [{'name': 'Datos', 'max_row': 3, 'max_column': 2}],
+        )
+        self.assertIn('Luis | Temuco\n', extraction['full_content'] + '\n')
+
+
+class SessionCounterTests(TestCase):
+    '''Los contadores de la sesión se reconcilian en la base de datos sin pisar otras escrituras'''
+
+    def test_recalculate_counters_with_single_update(self):
+        user = User.objects.create_user(username='counters', password='counters')
+        session = CrawlSession.objects.create(
+            name='Contadores', user=user, target_domain='example.com', target_url='https://example.com/',
+            status='running', total_errors=7,
+        )
+        statuses = ['completed', 'completed', 'failed', 'pending']
+        items = URLQueue.objects.bulk_create([
+            URLQueue(session=session, url=f'https://example.com/{i}', status=status)
+            for i, status in enumerate(statuses)
+        ])
+        CrawlResult.objects.create(session=session, url_queue_item=items[0], file_name='0.pdf')
+
+        # Otro proceso detiene la sesión; la instancia en memoria quedó desactualizada
+        CrawlSession.objects.filter(id=session.id).update(status='stopped')
+        with CaptureQueriesContext(connection) as queries:
+            counters = session.recalculate_counters()
+
+        self.assertEqual(counters, {
+            'total_urls_discovered': 4, 'total_urls_processed': 2, 'total_files_found': 1, 'total_errors': 1,
+        })
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries.captured_queries), 1)
+        self.assertEqual(CrawlSession.objects.get(id=session.id).status, 'stopped')
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'crawler': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    },
+)
+class MetadataAggregateTests(TestCase):
+    '''Los agregados incrementales producen el mismo análisis que recorrer todos los resultados'''
+
+    def setUp(self):
+        user = User.objects.create_user(username='metadata', password='metadata')
+        self.session = CrawlSession.objects.create(
+            name='Metadatos',
+            user=user,
+            target_domain='example.com',
+            target_url='https://example.com/',
+        )
+
+    def add_result(self, i: int, metadata: dict) -> CrawlResult:
+        url_item = URLQueue.objects.create(session=self.session, url=f'https://example.com/{i}.pdf')
+        result = CrawlResult.objects.create(session=self.session, url_queue_item=url_item, metadata=metadata)
+        update_session_aggregates(self.session.id, {}, metadata)
+        return result
+
+    def full_analysis(self):
+        results = CrawlResult.objects.filter(session=self.session).exclude(metadata={})
+        return MetadataAnalyzer(results).analyze_all()
+
+    def test_incremental_matches_full_analysis(self):
+        for i in range(12):
+            self.add_result(i, {
+                'pdf_metadata': {
+                    'author': ['Ana', 'admin', 'ana@example.com'][i % 3],
+                    'producer': ['Acrobat 2011', 'LibreOffice 7.1'][i % 2],
+                    'creation_date': f'2015-0{i % 9 + 1}-10T10:00:00',
+                },
+                'exif_metadata': {'gps_coordinates': {'latitude': -33.45 + i * 0.001, 'longitude': -70.6}},
+            })
+        removed = CrawlResult.objects.filter(session=self.session).first()
+        removed.delete()
+
+        analysis = analyze_session_metadata(self.session)
+        full = self.full_analysis()
+        for section in ['authors_analysis', 'software_analysis', 'temporal_analysis', 'risk_assessment']:
+            self.assertEqual(analysis[section], full[section])
+        self.assertEqual(analysis['location_analysis']['total_files_with_gps'], 11)
+        self.assertTrue(analysis['risk_assessment']['identified_risks'])
+
+        with self.assertNumQueries(1):
+            analyze_session_metadata(self.session)
+
+    def test_session_without_aggregate_is_rebuilt(self):
+        self.add_result(0, {'office_metadata': {'author': 'Ana'}})
+        SessionMetadataAggregate.objects.filter(session=self.session).delete()
+
+        analysis = analyze_session_metadata(self.session)
+        self.assertEqual(analysis['authors_analysis']['total_unique_authors'], 1)
+
+
+class LocationClusterTests(SimpleTestCase):
+    '''Los clusters por grilla coinciden con la comparación de todas las coordenadas entre sí'''
+
+    @staticmethod
+    def pairwise_sizes(points):
+        '''Agrupación por pares (comportamiento de referencia)'''
+        expanded = [coordinate for coordinate, count in points.items() for _ in range(count)]
+        sizes, processed = [], set()
+        for i, seed in enumerate(expanded):
+            if i in processed:
+                continue
+            processed.add(i)
+            size = 1
+            for j in range(i + 1, len(expanded)):
+                if j not in processed and ((seed[0] - expanded[j][0]) ** 2 + (seed[1] - expanded[j][1]) ** 2) ** 0.5 < 0.01:
+                    processed.add(j)
+                    size += 1
+            if size > 1:
+                sizes.append(size)
+        return sizes
+
+    def clusters(self, points):
+        return MetadataAnalyzer(aggregates={})._detect_location_clusters(dict(sorted(points.items())))
+
+    def test_grid_clusters_match_pairwise_clustering(self):
+        coordinates = [(-33.45 + (i % 7) * 0.004, -70.6 + (i % 5) * 0.006) for i in range(40)]
+        points = {}
+        for coordinate in coordinates:
+            points[coordinate] = points.get(coordinate, 0) + 1
+        points = dict(sorted(points.items()))
+
+        clusters = self.clusters(points)
+        self.assertEqual([cluster['size'] for cluster in clusters], self.pairwise_sizes(points))
+
+    def test_neighbouring_cells_are_compared(self):
+        points = {
+            # Esquina entre cuatro celdas: la pareja queda en celdas diagonales
+            (0.0199, 0.0399): 1,
+            (0.0201, 0.0401): 1,
+            # Celdas contiguas: a 0.0095 se agrupan, la tercera queda a más de 0.01 del origen
+            (0.5005, 1.0): 2,
+            (0.5100, 1.0): 1,
+            (0.5206, 1.0): 1,
+        }
+
+        clusters = self.clusters(points)
+
+        self.assertEqual([cluster['size'] for cluster in clusters], [2, 3])
+        self.assertEqual([cluster['size'] for cluster in clusters], self.pairwise_sizes(dict(sorted(points.items()))))
+        self.assertEqual(clusters[1]['coordinates'], [(0.5005, 1.0), (0.51, 1.0)])
+
+
+class SensitiveDataScannerTests(SimpleTestCase):
+
+    def test_findings_are_typed_and_ordered(self):
+        text = 'Contacto: ana@example.com, RUT 12.345.678-9. Clave: 1234'
+        summary = scan_text(text)
+
+        self.assertEqual([finding['type'] for finding in summary['findings']], ['email', 'rut', 'secret_keyword'])
+        email = summary['findings'][0]
+        self.assertEqual(text[email['start']:email['end']], 'ana@example.com')
+        self.assertFalse(summary['truncated'])
+
+    def test_counts_include_findings_beyond_limit(self):
+        summary = scan_text('token ' * 10, max_findings=3)
+
+        self.assertEqual(summary['counts'], {'secret_keyword': 10})
+        self.assertEqual(len(summary['findings']), 3)
+        self.assertTrue(summary['truncated'])
+
+    def test_contains_sensitive_data(self):
+        self.assertTrue(contains_sensitive_data('9 8765 4321'))
+        self.assertFalse(contains_sensitive_data('Total anual'))
+        self.assertFalse(contains_sensitive_data(''))
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'crawler': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'snapshots'},
+})
+@mock.patch('crawler.signals.publish_session_progress')
+class SessionSnapshotTests(TestCase):
+    '''El progreso de una sesión se calcula con una consulta y se comparte hasta que cambia su estado'''
+
+    def setUp(self):
+        user = User.objects.create_user(username='snapshot', password='snapshot')
+        self.session = CrawlSession.objects.create(
+            name='Snapshot', user=user, target_domain='example.com', target_url='https://example.com/',
+            status='running',
+        )
+        for i, status in enumerate(('pending', 'pending', 'completed')):
+            URLQueue.objects.create(session=self.session, url=f'https://example.com/{i}', status=status)
+        get_shared_cache().clear()
+
+    def test_snapshot_is_cached_until_the_status_changes(self, _publish):
+        with self.assertNumQueries(1):
+            snapshot = get_session_snapshot(self.session)
+        self.assertEqual(
+            snapshot['url_stats'],
+            {'pending': 2, 'processing': 0, 'completed': 1, 'failed': 0, 'skipped': 0},
+        )
+
+        URLQueue.objects.create(session=self.session, url='https://example.com/3', status='failed')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_session_snapshot(self.session)['url_stats']['failed'], 0)
+
+        self.session.status = 'paused'
+        self.session.save(update_fields=['status', 'updated_at'])
+        with self.assertNumQueries(1):
+            snapshot = get_session_snapshot(self.session)
+        self.assertEqual((snapshot['status'], snapshot['url_stats']['failed']), ('paused', 1))
+
+
+class KeyValueClient:
+    '''Cliente Redis en memoria con SET NX (las claves no expiran)'''
+
+    def __init__(self):
+        self.keys = set()
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.keys:
+            return None
+        self.keys.add(key)
+        return True
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'crawler': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+})
+@mock.patch('crawler.progress.redis_available', return_value=True)
+class ProgressPublishTests(TestCase):
+    '''Las notificaciones de progreso se limitan sin perder la última actualización'''
+
+    def setUp(self):
+        user = User.objects.create_user(username='progress', password='progress')
+        self.session = CrawlSession.objects.create(
+            name='Progreso', user=user, target_domain='example.com', target_url='https://example.com/',
+        )
+        self.layer = mock.Mock(group_send=mock.AsyncMock())
+        for target, value in (('get_channel_layer', self.layer), ('get_redis_client', KeyValueClient())):
+            patcher = mock.patch(f'crawler.progress.{target}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @override_settings(CRAWLER_SETTINGS={**settings.CRAWLER_SETTINGS, 'PROGRESS_UPDATES_PER_SECOND': 2})
+    def test_dropped_updates_schedule_one_trailing_publish(self, _redis):
+        with mock.patch.object(publish_trailing_progress, 'apply_async') as trailing:
+            for _ in range(3):
+                publish_session_progress(self.session.id)
+
+        self.assertEqual(self.layer.group_send.await_count, 1)
+        trailing.assert_called_once_with(args=[self.session.id], countdown=0.5)
+
+        publish_trailing_progress(self.session.id)
+        self.assertEqual(self.layer.group_send.await_count, 2)
+
+    def test_session_saves_publish_only_snapshot_changes(self, _redis):
+        with mock.patch('crawler.signals.publish_session_progress') as publish:
+            self.session.save(update_fields=['advanced_config', 'updated_at'])
+            publish.assert_not_called()
+
+            self.session.status = 'paused'
+            self.session.save(update_fields=['status', 'updated_at'])
+            publish.assert_called_once_with(self.session.id, force=True)
+
+
+class SearchIndexTests(TestCase):
+    '''Búsqueda de texto completo sobre el contenido extraído'''
+
+    def setUp(self):
+        if search_backend() is None:
+            self.skipTest('Base de datos sin índice de texto completo')
+        user = User.objects.create_user(username='search', password='search')
+        self.session = CrawlSession.objects.create(
+            name='Búsqueda',
+            user=user,
+            target_domain='example.com',
+            target_url='https://example.com/',
+        )
+
+    def add_result(self, i: int, content: str, title: str = '') -> CrawlResult:
+        url_item = URLQueue.objects.create(session=self.session, url=f'https://example.com/{i}.pdf')
+        result = CrawlResult.objects.create(session=self.session, url_queue_item=url_item, file_name=f'{i}.pdf', title=title)
+        save_content(result, content)
+        index_result(result)
+        return result
+
+    def test_ranked_matches_with_highlighted_snippet(self):
+        self.add_result(1, 'Bases de la licitación municipal de Ñuñoa <script>', title='Licitación')
+        self.add_result(2, 'Acta de la licitación')
+        self.add_result(3, 'Presupuesto anual')
+
+        hits = search_results('licitacion nunoa', CrawlResult.objects.filter(session=self.session))
+
+        self.assertEqual(hits.count(), 1)
+        snippet = hits[0:10][0].search_snippet
+        self.assertIn('<mark>Ñuñoa</mark>', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertEqual(search_results('licit', CrawlResult.objects.all()).count(), 2)
+
+    def test_deleted_results_leave_the_index(self):
+        result = self.add_result(1, 'Contrato de servicios')
+        self.add_result(2, 'Contrato de obras')
+
+        result.delete()
+        self.assertEqual(search_results('contrato', CrawlResult.objects.all()).count(), 1)
+
+        self.session.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_missing_index_table_falls_back_to_simple_filter(self):
+        self.add_result(1, 'Sin relación', title='Contrato de servicios')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {SEARCH_TABLE}')
+
+        with mock.patch.dict('crawler.search._index_tables', clear=True):
+            self.assertIsNone(search_backend())
+            hits = search_results('contrato', CrawlResult.objects.all())
+            self.assertEqual(hits.count(), 1)
+
+    def test_index_check_is_cached_until_migrate(self):
+        with mock.patch.dict('crawler.search._index_tables', clear=True), \
+                mock.patch.object(connection.introspection, 'table_names', return_value=[]) as tables:
+            self.assertIsNone(search_backend())
+            self.assertIsNone(search_backend())
+            self.assertEqual(tables.call_count, 1)
+
+            tables.return_value = [SEARCH_TABLE]
+            reset_search_index_cache(sender=None)
+            self.assertEqual(search_backend(), connection.vendor)
+            self.assertEqual(tables.call_count, 2)
+
+    def test_index_does_not_copy_the_content(self):
+        if connection.vendor != 'sqlite' or connection.Database.sqlite_version_info < (3, 43):
+            self.skipTest('Tabla FTS5 sin contenido requiere SQLite 3.43')
+        result = self.add_result(1, 'Contrato de servicios')
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT content FROM {SEARCH_TABLE} WHERE rowid = %s', [result.id])
+            self.assertIsNone(cursor.fetchone()[0])
+        hits = search_results('servicios', CrawlResult.objects.all())
+        self.assertIn('<mark>servicios</mark>', hits[0:1][0].search_snippet)
+
+
+class ContentStoreTests(TestCase):
+    '''El contenido completo se guarda comprimido fuera de CrawlResult'''
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='content', password='content')
+        session = CrawlSession.objects.create(
+            name='Contenido',
+            user=self.user,
+            target_domain='example.com',
+            target_url='https://example.com/',
+        )
+        url_item = URLQueue.objects.create(session=session, url='https://example.com/a.pdf')
+        self.result = CrawlResult.objects.create(session=session, url_queue_item=url_item, file_name='a.pdf')
+
+    def test_content_round_trip(self):
+        text = 'Informe de gestión 2024. ' * 1000
+        save_content(self.result, text)
+
+        stored = CrawlResultContent.objects.get(result=self.result)
+        self.assertLess(len(stored.data), len(text) // 10)
+        self.assertEqual(load_content(CrawlResult.objects.get(id=self.result.id)), text)
+
+        save_content(self.result, '')
+        self.assertEqual(load_content(CrawlResult.objects.get(id=self.result.id)), '')
+
+    def test_detail_view_loads_content(self):
+        save_content(self.result, 'Contenido <b>extraído</b>')
+        self.user.groups.add(Group.objects.create(name='viewer'))
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('crawler:file_metadata_detail', args=[self.result.id]))
+
+        self.assertContains(response, 'Contenido &lt;b&gt;extraído&lt;/b&gt;')
+
+
+class ExtractionCacheTests(TestCase):
+    '''La caché de extracción guarda el contenido comprimido y se recorta de a lotes'''
+
+    def test_content_is_stored_compressed(self):
+        text = 'Acta de sesión del concejo. ' * 2000
+        store_extraction('a' * 64, '.pdf', {'file_path': '/tmp/a.pdf', 'pages': 3}, text)
+
+        entry = get_cached_extraction('a' * 64, '.pdf')
+        self.assertLess(len(entry.content_data), len(text) // 10)
+        self.assertEqual(load_cached_content(entry), text)
+        self.assertEqual(entry.metadata, {'pages': 3})
+
+    @override_settings(
+        CONTENT_EXTRACTION_SETTINGS={'CACHE_MAX_ENTRIES': 2, 'CACHE_EVICT_EVERY': 4},
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'crawler': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'extraction-cache'},
+        },
+    )
+    def test_eviction_runs_every_n_inserts(self):
+        get_shared_cache().clear()
+        with mock.patch('crawler.extraction_cache.evict_extraction_cache') as evict:
+            for i in range(8):
+                store_extraction(f'{i:064d}', '.pdf', {}, 'texto')
+        self.assertEqual(evict.call_count, 2)
+
+    @override_settings(
+        CONTENT_EXTRACTION_SETTINGS={'CACHE_MAX_ENTRIES': 2, 'CACHE_EVICT_EVERY': 4},
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'crawler': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        },
+    )
+    def test_limit_is_checked_on_every_insert_without_counter(self):
+        for i in range(5):
+            store_extraction(f'{i:064d}', '.pdf', {}, 'texto')
+            ExtractionCache.objects.filter(file_hash=f'{i:064d}').update(last_used_at=timezone.now() - timedelta(minutes=10 - i))
+
+        self.assertEqual(
+            sorted(ExtractionCache.objects.values_list('file_hash', flat=True)),
+            [f'{3:064d}', f'{4:064d}'],
+        )
+
+
+class RobotsTxtTests(TestCase):
+    '''robots.txt: precedencia de reglas, caché compartido y filtrado al descubrir URLs'''
+
+    ROBOTS = (
+        'User-agent: *\n'
+        'Disallow: /\n'
+        '\n'
+        'User-agent: otherbot\n'
+        'User-agent: FisgonCrawler\n'
+        'Disallow: /privado/\n'
+        'Allow: /privado/publico\n'
+        'Disallow: /*.php$\n'
+        'Disallow: /buscar?q=\n'
+        'Crawl-delay: 2\n'
+        'Sitemap: https://example.com/sitemap.xml\n'
+    )
+
+    def setUp(self):
+        clear_local_matchers()
+        self.addCleanup(clear_local_matchers)
+
+    def fake_http(self, *responses):
+        http = mock.Mock()
+        http.get.side_effect = [
+            mock.Mock(status_code=status, headers=headers, iter_content=mock.Mock(return_value=[body.encode()]))
+            for status, headers, body in responses
+        ]
+        patcher = mock.patch('crawler.robots.get_http_session', return_value=http)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return http
+
+    def test_longest_match_wins(self):
+        rules = parse_robots_txt(self.ROBOTS)
+        group = select_group(rules['groups'], 'fisgoncrawler')
+        matcher = RobotsMatcher(group['allow'], group['disallow'], group['crawl_delay'], rules['sitemaps'])
+
+        self.assertFalse(matcher.allowed('https://example.com/privado/informe.pdf'))
+        self.assertTrue(matcher.allowed('https://example.com/privado/publico/informe.pdf'))
+        self.assertFalse(matcher.allowed('https://example.com/app/index.php'))
+        self.assertTrue(matcher.allowed('https://example.com/app/index.php?id=1'))
+        self.assertFalse(matcher.allowed('https://example.com/buscar?q=informe'))
+        self.assertTrue(matcher.allowed('https://example.com/docs/a%20b.pdf'))
+        self.assertEqual(matcher.crawl_delay, 2)
+        self.assertEqual(matcher.sitemaps, ['https://example.com/sitemap.xml'])
+        self.assertEqual(select_group(rules['groups'], 'otrobot')['disallow'], ['/'])
+        # El token se compara completo: 'crawler' no aplica a 'fisgoncrawler'
+        rules = parse_robots_txt('User-agent: crawler\nDisallow: /\n\nUser-agent: *\nAllow: /\n')
+        self.assertEqual(select_group(rules['groups'], 'fisgoncrawler'), rules['groups']['*'])
+
+    def test_fetched_once_and_revalidated(self):
+        http = self.fake_http(
+            (200, {'ETag': '"v1"'}, self.ROBOTS),
+            (304, {}, ''),
+        )
+
+        self.assertFalse(is_allowed('https://example.com/privado/a.pdf', session_id=1))
+        clear_local_matchers()
+        self.assertTrue(is_allowed('https://example.com/docs/a.pdf', session_id=1))
+        self.assertEqual(http.get.call_count, 1)
+        self.assertEqual(http.get.call_args.args[0], 'https://example.com/robots.txt')
+
+        RobotsTxt.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        clear_local_matchers()
+        self.assertFalse(is_allowed('https://example.com/privado/a.pdf', session_id=1))
+        self.assertEqual(http.get.call_args.kwargs['headers'], {'If-None-Match': '"v1"'})
+        self.assertGreater(RobotsTxt.objects.get().expires_at, timezone.now())
+
+    def test_missing_and_unreachable_robots(self):
+        self.fake_http((404, {}, ''), (503, {}, ''))
+
+        self.assertTrue(is_allowed('http://example.com/a.pdf', session_id=1))
+        self.assertFalse(is_allowed('https://example.com/a.pdf', session_id=1))
+        self.assertEqual(
+            dict(RobotsTxt.objects.values_list('origin', 'status')),
+            {'http://example.com': 'unavailable', 'https://example.com': 'unreachable'}
+        )
+
+    def test_disallowed_urls_never_enter_the_queue(self):
+        from .tasks import add_discovered_urls
+
+        user = User.objects.create_user(username='robots', password='robots')
+        session = CrawlSession.objects.create(
+            name='Robots', user=user, target_domain='example.com', target_url='https://example.com/'
+        )
+        RobotsTxt.objects.create(
+            origin='https://example.com', status='ok', rules=parse_robots_txt(self.ROBOTS),
+            expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+        created = add_discovered_urls(session, {
+            'https://example.com/privado/a.pdf',
+            'https://example.com/privado/publico/b.pdf',
+            'https://example.com/c.pdf',
+        })
+
+        self.assertEqual(
+            sorted(item.url for item in URLQueue.objects.filter(id__in=[item.id for item in created])),
+            ['https://example.com/c.pdf', 'https://example.com/privado/publico/b.pdf']
+        )
+
+    def test_unreachable_robots_postpones_instead_of_dropping(self):
+        from .tasks import add_discovered_urls, check_robots_before_fetch, claim_pending_urls
+
+        user = User.objects.create_user(username='robots', password='robots')
+        session = CrawlSession.objects.create(
+            name='Robots', user=user, target_domain='example.com', target_url='https://example.com/'
+        )
+        RobotsTxt.objects.create(
+            origin='https://example.com', status='unreachable', http_status=503,
+            expires_at=timezone.now() + timedelta(minutes=10)
+        )
+
+        created = add_discovered_urls(session, {'https://example.com/a.pdf'})
+        self.assertEqual(len(created), 1)
+
+        items = claim_pending_urls(session, 10)
+        self.assertEqual(check_robots_before_fetch(session, items, wait=False), [])
+        self.assertEqual(URLQueue.objects.get().status, 'pending')
+
+        RobotsTxt.objects.update(status='ok', rules=parse_robots_txt('User-agent: *\nDisallow: /\n'))
+        clear_local_matchers()
+        self.assertEqual(check_robots_before_fetch(session, claim_pending_urls(session, 10)), [])
+        self.assertEqual(URLQueue.objects.get().status, 'skipped')
+
+
+class SitemapTests(SimpleTestCase):
+    '''Lectura en streaming de sitemaps e índices'''
+
+    URLSET = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        '<url><loc> https://example.com/a.pdf </loc><lastmod>2026-10-01</lastmod></url>'
+        '<url><loc>https://example.com/b.html</loc></url>'
+        '<url><lastmod>2020-01-01</lastmod></url>'
+        '</urlset>'
+    )
+
+    def read(self, data: bytes, **kwargs):
+        return list(iter_sitemap(open_sitemap(io.BytesIO(data), **kwargs)))
+
+    def test_urlset_plain_and_gzip(self):
+        for data in (self.URLSET.encode(), gzip.compress(self.URLSET.encode())):
+            entries = self.read(data)
+            self.assertEqual([(entry.kind, entry.loc) for entry in entries], [
+                ('url', 'https://example.com/a.pdf'),
+                ('url', 'https://example.com/b.html'),
+            ])
+            self.assertEqual(entries[0].lastmod, parse_lastmod('2026-10-01T00:00:00Z'))
+            self.assertIsNone(entries[1].lastmod)
+
+    def test_sitemap_index(self):
+        index = (
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            '<sitemap><loc>https://example.com/docs.xml.gz</loc><lastmod>2026-09-30T10:00:00+00:00</lastmod></sitemap>'
+            '</sitemapindex>'
+        )
+        self.assertEqual([(entry.kind, entry.loc) for entry in self.read(index.encode())], [
+            ('sitemap', 'https://example.com/docs.xml.gz'),
+        ])
+
+    def test_size_limit_and_invalid_xml(self):
+        with self.assertRaises(SitemapError):
+            self.read(gzip.compress(self.URLSET.encode()), max_bytes=100)
+        with self.assertRaises(SitemapError):
+            self.read(b'<urlset><url>')
+
+    def test_priority_uses_lastmod(self):
+        now = parse_lastmod('2026-10-18')
+        self.assertEqual(sitemap_priority('https://example.com/a.docx', None, now), 2)
+        self.assertEqual(sitemap_priority('https://example.com/a.docx', parse_lastmod('2026-10-10'), now), 1)
+        self.assertEqual(sitemap_priority('https://example.com/a.docx', parse_lastmod('2024-01-01'), now), 3)
+
+
+@mock.patch('crawler.politeness.redis_available', return_value=False)
+class PolitenessTests(SimpleTestCase):
+    '''Ritmo adaptativo por host (estado local, sin Redis)'''
+
+    URL = 'https://example.com/a.pdf'
+
+    def setUp(self):
+        patcher = mock.patch('crawler.politeness._local_state', _LocalState())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = 1000.0
+        clock = mock.patch('crawler.politeness.time.time', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def limiter(self, rate=2.0, crawl_delay=0.0):
+        limiter = HostRateLimiter(1, rate, respect_crawl_delay=False)
+        limiter._crawl_delays['example.com'] = crawl_delay
+        return limiter
+
+    def test_spacing_and_crawl_delay(self, _):
+        limiter = self.limiter()
+        self.assertEqual([limiter.reserve(self.URL) for _ in range(3)], [0.0, 0.5, 1.0])
+        # Otro host no comparte turnos
+        self.assertEqual(limiter.reserve('https://otro.example.org/'), 0.0)
+
+        limiter = HostRateLimiter(2, 2.0, respect_crawl_delay=False)
+        limiter._crawl_delays['example.com'] = 3.0
+        self.assertEqual([limiter.reserve(self.URL) for _ in range(2)], [0.0, 3.0])
+
+    def test_throttle_honours_retry_after(self, _):
+        limiter = self.limiter()
+        self.assertEqual(limiter.record(self.URL, 429, 0.2, {'Retry-After': '120'}), 1.0)
+        self.assertEqual(limiter.reserve(self.URL, max_delay=60), 120.0)
+        # Sin reserva si la espera supera max_delay: el turno sigue disponible
+        self.assertEqual(limiter.reserve(self.URL), 120.0)
+        self.assertEqual(limiter.reserve(self.URL), 121.0)
+        self.assertEqual(limiter.record(self.URL, None, None), 0.5)
+
+        self.assertEqual(parse_retry_after('Thu, 01 Jan 1970 00:20:00 GMT', now=1000.0), 200.0)
+        self.assertEqual(parse_retry_after('mañana'), 0.0)
+
+    def test_recovers_and_backs_off_on_latency(self, _):
+        limiter = self.limiter(rate=1.0)
+        limiter.record(self.URL, 503, None)
+        for _ in range(20):
+            rate = limiter.record(self.URL, 200, 0.5)
+        self.assertEqual(rate, 1.0)
+        self.assertAlmostEqual(limiter.record(self.URL, 200, 5.0), 0.5)
+
+
+@mock.patch('crawler.politeness.redis_available', return_value=False)
+class PolitenessDispatchTests(TestCase):
+    '''Un host en espera no genera tareas con ETA lejano ni frena a los demás'''
+
+    def setUp(self):
+        patcher = mock.patch('crawler.politeness._local_state', _LocalState())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user = User.objects.create_user(username='polite', password='polite')
+        self.session = CrawlSession.objects.create(
+            name='Ritmo', user=user, target_domain='example.com', target_url='https://example.com/',
+            status='running', rate_limit=1.0, respect_robots_txt=False,
+        )
+        for url in ('https://lento.example.com/a', 'https://lento.example.com/b', 'https://example.com/c'):
+            URLQueue.objects.create(session=self.session, url=url, depth=1, priority=1)
+
+    @mock.patch('crawler.tasks.get_frontier', return_value=None)
+    @mock.patch('crawler.tasks.enqueue_urls')
+    def test_blocked_host_goes_back_to_frontier(self, enqueue, _frontier, _redis):
+        HostRateLimiter(self.session.id, 1.0, respect_crawl_delay=False).record(
+            'https://lento.example.com/a', 429, None, {'Retry-After': '600'}
+        )
+
+        with mock.patch.object(process_single_url, 'apply_async') as fetch, \
+                mock.patch.object(process_url_queue, 'apply_async') as dispatch:
+            result = process_url_queue(self.session.id)
+
+        self.assertEqual((result['processed'], result['deferred']), (1, 2))
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(fetch.call_args.kwargs['countdown'], 0.0)
+        self.assertEqual(
+            sorted(item.url for item in enqueue.call_args.args[1]),
+            ['https://lento.example.com/a', 'https://lento.example.com/b'],
+        )
+        self.assertLessEqual(dispatch.call_args.kwargs['countdown'], 60)
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    '''
+    Servidor de prueba (HTTP/1.1 con keep-alive): /missing responde 404,
+    /large 200 KB sin Content-Length y todo lo demás una página HTML
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.clients.append(self.client_address)
+        if self.path.startswith('/large'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(b'x' * 200 * 1024)
+            self.close_connection = True
+            return
+        if self.path.startswith('/missing'):
+            self.send_error(404)
+            return
+        body = f'<html><body>{self.path}</body></html>'.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_test_server(test) -> ThreadingHTTPServer:
+    '''Levanta PageHandler en un hilo. server.url es su URL base y server.clients las conexiones de cada request'''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    server.clients = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server
+
+
+class HttpSessionPoolTests(SimpleTestCase):
+    '''Un requests.Session por sesión de crawling que reutiliza las conexiones'''
+
+    def setUp(self):
+        self.server = start_test_server(self)
+        for session_id in (901, 902):
+            self.addCleanup(close_http_session, session_id)
+
+    def test_connections_are_reused_per_session(self):
+        http = get_http_session(901)
+        self.assertIs(get_http_session(901), http)
+        self.assertIsNot(get_http_session(902), http)
+        self.assertEqual(http.headers['Connection'], 'keep-alive')
+
+        for path in ('/a', '/b', '/c'):
+            response = http.get(self.server.url + path, stream=True)
+            self.assertEqual(response.status_code, 200)
+            release_response(response)
+
+        # Los tres requests usaron el mismo socket
+        self.assertEqual(len(set(self.server.clients)), 1)
+
+        close_http_session(901)
+        self.assertIsNot(get_http_session(901), http)
+
+
+class StreamingDownloadTests(SimpleTestCase):
+    '''Las descargas se escriben a disco por bloques y se cortan al superar max_file_size'''
+
+    def setUp(self):
+        self.server = start_test_server(self)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.session = CrawlSession(id=903, max_depth=0, max_file_size=100 * 1024, file_types=['html'])
+
+    def download(self, path: str):
+        url_item = URLQueue(session=self.session, url=self.server.url + path, depth=1)
+        response = requests.get(url_item.url, stream=True)
+        self.addCleanup(response.close)
+        return read_response_body(self.session, url_item, response)
+
+    def test_body_is_written_and_hashed_while_streaming(self):
+        body = self.download('/informe')
+
+        expected = b'<html><body>/informe</body></html>'
+        self.assertIsNone(body.content)
+        self.assertEqual(os.path.dirname(body.file_path), get_session_storage_dir(self.session.id))
+        with open(body.file_path, 'rb') as f:
+            self.assertEqual(f.read(), expected)
+        self.assertEqual(body.file_hash, hashlib.sha256(expected).hexdigest())
+        self.assertEqual(body.size, len(expected))
+
+    def test_size_limit_without_content_length(self):
+        self.assertIsNone(self.download('/large'))
+        self.assertEqual(os.listdir(get_session_storage_dir(self.session.id)), [])
+
+
+class AsyncFetchEngineTests(SimpleTestCase):
+    '''Cada URL reservada termina en on_response, on_error o release'''
+
+    def setUp(self):
+        if not AIOHTTP_AVAILABLE:
+            self.skipTest('aiohttp no instalado')
+        self.base_url = start_test_server(self).url
+        self.responses, self.errors, self.released = {}, {}, []
+
+    def on_response(self, item, status_code, headers, body, response_time):
+        self.responses[item.id] = (status_code, body.content if body else None)
+
+    def on_error(self, item, error):
+        self.errors[item.id] = error
+
+    def run_engine(self, paths, **callbacks):
+        pending = [SimpleNamespace(id=i, url=self.base_url + path) for i, path in enumerate(paths)]
+
+        def claim(limit):
+            items = pending[:limit]
+            del pending[:limit]
+            return items
+
+        engine = AsyncFetchEngine(
+            claim=claim,
+            release=self.released.extend,
+            on_response=callbacks.get('on_response', self.on_response),
+            on_error=callbacks.get('on_error', self.on_error),
+            open_body=callbacks.get('open_body'),
+            should_continue=lambda: True,
+            concurrency=4, rate_limit=0, idle_timeout=0.2, poll_interval=0.05, time_budget=10,
+        )
+        return asyncio.run(engine.run())
+
+    def test_responses_reach_their_callbacks(self):
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir, ignore_errors=True)
+        files = {}
+
+        def on_response(item, status_code, headers, body, response_time):
+            self.on_response(item, status_code, headers, body, response_time)
+            if body is not None:
+                with open(body.file_path, 'rb') as f:
+                    files[item.id] = f.read()
+
+        stats = self.run_engine(
+            ['/a', '/missing', '/b'], on_response=on_response,
+            open_body=lambda item, headers: ResponseBody(keep_in_memory=True, storage_dir=storage_dir),
+        )
+
+        self.assertEqual((stats['fetched'], stats['errors'], stats['released']), (3, 0, 0))
+        self.assertTrue(stats['exhausted'])
+        self.assertEqual(self.responses, {
+            0: (200, b'<html><body>/a</body></html>'),
+            1: (404, None),
+            2: (200, b'<html><body>/b</body></html>'),
+        })
+        self.assertEqual(files, {0: self.responses[0][1], 2: self.responses[2][1]})
+
+    def test_unexpected_errors_do_not_strand_urls(self):
+        def on_response(item, *args):
+            raise ValueError(f'respuesta inválida {item.id}')
+
+        def on_error(item, error):
+            if item.id == 1:
+                raise RuntimeError('base de datos no disponible')
+            self.on_error(item, error)
+
+        stats = self.run_engine(['/a', '/b'], on_response=on_response, on_error=on_error)
+
+        self.assertEqual((stats['fetched'], stats['errors'], stats['released']), (0, 2, 1))
+        self.assertEqual(list(self.errors), [0])
+        self.assertIsInstance(self.errors[0], ValueError)
+        self.assertEqual([item.id for item in self.released], [1])
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'crawler': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+})
+@mock.patch('crawler.tasks.publish_session_progress')
+@mock.patch('crawler.tasks.get_frontier', return_value=None)
+@mock.patch('crawler.tasks.enqueue_urls')
+@mock.patch('crawler.politeness.redis_available', return_value=False)
+class RunFetchEngineTests(TransactionTestCase):
+    '''
+    Un ciclo del motor asíncrono sobre la base de datos. TransactionTestCase
+    porque los callbacks del motor corren en otro hilo.
+    '''
+
+    def setUp(self):
+        if not AIOHTTP_AVAILABLE:
+            self.skipTest('aiohttp no instalado')
+        patcher = mock.patch('crawler.politeness._local_state', _LocalState())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        base_url = start_test_server(self).url
+        user = User.objects.create_user(username='engine', password='engine')
+        self.session = CrawlSession.objects.create(
+            name='Motor', user=user, target_domain='127.0.0.1', target_url=base_url + '/',
+            status='running', rate_limit=100, max_depth=0, file_types=['pdf'], respect_robots_txt=False,
+        )
+        claimed_at = {'stale': timezone.now() - timedelta(hours=1), 'fresh': timezone.now(), 'pending': None}
+        self.items = {
+            name: URLQueue.objects.create(
+                session=self.session, url=f'{base_url}/{name}', depth=1, priority=1,
+                status='pending' if name == 'pending' else 'processing', claimed_at=when,
+            ).id
+            for name, when in claimed_at.items()
+        }
+
+    def run_engine(self):
+        engine = functools.partial(AsyncFetchEngine, idle_timeout=0.2, poll_interval=0.05)
+        with mock.patch('crawler.tasks.AsyncFetchEngine', engine), \
+                mock.patch.object(run_fetch_engine, 'apply_async'), \
+                mock.patch.object(complete_crawl_session, 'delay') as complete:
+            return run_fetch_engine(self.session.id), complete
+
+    def status(self, name):
+        return URLQueue.objects.get(id=self.items[name]).status
+
+    def test_slice_fetches_pending_and_stale_claims(self, *_):
+        result, complete = self.run_engine()
+
+        self.assertEqual((result['status'], result['fetched']), ('completed', 2))
+        complete.assert_called_once_with(self.session.id)
+        self.assertEqual(self.status('pending'), 'completed')
+        self.assertEqual(self.status('stale'), 'completed')
+        # Reservada hace poco por otro worker: no se toca ni se descarga dos veces
+        self.assertEqual(self.status('fresh'), 'processing')
+        self.assertEqual(CrawlSession.objects.get(id=self.session.id).total_urls_processed, 2)
+
+    def test_stopped_session_is_not_fetched(self, *_):
+        CrawlSession.objects.filter(id=self.session.id).update(status='stopped')
+
+        result, complete = self.run_engine()
+        self.assertEqual(result['status'], 'stopped')
+        with mock.patch('crawler.tasks.get_http_session') as http:
+            result = process_single_url(self.session.id, self.items['pending'])
+
+        self.assertEqual(result['status'], 'stopped')
+        http.assert_not_called()
+        complete.assert_not_called()
+        self.assertEqual(self.status('pending'), 'pending')
+        self.assertEqual(self.status('stale'), 'processing')
+
+
+@mock.patch('crawler.tasks.publish_session_progress')
+@mock.patch('crawler.tasks.enqueue_urls')
+class DiscoveredUrlsTests(TestCase):
+    '''Las URLs descubiertas se insertan una sola vez y se cuentan solo las nuevas'''
+
+    def setUp(self):
+        user = User.objects.create_user(username='discover', password='discover')
+        self.session = CrawlSession.objects.create(
+            name='Descubrimiento', user=user, target_domain='example.com', target_url='https://example.com/',
+            status='running', respect_robots_txt=False,
+        )
+
+    def test_returns_only_new_urls_and_counts_them(self, enqueue, _progress):
+        URLQueue.objects.create(session=self.session, url='https://example.com/a')
+
+        created = add_discovered_urls(
+            self.session, {'https://example.com/a', 'https://example.com/b', 'https://example.com/c'},
+            parent_url='https://example.com/', depth=1,
+        )
+
+        self.assertEqual(sorted(item.url for item in created), ['https://example.com/b', 'https://example.com/c'])
+        self.assertTrue(all(item.pk for item in created))
+        self.assertEqual(CrawlSession.objects.get(id=self.session.id).total_urls_discovered, 2)
+        self.assertEqual(enqueue.call_args.args[1], created)
+        self.assertEqual(add_discovered_urls(self.session, {'https://example.com/b'}), [])
+
+    def test_conflicting_insert_is_ignored(self, enqueue, _progress):
+        # Otro worker insertó la misma URL entre la consulta de conocidas y el insert
+        existing = URLQueue.objects.create(session=self.session, url='https://example.com/a', depth=2)
+
+        rows = insert_new_urls([
+            URLQueue(session=self.session, url=url, parent_url='https://example.com/', depth=1)
+            for url in ('https://example.com/a', 'https://example.com/b')
+        ])
+
+        self.assertEqual(
+            {row.url: row.pk for row in rows},
+            {'https://example.com/a': existing.pk, 'https://example.com/b': URLQueue.objects.get(url='https://example.com/b').pk},
+        )
+        self.assertEqual(URLQueue.objects.get(pk=existing.pk).depth, 2)
+
+
+@mock.patch('crawler.tasks.get_frontier', return_value=None)
+@mock.patch('crawler.tasks.enqueue_urls')
+class SitemapSeedingTests(TestCase):
+    '''La cola se procesa mientras los sitemaps la siembran, sin completar la sesión antes de tiempo'''
+
+    def setUp(self):
+        user = User.objects.create_user(username='seeding', password='seeding')
+        self.session = CrawlSession.objects.create(
+            name='Siembra', user=user, target_domain='example.com', target_url='https://example.com/',
+            respect_robots_txt=False,
+        )
+
+    def test_url_processing_starts_with_seeding(self, _enqueue, _frontier):
+        with mock.patch.object(process_sitemaps, 'delay') as seed, \
+                mock.patch('crawler.tasks.schedule_url_processing') as schedule:
+            start_crawl_session(self.session.id)
+
+        seed.assert_called_once_with(self.session.id)
+        schedule.assert_called_once_with(self.session.id)
+        self.assertTrue(CrawlSession.objects.get(id=self.session.id).is_seeding)
+
+    def test_session_completes_only_after_seeding(self, _enqueue, _frontier):
+        CrawlSession.objects.filter(id=self.session.id).update(
+            status='running', total_urls_processed=1, seeding_until=timezone.now() + timedelta(minutes=5)
+        )
+
+        with mock.patch.object(process_url_queue, 'apply_async'), \
+                mock.patch.object(complete_crawl_session, 'delay') as complete:
+            self.assertEqual(process_url_queue(self.session.id)['status'], 'waiting')
+            CrawlSession.objects.filter(id=self.session.id).update(seeding_until=None)
+            self.assertEqual(process_url_queue(self.session.id)['status'], 'completed')
+
+        complete.assert_called_once_with(self.session.id)
+
+
+class StreamingExportTests(TestCase):
+    '''Las exportaciones se generan por partes sin una consulta por URL'''
+
+    def setUp(self):
+        user = User.objects.create_user(username='streaming', password='streaming')
+        self.session = CrawlSession.objects.create(
+            name='Exportar por partes', user=user, target_domain='example.com', target_url='https://example.com/'
+        )
+
+    def add_results(self, start: int, count: int):
+        for i in range(start, start + count):
+            url_item = URLQueue.objects.create(session=self.session, url=f'https://example.com/{i}.pdf')
+            CrawlResult.objects.create(
+                session=self.session, url_queue_item=url_item, file_name=f'{i}.pdf', metadata={'author': f'Autor {i}'}
+            )
+
+    def export_csv(self):
+        with CaptureQueriesContext(connection) as queries:
+            lines = list(iter_csv_export(self.session, include_metadata=True))
+        return lines, len(queries)
+
+    def test_csv_queries_do_not_grow_with_the_number_of_urls(self):
+        self.add_results(0, 2)
+        _, few_queries = self.export_csv()
+
+        self.add_results(2, 20)
+        lines, many_queries = self.export_csv()
+
+        self.assertEqual(many_queries, few_queries)
+        self.assertEqual(len(lines), 23)
+        self.assertIn('Autor 21', lines[-1])
+
+    def test_header_is_sent_before_querying_urls(self):
+        self.add_results(0, 3)
+        parts = iter_csv_export(self.session, include_metadata=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            header = next(parts)
+        self.assertTrue(header.startswith('URL'))
+        self.assertEqual(len(queries), 0)
+
+    def test_streamed_json_is_a_valid_document(self):
+        self.add_results(0, 3)
+        response = streaming_export_response(
+            RequestFactory().get('/'), iter_json_export(self.session, include_metadata=True),
+            'application/json', 'export.json',
+        )
+
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(
+            sorted(item['url'] for item in data['urls_discovered']),
+            sorted(f'https://example.com/{i}.pdf' for i in range(3)),
+        )
+        self.assertEqual({item['metadata']['author'] for item in data['urls_discovered']}, {'Autor 0', 'Autor 1', 'Autor 2'})
+
+
+class ExportJobTests(TestCase):
+    '''Reutilización de exportaciones por fingerprint'''
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='export', password='export')
+        self.session = CrawlSession.objects.create(
+            name='Exportar', user=self.user, target_domain='example.com', target_url='https://example.com/'
+        )
+
+    def test_running_job_is_reused_until_it_exceeds_the_time_limit(self):
+        job, created = get_or_create_export_job(self.session, self.user, 'csv', {})
+        self.assertTrue(created)
+        ExportJob.objects.filter(id=job.id).update(status='running', started_at=timezone.now())
+
+        self.assertEqual(get_or_create_export_job(self.session, self.user, 'csv', {}), (job, False))
+
+        # Worker cortado por time_limit: el trabajo queda 'running' para siempre
+        ExportJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(hours=2))
+        new_job, created = get_or_create_export_job(self.session, self.user, 'csv', {})
+        self.assertTrue(created)
+        self.assertNotEqual(new_job.id, job.id)
+        self.assertEqual(ExportJob.objects.get(id=job.id).status, 'failed')
+
+    def test_pending_job_waits_for_the_queue_timeout(self):
+        job, _ = get_or_create_export_job(self.session, self.user, 'csv', {})
+
+        # Cola ocupada: más antiguo que EXPORT_TIME_LIMIT, pero sigue pendiente
+        ExportJob.objects.filter(id=job.id).update(created_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(get_or_create_export_job(self.session, self.user, 'csv', {}), (job, False))
+
+        ExportJob.objects.filter(id=job.id).update(created_at=timezone.now() - timedelta(hours=7))
+        new_job, created = get_or_create_export_job(self.session, self.user, 'csv', {})
+        self.assertTrue(created)
+        self.assertEqual(ExportJob.objects.get(id=job.id).status, 'failed')
+
+    def test_superseded_export_is_kept_while_it_may_be_downloading(self):
+        now = timezone.now()
+        old_job = ExportJob.objects.create(
+            session=self.session, export_format='csv', options={}, fingerprint='old',
+            status='completed', completed_at=now - timedelta(hours=3), last_accessed_at=now - timedelta(minutes=5),
+        )
+        job = ExportJob.objects.create(
+            session=self.session, export_format='csv', options={}, fingerprint='new',
+            status='completed', completed_at=now,
+        )
+
+        self.assertEqual(delete_superseded_exports(job), 0)
+        ExportJob.objects.filter(id=old_job.id).update(last_accessed_at=now - timedelta(hours=2))
+        self.assertEqual(cleanup_superseded_exports()['deleted'], 1)
+        self.assertEqual(list(ExportJob.objects.values_list('id', flat=True)), [job.id])
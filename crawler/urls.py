@@ -27,7 +27,11 @@ urlpatterns = [
     path('sesiones/<int:pk>/progreso/', views.session_progress, name='session_progress'),
 
     # Exportar datos
+    path('buscar/', views.search_content, name='search'),
     path('sesiones/<int:pk>/exportar/', views.export_results, name='export_results'),
+    path('sesiones/<int:pk>/exportaciones/<int:job_id>/', views.export_job_detail, name='export_job_detail'),
+    path('sesiones/<int:pk>/exportaciones/<int:job_id>/estado/', views.export_job_status, name='export_job_status'),
+    path('sesiones/<int:pk>/exportaciones/<int:job_id>/descargar/', views.export_download, name='export_download'),
 
     # Acciones en lote
     path('actiones_en_lote/', views.bulk_actions, name='bulk_actions'),
@@ -37,6 +41,7 @@ urlpatterns = [
 
     # API endpoints
     path('api/sesiones/<int:pk>/status/', views.api_session_status, name='api_session_status'),
+    path('api/sesiones/<int:pk>/ubicaciones/', views.api_session_locations, name='api_session_locations'),
     path('api/dashboard/estadisticas/', views.api_dashboard_stats, name='api_dashboard_stats'),
     path('api/result/<int:result_id>/details/', views.api_result_details, name='api_result_details'),
     path('api/result/<int:result_id>/download/', views.api_result_download, name='api_result_download'),
@@ -259,19 +259,15 @@ def extract_robots_txt2(domain: str) -> dict:
 #         return True  # En caso de error, permitir
 
 
-def should_respect_robots_txt(url: str, user_agent: str = "*") -> bool:
+def should_respect_robots_txt(url: str, session_id: int = None) -> bool:
     '''
-    Verifica si se puede acceder a una URL según robots.txt
+    Verifica si se puede acceder a una URL según robots.txt (caché compartido
+    por origen, ver crawler/robots.py)
     '''
-    try:
-        domain = get_domain_from_url(url)
-        robots_url = f"https://{domain}/robots.txt"
+    from .robots import is_allowed
 
-        rp = RobotFileParser()
-        rp.set_url(robots_url)
-        rp.read()
-
-        return rp.can_fetch(user_agent, url)
+    try:
+        return is_allowed(url, session_id)
 
     except Exception as e:
         # Si hay error, permitir el acceso por defecto
@@ -3,10 +3,12 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse, Http404, FileResponse
-from django.db.models import Q, Count, Avg
+from django.db.models import Q, Count, Avg, Sum
+from django.db.models.functions import Coalesce
 from django.core.paginator import Paginator
 from django.utils import timezone
 from django.utils.encoding import smart_str
+from django.urls import reverse
 from django.views.decorators.http import require_http_methods
 import mimetypes
 import json
@@ -14,9 +16,17 @@ import json
 from panel.decorators import allowed_users
 from panel.utils import info_header_user
 
-from .models import CrawlSession, URLQueue, CrawlResult, CrawlLog
+from .models import CrawlSession, URLQueue, CrawlResult, CrawlLog, ExportJob
 from .forms import CreateCrawlSessionForm, CrawlSessionFilterForm, BulkActionForm
-from .tasks import start_crawl_session, stop_crawl_session
+from .tasks import start_crawl_session, stop_crawl_session, run_export_job
+from .snapshot import get_session_snapshot
+from .content_store import load_content
+from .search import search_backend, search_results
+from .exporters import (
+    export_download_info, export_filename, get_or_create_export_job, iter_csv_basic_export,
+    iter_csv_export, iter_json_export, iter_ndjson_export, ranged_file_response,
+    streaming_export_response
+)
 
 
 @login_required(login_url='entrar')
@@ -35,13 +45,7 @@ def crawler_dashboard_old(request):
     # Estadísticas generales
     user_sessions = CrawlSession.objects.filter(user=request.user)
 
-    stats = {
-        'total_sessions': user_sessions.count(),
-        'active_sessions': user_sessions.filter(status__in=['pending', 'running', 'paused']).count(),
-        'completed_sessions': user_sessions.filter(status='completed').count(),
-        'total_files_found': sum(session.total_files_found for session in user_sessions),
-        'total_urls_processed': sum(session.total_urls_processed for session in user_sessions),
-    }
+    stats = user_sessions.summary()
 
     # Sesiones recientes
     recent_sessions = user_sessions.order_by('-created_at')[:5]
@@ -211,13 +215,8 @@ def session_detail(request, pk):
         return redirect('crawler:session_list')
 
     # Estadísticas de la sesión
-    url_stats = {
-        'pending': session.url_queue.filter(status='pending').count(),
-        'processing': session.url_queue.filter(status='processing').count(),
-        'completed': session.url_queue.filter(status='completed').count(),
-        'failed': session.url_queue.filter(status='failed').count(),
-        'skipped': session.url_queue.filter(status='skipped').count(),
-    }
+    snapshot = get_session_snapshot(session)
+    url_stats = snapshot['url_stats']
 
     # URLs recientes
     recent_urls = session.url_queue.order_by('-processed_at')[:50]
@@ -359,26 +358,9 @@ def session_progress(request, pk):
     if not request.user.groups.filter(name='admin').exists() and session.user != request.user:
         return JsonResponse({'error': 'Sin permisos'}, status=403)
 
-    # Obtener estadísticas actualizadas
-    url_stats = {
-        'pending': session.url_queue.filter(status='pending').count(),
-        'processing': session.url_queue.filter(status='processing').count(),
-        'completed': session.url_queue.filter(status='completed').count(),
-        'failed': session.url_queue.filter(status='failed').count(),
-        'skipped': session.url_queue.filter(status='skipped').count(),
-    }
-
-    progress_data = {
-        'status': session.status,
-        'status_display': session.get_status_display(),
-        'progress_percentage': session.progress_percentage,
-        'total_urls_discovered': session.total_urls_discovered,
-        'total_urls_processed': session.total_urls_processed,
-        'total_files_found': session.total_files_found,
-        'total_errors': session.total_errors,
-        'url_stats': url_stats,
-        'is_active': session.is_active,
-    }
+    # Estadísticas actualizadas (compartidas entre dashboards durante SNAPSHOT_TTL)
+    progress_data = get_session_snapshot(session)
+    url_stats = progress_data['url_stats']
 
     if request.headers.get('HX-Request'):
         # Respuesta para HTMX
@@ -416,18 +398,14 @@ def session_results(request, pk):
     if file_type:
         results = results.filter(url_queue_item__url_type=file_type)
 
-    if search:
-        results = results.filter(
-            Q(file_name__icontains=search) |
-            Q(url_queue_item__url__icontains=search) |
-            Q(title__icontains=search) |
-            Q(description__icontains=search)
-        )
+    results = results.select_related('url_queue_item').order_by('-created_at')
 
-    results = results.order_by('-created_at')
+    if search:
+        # Texto completo (incluye el contenido extraído), ordenado por relevancia
+        results = search_results(search, results)
 
     # Calcular estadísticas necesarias para la plantilla
-    all_results = session.results.all()  # Sin filtros para estadísticas generales
+    all_results = session.results.order_by()  # Sin filtros para estadísticas generales
     
     # Inicializar contadores con tipos esperados
     file_type_counts = {
@@ -452,22 +430,17 @@ def session_results(request, pk):
         'json': 0,
     }
     
-    total_size = 0
+    # Contar tipos de archivo reales (agrupado en la base de datos)
+    type_rows = all_results.values_list('url_queue_item__url_type').annotate(count=Count('id'))
+    total_results = 0
+    for url_type, count in type_rows:
+        url_type = url_type or 'unknown'
+        # Los tipos no esperados se agregan dinámicamente
+        file_type_counts[url_type] = file_type_counts.get(url_type, 0) + count
+        total_results += count
 
-    # Contar tipos de archivo reales
-    for result in all_results:
-        url_type = result.url_queue_item.url_type or 'unknown'
-        
-        # Si es un tipo esperado, incrementar contador
-        if url_type in file_type_counts:
-            file_type_counts[url_type] += 1
-        else:
-            # Para tipos no esperados, agregarlos dinámicamente
-            file_type_counts[url_type] = file_type_counts.get(url_type, 0) + 1
-        
-        # Sumar tamaños
-        if result.url_queue_item.file_size:
-            total_size += result.url_queue_item.file_size
+    # Sumar tamaños
+    total_size = all_results.aggregate(total=Coalesce(Sum('url_queue_item__file_size'), 0))['total']
 
     # Paginación
     paginator = Paginator(results, 200)
@@ -491,7 +464,7 @@ def session_results(request, pk):
         'available_file_types': available_file_types,
         'current_file_type': file_type,
         'current_search': search,
-        'total_results': all_results.count(),  # Total sin filtros
+        'total_results': total_results,  # Total sin filtros
         'file_type_counts': file_type_counts,  # VARIABLE FALTANTE AGREGADA
         'total_size': total_size,  # VARIABLE FALTANTE AGREGADA
         'is_paginated': page_obj.has_other_pages(),  # Para la paginación
@@ -500,6 +473,45 @@ def session_results(request, pk):
     return render(request, 'crawler/session_results.html', context)
 
 
+@login_required(login_url='entrar')
+@allowed_users(allowed_roles=['admin', 'crawler', 'viewer'])
+def search_content(request):
+    '''Búsqueda de texto completo en los archivos de todas las sesiones'''
+
+    query = request.GET.get('q', '').strip()
+    session_id = request.GET.get('session', '')
+
+    # Los admins buscan en todas las sesiones, otros solo en las suyas
+    results = CrawlResult.objects.select_related('url_queue_item', 'session')
+    sessions = CrawlSession.objects.all()
+    if not request.user.groups.filter(name='admin').exists():
+        results = results.filter(session__user=request.user)
+        sessions = sessions.filter(user=request.user)
+
+    if session_id.isdigit():
+        results = results.filter(session_id=session_id)
+
+    page_obj = None
+    if query:
+        paginator = Paginator(search_results(query, results.order_by('-created_at')), 20)
+        page_obj = paginator.get_page(request.GET.get('page'))
+
+    info_user = info_header_user(request)
+
+    context = {
+        'page': 'Búsqueda en archivos',
+        'icon': 'bi bi-search',
+        'info_user': info_user,
+        'query': query,
+        'current_session': session_id,
+        'sessions': sessions.order_by('-created_at').only('id', 'name'),
+        'page_obj': page_obj,
+        'search_enabled': search_backend() is not None,
+    }
+
+    return render(request, 'crawler/search.html', context)
+
+
 @login_required(login_url='entrar')
 @allowed_users(allowed_roles=['admin', 'crawler', 'viewer'])
 def session_logs(request, pk):
@@ -591,13 +603,7 @@ def session_urls(request, pk):
     urls = urls.order_by('-discovered_at')
     
     # Calcular estadísticas de URLs
-    url_stats = {
-        'completed': session.url_queue.filter(status='completed').count(),
-        'processing': session.url_queue.filter(status='processing').count(),
-        'pending': session.url_queue.filter(status='pending').count(),
-        'failed': session.url_queue.filter(status='failed').count(),
-        'skipped': session.url_queue.filter(status='skipped').count(),
-    }
+    url_stats = get_session_snapshot(session)['url_stats']
     
     # Paginación
     paginator = Paginator(urls, 100)
@@ -732,7 +738,7 @@ def bulk_actions(request):
         if action == 'pause':
             for session in sessions.filter(status='running'):
                 session.status = 'paused'
-                session.save()
+                session.save(update_fields=['status', 'updated_at'])
                 success_count += 1
 
         elif action == 'resume':
@@ -769,17 +775,8 @@ def crawler_stats(request):
     else:
         sessions = CrawlSession.objects.filter(user=request.user)
 
-    # Estadísticas generales
-    stats = {
-        'total_sessions': sessions.count(),
-        'active_sessions': sessions.filter(status__in=['pending', 'running', 'paused']).count(),
-        'completed_sessions': sessions.filter(status='completed').count(),
-        'failed_sessions': sessions.filter(status='failed').count(),
-        'total_urls_discovered': sum(s.total_urls_discovered for s in sessions),
-        'total_urls_processed': sum(s.total_urls_processed for s in sessions),
-        'total_files_found': sum(s.total_files_found for s in sessions),
-        'total_errors': sum(s.total_errors for s in sessions),
-    }
+    # Estadísticas generales (una sola consulta agregada)
+    stats = sessions.summary()
 
     # Estadísticas por estado
     status_stats = sessions.values('status').annotate(count=Count('id')).order_by('-count')
@@ -842,18 +839,42 @@ def export_results(request, pk):
     include_metadata = request.GET.get('include_metadata', '0') == '1'
     include_analysis = request.GET.get('include_analysis', '0') == '1'
     report_type = request.GET.get('report_type', 'standard')
-    
+    # stream=1: descarga directa generada al vuelo, sin archivo en el servidor
+    stream = request.GET.get('stream', '0') == '1'
+
+    if export_format not in dict(ExportJob.FORMAT_CHOICES):
+        messages.error(request, 'Formato de exportación no válido.')
+        return redirect('crawler:session_detail', pk=pk)
+
     try:
-        if export_format == 'csv':
-            return export_csv_with_metadata(session, include_metadata)
-        elif export_format == 'json':
-            return export_json_with_metadata(session, include_metadata, include_analysis)
+        if stream and export_format == 'csv':
+            return export_csv_with_metadata(session, include_metadata, request=request)
+        elif stream and export_format == 'json':
+            return export_json_with_metadata(session, include_metadata, include_analysis, request=request)
+        elif stream and export_format == 'ndjson':
+            return export_ndjson_with_metadata(session, include_metadata, request=request)
+
+        # Exportación en segundo plano: se reutiliza el archivo si la sesión no cambió
+        options = {'include_metadata': include_metadata}
+        if export_format == 'json':
+            options['include_analysis'] = include_analysis
         elif export_format == 'pdf':
-            return export_pdf_report(session, report_type, include_metadata)
-        else:
-            messages.error(request, 'Formato de exportación no válido.')
-            return redirect('crawler:session_detail', pk=pk)
-            
+            options['report_type'] = report_type
+
+        job, created = get_or_create_export_job(session, request.user, export_format, options)
+        if created:
+            try:
+                run_export_job.delay(job.id)
+            except Exception as e:
+                job.status = 'failed'
+                job.error_message = f'No se pudo encolar la exportación: {str(e)}'
+                job.save(update_fields=['status', 'error_message'])
+                raise
+
+        if job.status == 'completed':
+            return redirect('crawler:export_download', pk=pk, job_id=job.id)
+        return redirect('crawler:export_job_detail', pk=pk, job_id=job.id)
+
     except Exception as e:
         logger.error(f"Error exportando resultados: {str(e)}")
         messages.error(request, f"Error exportando: {str(e)}")
@@ -872,38 +893,75 @@ def export_results_old(request, pk):
         messages.error(request, 'No tienes permisos para exportar esta sesión.')
         return redirect('crawler:session_detail', pk=pk)
 
-    import csv
-    from django.http import HttpResponse
+    return streaming_export_response(
+        request,
+        iter_csv_basic_export(session),
+        content_type='text/csv; charset=utf-8',
+        filename=export_filename(session, 'crawl_results', 'csv'),
+    )
+
+
+def get_export_job_or_404(request, pk, job_id):
+    job = get_object_or_404(ExportJob.objects.select_related('session'), pk=job_id, session_id=pk)
+    if job.session.user != request.user and not request.user.groups.filter(name='admin').exists():
+        raise Http404('Exportación no encontrada')
+    return job
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="crawl_results_{session.id}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv"'
 
-    writer = csv.writer(response)
+@login_required(login_url='entrar')
+@allowed_users(allowed_roles=['admin', 'crawler', 'viewer'])
+def export_job_detail(request, pk, job_id):
+    '''Progreso de una exportación en segundo plano'''
 
-    # Headers
-    writer.writerow([
-        'URL', 'Tipo de Archivo', 'Nombre de Archivo', 'Tamaño (bytes)',
-        'Código HTTP', 'Tiempo de Respuesta (s)', 'Profundidad',
-        'URL Padre', 'Fecha Descubierta', 'Fecha Procesada', 'Estado'
-    ])
+    job = get_export_job_or_404(request, pk, job_id)
+    if job.status == 'completed':
+        return redirect('crawler:export_download', pk=pk, job_id=job.id)
 
-    # Datos
-    for url_item in session.url_queue.all():
-        writer.writerow([
-            url_item.url,
-            url_item.url_type,
-            getattr(url_item.results.first(), 'file_name', '') if url_item.results.exists() else '',
-            url_item.file_size or '',
-            url_item.http_status_code or '',
-            url_item.response_time or '',
-            url_item.depth,
-            url_item.parent_url,
-            url_item.discovered_at.strftime('%Y-%m-%d %H:%M:%S'),
-            url_item.processed_at.strftime('%Y-%m-%d %H:%M:%S') if url_item.processed_at else '',
-            url_item.get_status_display()
-        ])
+    context = {
+        'page': f'Exportación: {job.session.name}',
+        'icon': 'bi bi-download',
+        'info_user': info_header_user(request),
+        'session': job.session,
+        'job': job,
+    }
 
-    return response
+    return render(request, 'crawler/export_job.html', context)
+
+
+@login_required(login_url='entrar')
+@allowed_users(allowed_roles=['admin', 'crawler', 'viewer'])
+def export_job_status(request, pk, job_id):
+    '''API con el estado de una exportación (consultada por export_job.html)'''
+
+    job = get_export_job_or_404(request, pk, job_id)
+
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'rows_written': job.rows_written,
+        'total_rows': job.total_rows,
+        'error_message': job.error_message,
+        'download_url': reverse('crawler:export_download', args=[pk, job.id]),
+    })
+
+
+@login_required(login_url='entrar')
+@allowed_users(allowed_roles=['admin', 'crawler', 'viewer'])
+def export_download(request, pk, job_id):
+    '''Descarga el archivo de una exportación (admite Range para reanudar)'''
+
+    job = get_export_job_or_404(request, pk, job_id)
+    if job.status != 'completed' or not os.path.exists(job.file_path):
+        raise Http404('Archivo de exportación no disponible')
+
+    # El archivo no se elimina mientras la descarga pueda seguir en curso (EXPORT_DOWNLOAD_GRACE)
+    ExportJob.objects.filter(id=job.id).update(last_accessed_at=timezone.now())
+
+    filename, content_type = export_download_info(job)
+    return ranged_file_response(
+        request, job.file_path, content_type, job.file_name or filename, etag=f'"{job.fingerprint}"'
+    )
 
 
 # API Views para integración con JavaScript/HTMX
@@ -919,23 +977,38 @@ def api_session_status(request, pk):
     if not request.user.groups.filter(name='admin').exists() and session.user != request.user:
         return JsonResponse({'error': 'Sin permisos'}, status=403)
 
-    data = {
-        'id': session.id,
-        'status': session.status,
-        'status_display': session.get_status_display(),
-        'progress_percentage': session.progress_percentage,
-        'total_urls_discovered': session.total_urls_discovered,
-        'total_urls_processed': session.total_urls_processed,
-        'total_files_found': session.total_files_found,
-        'total_errors': session.total_errors,
-        'is_active': session.is_active,
-        'started_at': session.started_at.isoformat() if session.started_at else None,
-        'completed_at': session.completed_at.isoformat() if session.completed_at else None,
-    }
+    data = get_session_snapshot(session)
 
     return JsonResponse(data)
 
 
+@login_required(login_url='entrar')
+@allowed_users(allowed_roles=['admin', 'crawler', 'viewer'])
+def api_session_locations(request, pk):
+    '''API con las coordenadas GPS de una sesión, paginadas'''
+
+    session = get_object_or_404(CrawlSession, pk=pk)
+
+    # Verificar permisos
+    if not request.user.groups.filter(name='admin').exists() and session.user != request.user:
+        return JsonResponse({'error': 'Sin permisos'}, status=403)
+
+    from .metadata_utils import MAX_COORDINATES, get_session_aggregate, gps_points
+
+    points = list(gps_points(get_session_aggregate(session).data).items())
+    page_obj = Paginator(points, MAX_COORDINATES).get_page(request.GET.get('page'))
+
+    return JsonResponse({
+        'page': page_obj.number,
+        'num_pages': page_obj.paginator.num_pages,
+        'unique_locations': page_obj.paginator.count,
+        'coordinates': [
+            {'latitude': lat, 'longitude': lon, 'files': count}
+            for (lat, lon), count in page_obj.object_list
+        ],
+    })
+
+
 @login_required(login_url='entrar')
 @allowed_users(allowed_roles=['admin', 'crawler', 'viewer'])
 def api_dashboard_stats(request):
@@ -946,12 +1019,10 @@ def api_dashboard_stats(request):
     else:
         sessions = CrawlSession.objects.filter(user=request.user)
 
+    summary = sessions.summary()
     data = {
-        'total_sessions': sessions.count(),
-        'active_sessions': sessions.filter(status__in=['pending', 'running', 'paused']).count(),
-        'completed_sessions': sessions.filter(status='completed').count(),
-        'failed_sessions': sessions.filter(status='failed').count(),
-        'total_files_found': sum(s.total_files_found for s in sessions),
+        key: summary[key]
+        for key in ('total_sessions', 'active_sessions', 'completed_sessions', 'failed_sessions', 'total_files_found')
     }
 
     return JsonResponse(data)
@@ -989,6 +1060,9 @@ def file_metadata_detail(request, result_id):
                     metadata_categories['Otros'] = {}
                 metadata_categories['Otros'][key] = value
     
+    # Contenido completo: se descomprime solo en esta vista
+    full_content = load_content(result)
+
     info_user = info_header_user(request)
     
     context = {
@@ -999,9 +1073,9 @@ def file_metadata_detail(request, result_id):
         'metadata_categories': metadata_categories,
         'session': result.session,
         'url_item': result.url_queue_item,
-        'has_content': bool(result.full_content and result.full_content.strip()),
+        'has_content': bool(full_content.strip()),
         'content_length': result.content_length,
-        'full_content': result.full_content,
+        'full_content': full_content,
     }
     
     return render(request, 'crawler/file_metadata_detail.html', context)
@@ -1186,238 +1260,34 @@ def prepare_chart_data(analysis):
     return chart_data
 
 
-def export_csv_with_metadata(session, include_metadata=False):
-    '''Exporta resultados a CSV con opción de incluir metadatos'''
-    import csv
-    from django.http import HttpResponse
-    
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="crawl_results_{session.id}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-    
-    writer = csv.writer(response)
-    
-    # Headers básicos
-    headers = [
-        'URL', 'Referrer', 'Tipo_Archivo', 'Tamaño_Bytes', 'Estado_HTTP',
-        'Tiempo_Respuesta', 'Descubierto_En', 'Procesado_En', 'Profundidad'
-    ]
-    
-    # Headers adicionales si se incluyen metadatos
-    if include_metadata:
-        headers.extend([
-            'Tiene_Metadatos', 'Autor', 'Creador', 'Fecha_Creacion', 
-            'Fecha_Modificacion', 'Software_Usado', 'Titulo', 'Coordenadas_GPS',
-            'Hash_Archivo', 'Metadatos_JSON'
-        ])
-    
-    writer.writerow(headers)
-    
-    # Obtener resultados
-    url_items = URLQueue.objects.filter(session=session).select_related().order_by('discovered_at')
-    
-    for url_item in url_items:
-        row = [
-            url_item.url,
-            url_item.referrer or '',
-            url_item.url_type or '',
-            url_item.file_size or 0,
-            url_item.http_status_code or '',
-            url_item.response_time or 0,
-            url_item.discovered_at.isoformat() if url_item.discovered_at else '',
-            url_item.processed_at.isoformat() if url_item.processed_at else '',
-            url_item.depth
-        ]
-        
-        if include_metadata:
-            # Buscar resultado asociado con metadatos
-            try:
-                result = CrawlResult.objects.get(url_queue_item=url_item)
-                metadata = result.metadata or {}
-                
-                # Extraer campos específicos de metadatos
-                author = ''
-                creator = ''
-                creation_date = ''
-                modification_date = ''
-                software = ''
-                title = result.title or ''
-                gps_coords = ''
-                file_hash = result.file_hash or ''
-                
-                # Buscar en diferentes categorías de metadatos
-                for category in ['pdf_metadata', 'office_metadata', 'exif_metadata']:
-                    if category in metadata:
-                        cat_data = metadata[category]
-                        
-                        if not author and 'author' in cat_data:
-                            author = str(cat_data['author'])
-                        if not creator and 'creator' in cat_data:
-                            creator = str(cat_data['creator'])
-                        if not creation_date and 'creation_date' in cat_data:
-                            creation_date = str(cat_data['creation_date'])
-                        elif not creation_date and 'created' in cat_data:
-                            creation_date = str(cat_data['created'])
-                        if not modification_date and 'modification_date' in cat_data:
-                            modification_date = str(cat_data['modification_date'])
-                        elif not modification_date and 'modified' in cat_data:
-                            modification_date = str(cat_data['modified'])
-                        if not software and 'producer' in cat_data:
-                            software = str(cat_data['producer'])
-                        elif not software and 'software' in cat_data:
-                            software = str(cat_data['software'])
-                        
-                        # GPS específico para EXIF
-                        if category == 'exif_metadata' and 'gps_coordinates' in cat_data:
-                            gps_data = cat_data['gps_coordinates']
-                            if isinstance(gps_data, dict) and 'coordinates_string' in gps_data:
-                                gps_coords = gps_data['coordinates_string']
-                
-                row.extend([
-                    'Sí' if metadata else 'No',
-                    author,
-                    creator,
-                    creation_date,
-                    modification_date,
-                    software,
-                    title,
-                    gps_coords,
-                    file_hash,
-                    json.dumps(metadata, ensure_ascii=False) if metadata else ''
-                ])
-                
-            except CrawlResult.DoesNotExist:
-                row.extend(['No', '', '', '', '', '', '', '', '', ''])
-        
-        writer.writerow(row)
-    
-    return response
-
-
-def export_json_with_metadata(session, include_metadata=False, include_analysis=False):
-    '''Exporta resultados a JSON con metadatos y análisis'''
-    from django.http import JsonResponse
-    import json
-    
-    data = {
-        'session_info': {
-            'id': session.id,
-            'name': session.name,
-            'target_domain': session.target_domain,
-            'target_url': session.target_url,
-            'status': session.status,
-            'created_at': session.created_at.isoformat(),
-            'started_at': session.started_at.isoformat() if session.started_at else None,
-            'completed_at': session.completed_at.isoformat() if session.completed_at else None,
-            'total_urls_processed': session.total_urls_processed,
-            'total_files_found': session.total_files_found,
-        },
-        'urls_discovered': []
-    }
-    
-    # URLs descubiertas
-    url_items = URLQueue.objects.filter(session=session).select_related()
-    
-    for url_item in url_items:
-        url_data = {
-            'url': url_item.url,
-            'referrer': url_item.referrer,
-            'parent_url': url_item.parent_url,
-            'depth': url_item.depth,
-            'url_type': url_item.url_type,
-            'file_size': url_item.file_size,
-            'content_type': url_item.content_type,
-            'status': url_item.status,
-            'http_status_code': url_item.http_status_code,
-            'response_time': url_item.response_time,
-            'discovered_at': url_item.discovered_at.isoformat() if url_item.discovered_at else None,
-            'processed_at': url_item.processed_at.isoformat() if url_item.processed_at else None,
-            'has_metadata': url_item.has_metadata,
-        }
-        
-        # Incluir metadatos si se solicita
-        if include_metadata:
-            try:
-                result = CrawlResult.objects.get(url_queue_item=url_item)
-                url_data['metadata'] = result.metadata
-                url_data['file_hash'] = result.file_hash
-                url_data['file_path'] = result.file_path
-                url_data['title'] = result.title
-                url_data['description'] = result.description
-                url_data['keywords'] = result.keywords
-            except CrawlResult.DoesNotExist:
-                url_data['metadata'] = None
-        
-        data['urls_discovered'].append(url_data)
-    
-    # Incluir análisis avanzado si se solicita
-    if include_analysis:
-        try:
-            from .metadata_utils import analyze_session_metadata
-            analysis = analyze_session_metadata(session)
-            data['advanced_analysis'] = analysis
-        except Exception as e:
-            data['analysis_error'] = str(e)
-    
-    # Crear respuesta JSON
-    response = JsonResponse(data, json_dumps_params={'ensure_ascii': False, 'indent': 2})
-    response['Content-Disposition'] = f'attachment; filename="crawl_export_{session.id}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.json"'
-    
-    return response
-
-
-def export_pdf_report(session, report_type='standard', include_metadata=False):
-    '''Genera reporte PDF con metadatos'''
-    from django.http import HttpResponse
-    from django.template.loader import get_template
-    
-    try:
-        # Intentar importar librería PDF
-        from xhtml2pdf import pisa
-        pdf_available = True
-    except ImportError:
-        pdf_available = False
-    
-    if not pdf_available:
-        messages.error(request, 'Librería PDF no disponible. Instalar con: pip install xhtml2pdf')
-        return redirect('crawler:session_detail', pk=session.pk)
-    
-    # Preparar datos según tipo de reporte
-    context = {
-        'session': session,
-        'generated_at': timezone.now(),
-        'include_metadata': include_metadata,
-    }
-    
-    if report_type == 'security':
-        # Reporte de seguridad con análisis de riesgos
-        try:
-            from .metadata_utils import analyze_session_metadata
-            analysis = analyze_session_metadata(session)
-            context['analysis'] = analysis
-            template_name = 'crawler/reports/security_report.html'
-        except Exception as e:
-            context['analysis_error'] = str(e)
-            template_name = 'crawler/reports/basic_report.html'
-    else:
-        # Reporte estándar
-        results = CrawlResult.objects.filter(session=session).select_related('url_queue_item')
-        context['results'] = results
-        template_name = 'crawler/reports/standard_report.html'
-    
-    # Generar PDF
-    template = get_template(template_name)
-    html = template.render(context)
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="crawl_report_{session.id}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-    
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    
-    if pisa_status.err:
-        return HttpResponse('Error generando PDF', status=500)
-    
-    return response
-
+def export_csv_with_metadata(session, include_metadata=False, request=None):
+    '''Exporta resultados a CSV con opción de incluir metadatos (en streaming)'''
+    return streaming_export_response(
+        request,
+        iter_csv_export(session, include_metadata),
+        content_type='text/csv; charset=utf-8',
+        filename=export_filename(session, 'crawl_results', 'csv'),
+    )
+
+
+def export_json_with_metadata(session, include_metadata=False, include_analysis=False, request=None):
+    '''Exporta resultados a JSON con metadatos y análisis (en streaming)'''
+    return streaming_export_response(
+        request,
+        iter_json_export(session, include_metadata, include_analysis),
+        content_type='application/json; charset=utf-8',
+        filename=export_filename(session, 'crawl_export', 'json'),
+    )
+
+
+def export_ndjson_with_metadata(session, include_metadata=False, request=None):
+    '''Exporta resultados como JSON por líneas (una URL por línea)'''
+    return streaming_export_response(
+        request,
+        iter_ndjson_export(session, include_metadata),
+        content_type='application/x-ndjson; charset=utf-8',
+        filename=export_filename(session, 'crawl_export', 'ndjson'),
+    )
 
 
 @login_required(login_url='entrar')
@@ -125,13 +125,7 @@ def index(request, *args, **kwargs):
     # Estadísticas generales
     user_sessions = CrawlSession.objects.filter(user=request.user)
 
-    stats = {
-        'total_sessions': user_sessions.count(),
-        'active_sessions': user_sessions.filter(status__in=['pending', 'running', 'paused']).count(),
-        'completed_sessions': user_sessions.filter(status='completed').count(),
-        'total_files_found': sum(session.total_files_found for session in user_sessions),
-        'total_urls_processed': sum(session.total_urls_processed for session in user_sessions),
-    }
+    stats = user_sessions.summary()
 
     # Sesiones recientes
     recent_sessions = user_sessions.order_by('-created_at')[:5]